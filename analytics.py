@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+TOP_STREAKS = 10
+WORST_GROUPS = 3
+
+
+@dataclass(frozen=True)
+class CadetAttendance:
+    tg_user_id: int
+    full_name: str
+    expected: int
+    checked: int
+    longest_missed: int  # самая длинная серия пропущенных окон подряд
+
+    @property
+    def rate(self) -> float:
+        return rate(self.checked, self.expected)
+
+
+def rate(checked: int, expected: int) -> float:
+    return checked / expected if expected else 1.0
+
+
+def period(last_date: str, days: int) -> tuple[str, str]:
+    """(date_from, date_to): последние days дней, заканчивая last_date."""
+    end = date.fromisoformat(last_date)
+    return (end - timedelta(days=days - 1)).isoformat(), last_date
+
+
+def cadet_attendance(rows: list[tuple[int, str, str, int, int]]) -> list[CadetAttendance]:
+    """
+    Свёртка строк Database.cadet_rollups по курсантам. Окна идут подряд
+    в порядке дат, внутри дня — в порядке битов; учитываются только окна,
+    положенные курсанту по расписанию. Дни без доклада в итогах
+    отсутствуют и серию не рвут.
+    """
+    result: list[CadetAttendance] = []
+    current = None
+    expected = checked = run = longest = 0
+    name = ""
+
+    def flush() -> None:
+        if current is not None:
+            result.append(CadetAttendance(current, name, expected, checked, longest))
+
+    for tg_user_id, full_name, _, mask, expected_mask in rows:
+        if tg_user_id != current:
+            flush()
+            current, name = tg_user_id, full_name
+            expected = checked = run = longest = 0
+        bit = 1
+        while bit <= expected_mask:
+            if expected_mask & bit:
+                expected += 1
+                if mask & bit:
+                    checked += 1
+                    run = 0
+                else:
+                    run += 1
+                    longest = max(longest, run)
+            bit <<= 1
+    flush()
+    return result
+
+
+def worst_groups(groups: list[tuple[str, int, int]], n: int = WORST_GROUPS) -> list[tuple[str, int, int]]:
+    return sorted(groups, key=lambda g: (rate(g[2], g[1]), g[0]))[:n]
+
+
+def longest_streaks(
+    by_group: dict[str, list[CadetAttendance]], n: int = TOP_STREAKS
+) -> list[tuple[str, CadetAttendance]]:
+    items = [(g, c) for g, cadets in by_group.items() for c in cadets if c.longest_missed > 0]
+    items.sort(key=lambda item: (-item[1].longest_missed, item[0], item[1].full_name))
+    return items[:n]
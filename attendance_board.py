@@ -0,0 +1,79 @@
+class AttendanceBoard:
+    """
+    Доска открытого окна доклада: по каждой группе — сколько активных
+    курсантов и кто из них ещё не отметился. Строится один раз при открытии
+    окна, дальше обновляется на каждую успешную отметку, поэтому «Не доложили»
+    и счётчики текущего окна не ходят в базу.
+    """
+
+    def __init__(self, date_str: str, slot: str):
+        self.date_str = date_str
+        self.slot = slot
+        self._group_of: dict[int, str] = {}
+        self._total: dict[str, int] = {}
+        self._missing: dict[str, dict[int, tuple[str, str | None, str | None]]] = {}
+
+    def matches(self, date_str: str, slot: str) -> bool:
+        return self.date_str == date_str and self.slot == slot
+
+    def add(self, cadet: dict, checked: bool) -> None:
+        tg_user_id = cadet["tg_user_id"]
+        group_code = cadet["group_code"]
+        self._group_of[tg_user_id] = group_code
+        self._total[group_code] = self._total.get(group_code, 0) + 1
+        missing = self._missing.setdefault(group_code, {})
+        if not checked:
+            missing[tg_user_id] = (cadet["full_name"], cadet["username"], cadet["phone"])
+
+    def mark_checked(self, tg_user_id: int) -> None:
+        group_code = self._group_of.get(tg_user_id)
+        if group_code is not None:
+            self._missing[group_code].pop(tg_user_id, None)
+
+    def upsert_cadet(self, cadet: dict) -> None:
+        """
+        Регистрация/перерегистрация посреди окна: курсант попадает (или
+        переезжает) в свою группу с сохранением факта отметки.
+        """
+        tg_user_id = cadet["tg_user_id"]
+        old_group = self._group_of.get(tg_user_id)
+        checked = old_group is not None and tg_user_id not in self._missing[old_group]
+        if old_group is not None:
+            self._total[old_group] -= 1
+            self._missing[old_group].pop(tg_user_id, None)
+            del self._group_of[tg_user_id]
+        if cadet["is_active"] == 1:
+            self.add(cadet, checked)
+
+    def update_contact(self, tg_user_id: int, **fields) -> None:
+        group_code = self._group_of.get(tg_user_id)
+        if group_code is None:
+            return
+        entry = self._missing[group_code].get(tg_user_id)
+        if entry is None:
+            return
+        name, username, phone = entry
+        self._missing[group_code][tg_user_id] = (
+            name,
+            fields.get("username", username),
+            fields.get("phone", phone),
+        )
+
+    def total(self, group_code: str) -> int:
+        return self._total.get(group_code, 0)
+
+    def checked(self, group_code: str) -> int:
+        return self.total(group_code) - len(self._missing.get(group_code, ()))
+
+    def missing(self, group_code: str) -> list[tuple[str, str | None, str | None]]:
+        return [row[:3] for row in self.missing_rows(group_code)]
+
+    def missing_rows(self, group_code: str) -> list[tuple[str, str | None, str | None, int]]:
+        """(full_name, username, phone, tg_user_id) по ФИО и tg_user_id."""
+        return sorted(
+            ((*row, tg_user_id) for tg_user_id, row in self._missing.get(group_code, {}).items()),
+            key=lambda r: (r[0], r[3]),
+        )
+
+    def groups(self, *, exclude_group_code: str | None = None) -> list[str]:
+        return sorted(g for g, n in self._total.items() if n > 0 and g != exclude_group_code)
@@ -0,0 +1,316 @@
+"""
+Микробенчмарки слоя базы: время методов Database на синтетических курсах
+разного размера (число курсантов x число дней истории отметок). Набор
+повторяет _workload из query_plans.py; архив (archive_checkins_batch и
+запросы через checkins_history) здесь не меряется — у временной базы нет
+файла архива, его планы проверяет _archive_workload там же.
+
+Для каждого сценария генерируется временная база: курсанты по DEFAULT_CADET_GROUPS
+(и немного офицеров), за каждый день истории оба окна с долей отметившихся
+--density. Запросы по прошлому окну идут через SQL, по текущему — ещё и
+через открытую доску (метки «[board]»).
+
+    python -m bench.bench_db --cadets 1000,10000,100000 --days 10,100,1000 --out bench_db.json
+
+Сценарии, в которых отметок больше --max-checkins, пропускаются.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from db import Database
+from keyboards import DEFAULT_CADET_GROUPS, OFFICERS_GROUP_CODE
+from reporting import build_missing_report_all
+from time_utils import SLOT_MORNING, SLOT_EVENING
+
+BASE_DATE = date(2024, 1, 1)
+OFFICER_EVERY = 50
+FSM_KEYS = 1000
+OUTBOX_ROWS = 100
+
+
+def _summary(samples: list[float], wall_s: float) -> dict:
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "ops_per_s": len(samples) / wall_s if wall_s > 0 else 0.0,
+    }
+
+
+def _day(d: int) -> str:
+    return (BASE_DATE + timedelta(days=d)).isoformat()
+
+
+def _group(i: int) -> str:
+    if i % OFFICER_EVERY == 0:
+        return OFFICERS_GROUP_CODE
+    return DEFAULT_CADET_GROUPS[i % len(DEFAULT_CADET_GROUPS)]
+
+
+def generate(path: str, cadets: int, days: int, density: float, seed: int) -> int:
+    """Заполняет базу со схемой Database. Возвращает число отметок."""
+    rnd = random.Random(seed)
+    created_at = datetime.now(timezone.utc).isoformat()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executemany(
+        "INSERT INTO cadets(tg_user_id, group_code, full_name, username, phone, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, _group(i), f"Курсант {i:06d} И. И.", f"cadet{i}", f"+7900{i:07d}", created_at)
+            for i in range(1, cadets + 1)
+        ),
+    )
+
+    def checkins():
+        for d in range(days):
+            for slot in (SLOT_MORNING, SLOT_EVENING):
+                for i in range(1, cadets + 1):
+                    if rnd.random() < density:
+                        yield i, _day(d), slot, created_at
+
+    conn.executemany(
+        "INSERT INTO checkins(tg_user_id, date, slot, created_at) VALUES (?, ?, ?, ?)",
+        checkins(),
+    )
+    conn.commit()
+    (n,) = conn.execute("SELECT COUNT(*) FROM checkins").fetchone()
+    conn.close()
+    return n
+
+
+async def _time(fn, iters: int) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for i in range(iters):
+        t0 = time.perf_counter()
+        await fn(i)
+        samples.append(time.perf_counter() - t0)
+    return _summary(samples, time.perf_counter() - started)
+
+
+async def _time_concurrent(fn, iters: int, concurrency: int) -> dict:
+    samples = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            await fn(i)
+            samples.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(iters)))
+    return _summary(samples, time.perf_counter() - started)
+
+
+async def _drain(rows) -> None:
+    async for _ in rows:
+        pass
+
+
+async def _outbox_cycle(db: Database, i: int, date_str: str) -> None:
+    await db.enqueue_outbox([(f"bench{i}", date_str, SLOT_MORNING, n, "bench", None) for n in range(OUTBOX_ROWS)])
+    claimed = await db.claim_outbox(OUTBOX_ROWS, 0)
+    await db.finish_outbox([row[0] for row in claimed], [], [])
+
+
+async def run_scenario(db: Database, cadets: int, days: int, args) -> dict:
+    rnd = random.Random(args.seed)
+    iters = args.iters
+    group = DEFAULT_CADET_GROUPS[0]
+    past = _day(days // 2)
+    today = _day(days)
+    ids = list(range(1, cadets + 1))
+    next_id = cadets + 1
+
+    def new_id() -> int:
+        nonlocal next_id
+        next_id += 1
+        return next_id
+
+    report = await db.attendance_report(past, SLOT_MORNING, exclude_group_code=OFFICERS_GROUP_CODE)
+    snapshot = (report, build_missing_report_all([m[:4] for m in report.missing]))
+    await db.save_report_snapshots(past, SLOT_MORNING, {"*": snapshot})
+    await db.fsm_save_many(
+        [(f"fsm:{k}", "Reg:name", json.dumps({"group_code": group}), time.time()) for k in range(FSM_KEYS)],
+        [],
+    )
+    week_ago = _day(max(0, days // 2 - 6))
+    for d in range(max(0, days // 2 - 6), days // 2):
+        await db.rollup_day(_day(d), exclude_group_code=OFFICERS_GROUP_CODE)
+
+    ops = {
+        "get_cadet": lambda i: db.get_cadet(rnd.choice(ids)),
+        "get_cadets[50]": lambda i: db.get_cadets(rnd.sample(ids, min(50, cadets))),
+        "count_registered_in_group": lambda i: db.count_registered_in_group(group),
+        "count_registered_course": lambda i: db.count_registered_course(exclude_group_code=OFFICERS_GROUP_CODE),
+        "count_registered_by_group_course": lambda i: db.count_registered_by_group_course(
+            exclude_group_code=OFFICERS_GROUP_CODE
+        ),
+        "list_registered_in_group": lambda i: db.list_registered_in_group(group),
+        "registered_page[after]": lambda i: db.registered_page(group, after=rnd.choice(ids)),
+        "registered_page[before]": lambda i: db.registered_page(group, before=rnd.choice(ids)),
+        "get_user_tenant": lambda i: db.get_user_tenant(rnd.choice(ids)),
+        "list_groups": lambda i: db.list_groups(),
+        "count_group_total": lambda i: db.count_group_total(group),
+        "count_course_total": lambda i: db.count_course_total(exclude_group_code=OFFICERS_GROUP_CODE),
+        "count_group_checked": lambda i: db.count_group_checked(group, past, SLOT_MORNING),
+        "count_course_checked": lambda i: db.count_course_checked(
+            exclude_group_code=OFFICERS_GROUP_CODE, date_str=past, slot=SLOT_MORNING
+        ),
+        "missing_by_group": lambda i: db.missing_by_group(group, past, SLOT_MORNING),
+        "missing_all_groups": lambda i: db.missing_all_groups(past, SLOT_MORNING, OFFICERS_GROUP_CODE),
+        "missing_user_ids": lambda i: db.missing_user_ids(past, SLOT_MORNING, exclude_group_code=OFFICERS_GROUP_CODE),
+        "attendance_report[group]": lambda i: db.attendance_report(past, SLOT_MORNING, group_code=group),
+        "attendance_report[course]": lambda i: db.attendance_report(
+            past, SLOT_MORNING, exclude_group_code=OFFICERS_GROUP_CODE
+        ),
+        "iter_attendance[group,day]": lambda i: _drain(db.iter_attendance(past, past, group_code=group)),
+        "rollup_day": lambda i: db.rollup_day(past, exclude_group_code=OFFICERS_GROUP_CODE),
+        "rollup_pending_dates": lambda i: db.rollup_pending_dates(today),
+        "rollup_last_date": lambda i: db.rollup_last_date(),
+        "group_rollups[7d]": lambda i: db.group_rollups(week_ago, past, exclude_group_code=OFFICERS_GROUP_CODE),
+        "cadet_rollups[7d]": lambda i: db.cadet_rollups(group, week_ago, past),
+        "get_report_snapshot": lambda i: db.get_report_snapshot(past, SLOT_MORNING, "*"),
+        "save_report_snapshots": lambda i: db.save_report_snapshots(_day(days + 1 + i), SLOT_MORNING, {"*": snapshot}),
+        "fsm_get": lambda i: db.fsm_get(f"fsm:{rnd.randrange(FSM_KEYS)}"),
+        "fsm_save_many[10]": lambda i: db.fsm_save_many(
+            [(f"fsm:{rnd.randrange(FSM_KEYS)}", "Reg:name", "{}", time.time()) for _ in range(10)], []
+        ),
+        "fsm_delete_expired": lambda i: db.fsm_delete_expired(0),
+        "try_acquire_lease": lambda i: db.try_acquire_lease("bench", "bench", 30),
+        "release_lease": lambda i: db.release_lease("bench", "bench"),
+        f"enqueue+claim+finish_outbox[{OUTBOX_ROWS}]": lambda i: _outbox_cycle(db, i, today),
+        "purge_outbox": lambda i: db.purge_outbox(0),
+        "update_username": lambda i: db.update_username(rnd.choice(ids), f"user{i}"),
+        "update_phone": lambda i: db.update_phone(rnd.choice(ids), f"+7911{i:07d}"),
+        "upsert_cadet": lambda i: db.upsert_cadet(new_id(), group, f"Новый {i} И. И.", None),
+        "add_checkin": lambda i: db.add_checkin(ids[i % cadets], today, SLOT_MORNING),
+    }
+
+    results = {}
+    for name, fn in ops.items():
+        results[name] = await _time(fn, iters)
+
+    results["iter_attendance[course,7d]"] = await _time(
+        lambda i: _drain(db.iter_attendance(week_ago, past, exclude_group_code=OFFICERS_GROUP_CODE)),
+        max(1, iters // 10),
+    )
+    results["open_board"] = await _time(lambda i: db.open_board(today, SLOT_MORNING), max(1, iters // 10))
+
+    board_ops = {
+        "count_group_checked[board]": lambda i: db.count_group_checked(group, today, SLOT_MORNING),
+        "count_course_checked[board]": lambda i: db.count_course_checked(
+            exclude_group_code=OFFICERS_GROUP_CODE, date_str=today, slot=SLOT_MORNING
+        ),
+        "missing_by_group[board]": lambda i: db.missing_by_group(group, today, SLOT_MORNING),
+        "missing_all_groups[board]": lambda i: db.missing_all_groups(today, SLOT_MORNING, OFFICERS_GROUP_CODE),
+        "attendance_report[course,board]": lambda i: db.attendance_report(
+            today, SLOT_MORNING, exclude_group_code=OFFICERS_GROUP_CODE
+        ),
+        "add_checkin[board]": lambda i: db.add_checkin(ids[(iters + i) % cadets], today, SLOT_MORNING),
+    }
+    for name, fn in board_ops.items():
+        results[name] = await _time(fn, iters)
+
+    # Утренний пик: много одновременных отметок в одно окно
+    results[f"add_checkin[x{args.concurrency}]"] = await _time_concurrent(
+        lambda i: db.add_checkin(ids[i % cadets], today, SLOT_EVENING),
+        min(cadets, iters * args.concurrency),
+        args.concurrency,
+    )
+    # То же одним запросом с проверкой регистрации (слот без доски)
+    results[f"checkin[x{args.concurrency}]"] = await _time_concurrent(
+        lambda i: db.checkin(ids[i % cadets], today, "bench", exclude_group_code=OFFICERS_GROUP_CODE),
+        min(cadets, iters * args.concurrency),
+        args.concurrency,
+    )
+    db.close_board()
+    return results
+
+
+def _ints(raw: str) -> list[int]:
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cadets", default="1000,10000,100000")
+    parser.add_argument("--days", default="10,100,1000")
+    parser.add_argument("--density", type=float, default=0.9)
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-checkins", type=int, default=5_000_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--checkin-batch-ms", type=float, default=0)
+    parser.add_argument("--roster-cache-max", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="")
+    args = parser.parse_args()
+
+    scenarios = []
+    for cadets in _ints(args.cadets):
+        for days in _ints(args.days):
+            expected = int(cadets * days * 2 * args.density)
+            if expected > args.max_checkins:
+                print(f"skip cadets={cadets} days={days}: ~{expected} checkins > --max-checkins")
+                scenarios.append({"cadets": cadets, "days": days, "skipped": True})
+                continue
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.sqlite3")
+                schema = Database(path)
+                await schema.init()
+                await schema.close()
+
+                t0 = time.perf_counter()
+                checkins = generate(path, cadets, days, args.density, args.seed)
+                gen_s = time.perf_counter() - t0
+
+                db = Database(
+                    path,
+                    readers=args.readers,
+                    checkin_batch_ms=args.checkin_batch_ms,
+                    roster_cache_max=args.roster_cache_max,
+                )
+                await db.init()
+                try:
+                    ops = await run_scenario(db, cadets, days, args)
+                finally:
+                    await db.close()
+
+            scenarios.append({"cadets": cadets, "days": days, "checkins": checkins, "generate_s": gen_s, "ops": ops})
+            print(f"cadets={cadets} days={days} checkins={checkins} (generated in {gen_s:.1f}s)")
+            for name, r in ops.items():
+                print(
+                    f"  {name:34s} p50={r['p50_ms']:8.3f}ms p99={r['p99_ms']:8.3f}ms "
+                    f"{r['ops_per_s']:10.1f} ops/s"
+                )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "params": {k: v for k, v in vars(args).items() if k != "out"},
+                    "scenarios": scenarios,
+                },
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
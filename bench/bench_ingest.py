@@ -0,0 +1,193 @@
+"""
+Сравнение сквозной задержки отметки («✅ Отметиться» -> «Доклад принят.»)
+при приёме апдейтов поллингом и вебхуком.
+
+Всё локально: поднимается фейковый Bot API (getUpdates/sendMessage),
+бот работает на временной базе с зарегистрированными курсантами,
+окно доклада принудительно считается открытым.
+
+    python -m bench.bench_ingest --n 300 --out bench_ingest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from aiohttp import web, ClientSession
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import handlers_checkin
+from config import Config
+from db import Database
+from keyboards import BTN_CHECKIN
+from main import build_dispatcher, build_webhook_app
+from tenants import open_tenants
+from time_utils import SLOT_MORNING
+
+TOKEN = "42:bench"
+SECRET = "bench-secret"
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+USER_ID_BASE = 10_000
+
+
+class FakeBotApi:
+    """Минимальный Bot API: отдаёт апдейты в getUpdates и ловит sendMessage."""
+
+    def __init__(self):
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.replies: dict[int, asyncio.Future] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+
+        if method == "getUpdates":
+            timeout = float(data.get("timeout") or 0)
+            try:
+                first = await asyncio.wait_for(self.updates.get(), timeout or 0.01)
+            except asyncio.TimeoutError:
+                return web.json_response({"ok": True, "result": []})
+            result = [first]
+            while not self.updates.empty():
+                result.append(self.updates.get_nowait())
+            return web.json_response({"ok": True, "result": result})
+
+        if method == "getMe":
+            return web.json_response(
+                {"ok": True, "result": {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}}
+            )
+
+        if method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            fut = self.replies.pop(chat_id, None)
+            if fut is not None and not fut.done():
+                fut.set_result(data["text"])
+            return web.json_response({"ok": True, "result": _message(chat_id, data["text"])})
+
+        return web.json_response({"ok": True, "result": True})
+
+
+def _message(chat_id: int, text: str, message_id: int = 1) -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+
+
+def _update(update_id: int, user_id: int) -> dict:
+    return {"update_id": update_id, "message": _message(user_id, BTN_CHECKIN, update_id)}
+
+
+def _summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+    }
+
+
+def _bot() -> Bot:
+    return Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}")))
+
+
+async def bench_polling(api: FakeBotApi, dp: Dispatcher, n: int, user_base: int) -> list[float]:
+    bot = _bot()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.2)
+
+    samples = []
+    loop = asyncio.get_running_loop()
+    for i in range(n):
+        user_id = user_base + i
+        fut = loop.create_future()
+        api.replies[user_id] = fut
+        t0 = time.perf_counter()
+        api.updates.put_nowait(_update(i + 1, user_id))
+        await fut
+        samples.append(time.perf_counter() - t0)
+
+    await dp.stop_polling()
+    await polling
+    return samples
+
+
+async def bench_webhook(dp: Dispatcher, config: Config, n: int, user_base: int) -> list[float]:
+    bot = _bot()
+    runner = web.AppRunner(build_webhook_app(dp, bot, config))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", WEBHOOK_PORT).start()
+
+    samples = []
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}{config.webhook_path}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    async with ClientSession() as http:
+        for i in range(n):
+            t0 = time.perf_counter()
+            async with http.post(url, json=_update(i + 1, user_base + i), headers=headers) as resp:
+                # Ответ хэндлера приходит в теле (multipart): method=sendMessage
+                body = await resp.text()
+            samples.append(time.perf_counter() - t0)
+            assert "sendMessage" in body, body
+
+    await runner.cleanup()
+    return samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--out", default="")
+    args = parser.parse_args()
+
+    # Окно доклада открыто всегда, иначе хэндлер ответит «Не время доклада»
+    handlers_checkin.current_slot = lambda dt, group_code=None: SLOT_MORNING
+
+    api = FakeBotApi()
+    api_runner = web.AppRunner(api.app())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", API_PORT).start()
+
+    config = Config(bot_token=TOKEN, admin_ids=set(), officer_ids=set(), webhook_secret=SECRET)
+
+    # Роутеры — синглтоны модулей, поэтому диспетчер один на оба режима;
+    # у каждого режима свои курсанты, чтобы все отметки были первыми.
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.sqlite3"))
+        await db.init()
+        for i in range(2 * args.n):
+            await db.upsert_cadet(USER_ID_BASE + i, "841/11", f"Курсант {i} И. И.", None)
+        dp = build_dispatcher(db, await open_tenants(db, Database), config)
+
+        results["polling"] = _summary(await bench_polling(api, dp, args.n, USER_ID_BASE))
+        results["webhook"] = _summary(await bench_webhook(dp, config, args.n, USER_ID_BASE + args.n))
+        await db.close()
+
+    await api_runner.cleanup()
+
+    for mode, r in results.items():
+        print(f"{mode:8s} n={r['n']} p50={r['p50_ms']:.2f}ms p99={r['p99_ms']:.2f}ms mean={r['mean_ms']:.2f}ms")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from metrics import TELEGRAM_SENDS
+
+log = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+GLOBAL_RATE = 30.0
+PER_CHAT_INTERVAL_S = 1.0
+
+# Исходы одной попытки отправки (они же метки TELEGRAM_SENDS)
+SEND_OK = "ok"
+SEND_RETRY_AFTER = "retry_after"
+SEND_TRANSIENT = "transient_error"
+SEND_REJECTED = "rejected"
+
+
+class TokenBucket:
+    """
+    Общий для всех рассылок лимит скорости. pause() блокирует выдачу
+    токенов целиком — так RetryAfter от Telegram тормозит всех отправителей,
+    а не только тот запрос, который его получил.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else rate
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class Broadcaster:
+    """
+    Отправка сообщений из фоновых задач: общий token bucket на бота и
+    не чаще PER_CHAT_INTERVAL_S в один чат. Повторы и параллелизм — у Outbox.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        rate: float = GLOBAL_RATE,
+        per_chat_interval: float = PER_CHAT_INTERVAL_S,
+    ):
+        self.bot = bot
+        self._bucket = TokenBucket(rate)
+        self._per_chat_interval = per_chat_interval
+        self._chat_next: dict[int, float] = {}
+
+    async def _wait_chat(self, chat_id: int) -> None:
+        # Слот в чат резервируется синхронно, поэтому параллельные отправки
+        # в один чат выстраиваются с шагом per_chat_interval.
+        now = time.monotonic()
+        ready_at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = ready_at + self._per_chat_interval
+
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def try_send(self, chat_id: int, text: str, reply_markup=None) -> tuple[str, str | None]:
+        """
+        Одна попытка с соблюдением лимитов. Возвращает (исход, ошибка):
+        исход — SEND_OK, SEND_RETRY_AFTER и SEND_TRANSIENT (повторить позже)
+        или SEND_REJECTED (повтор не поможет).
+        """
+        await self._wait_chat(chat_id)
+        await self._bucket.acquire()
+        try:
+            await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+        except TelegramRetryAfter as e:
+            self._bucket.pause(e.retry_after)
+            outcome, error = SEND_RETRY_AFTER, str(e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            outcome, error = SEND_TRANSIENT, str(e)
+        except TelegramAPIError as e:
+            # Forbidden (бот заблокирован), BadRequest и т.п. — повтор не поможет
+            log.warning("send to %s failed: %s", chat_id, e)
+            outcome, error = SEND_REJECTED, str(e)
+        else:
+            outcome, error = SEND_OK, None
+        TELEGRAM_SENDS.inc(outcome)
+        return outcome, error
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 import os
 
+from throttling import parse_limits
+from time_utils import load_schedule
+
 
 @dataclass(frozen=True)
 class Config:
@@ -8,6 +11,28 @@ class Config:
     admin_ids: set[int]
     officer_ids: set[int]
     db_path: str = "bot.sqlite3"
+    db_readers: int = 4
+    checkin_batch_ms: float = 0
+    roster_cache_max: int = 10000
+    bot_mode: str = "polling"
+    webhook_base_url: str = ""
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    broadcast_rate: float = 30.0
+    broadcast_concurrency: int = 10
+    fsm_cache_max: int = 1000
+    fsm_ttl_hours: float = 24.0
+    workers: int = 1
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    slow_query_ms: float | None = None
+    retention_days: int = 0
+    archive_db_path: str = ""
+    slot_schedule_path: str = ""
+    nudge_cadets: bool = True
+    throttle_limits: str = ""
 
 
 def _parse_ids(raw: str) -> set[int]:
@@ -26,10 +51,90 @@ def load_config() -> Config:
     officer_ids = _parse_ids(os.getenv("OFFICER_IDS", ""))
 
     db_path = os.getenv("DB_PATH", "bot.sqlite3").strip() or "bot.sqlite3"
+    db_readers = int(os.getenv("DB_READERS", "4").strip() or "4")
+    # 0 — групповой коммит отметок выключен
+    checkin_batch_ms = float(os.getenv("CHECKIN_BATCH_MS", "0").strip() or "0")
+    roster_cache_max = int(os.getenv("ROSTER_CACHE_MAX", "10000").strip() or "10000")
+
+    bot_mode = os.getenv("BOT_MODE", "polling").strip().lower() or "polling"
+    if bot_mode not in ("polling", "webhook"):
+        raise RuntimeError(f"Unknown BOT_MODE: {bot_mode}")
+
+    webhook_base_url = os.getenv("WEBHOOK_BASE_URL", "").strip()
+    webhook_path = os.getenv("WEBHOOK_PATH", "/webhook").strip() or "/webhook"
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    webhook_host = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip() or "0.0.0.0"
+    webhook_port = int(os.getenv("WEBHOOK_PORT", "8080").strip() or "8080")
+
+    broadcast_rate = float(os.getenv("BROADCAST_RATE", "30").strip() or "30")
+    broadcast_concurrency = int(os.getenv("BROADCAST_CONCURRENCY", "10").strip() or "10")
+
+    fsm_cache_max = int(os.getenv("FSM_CACHE_MAX", "1000").strip() or "1000")
+    fsm_ttl_hours = float(os.getenv("FSM_TTL_HOURS", "24").strip() or "24")
+
+    # >1 — несколько процессов делят один порт вебхука (SO_REUSEPORT)
+    workers = int(os.getenv("WORKERS", "1").strip() or "1")
+    if workers > 1 and bot_mode != "webhook":
+        raise RuntimeError("WORKERS > 1 requires BOT_MODE=webhook")
+
+    # 0 — эндпоинт /metrics выключен; у воркера i порт metrics_port + i
+    metrics_host = os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+    metrics_port = int(os.getenv("METRICS_PORT", "0").strip() or "0")
+
+    # Пусто — профилирование запросов выключено
+    slow_query_raw = os.getenv("SLOW_QUERY_MS", "").strip()
+    slow_query_ms = float(slow_query_raw) if slow_query_raw else None
+
+    # 0 — отметки не архивируются
+    retention_days = int(os.getenv("RETENTION_DAYS", "0").strip() or "0")
+    root, ext = os.path.splitext(db_path)
+    archive_db_path = os.getenv("ARCHIVE_DB_PATH", "").strip() or f"{root}-archive{ext or '.sqlite3'}"
+
+    # Пусто — окна по умолчанию (утро и вечер каждый день); иначе JSON-файл
+    # с окнами, см. time_utils.load_schedule. Ошибки в нём видны сразу при старте.
+    slot_schedule_path = os.getenv("SLOT_SCHEDULE", "").strip()
+    if slot_schedule_path:
+        load_schedule(slot_schedule_path)
+
+    # 0 — не напоминать неотметившимся курсантам в открытом окне
+    nudge_cadets = (os.getenv("NUDGE_CADETS", "1").strip() or "1") != "0"
+
+    # Пусто — лимиты по умолчанию (throttling.DEFAULT_LIMITS);
+    # «checkin=0.2/3,pages=1/5» — токенов в секунду / ёмкость по правилам
+    throttle_limits = os.getenv("THROTTLE_LIMITS", "").strip()
+    parse_limits(throttle_limits)
+
+    if bot_mode == "webhook":
+        if not webhook_base_url:
+            raise RuntimeError("WEBHOOK_BASE_URL is not set")
+        if not webhook_secret:
+            raise RuntimeError("WEBHOOK_SECRET is not set")
 
     return Config(
         bot_token=token,
         admin_ids=admin_ids,
         officer_ids=officer_ids,
         db_path=db_path,
+        db_readers=db_readers,
+        checkin_batch_ms=checkin_batch_ms,
+        roster_cache_max=roster_cache_max,
+        bot_mode=bot_mode,
+        webhook_base_url=webhook_base_url,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        webhook_host=webhook_host,
+        webhook_port=webhook_port,
+        broadcast_rate=broadcast_rate,
+        broadcast_concurrency=broadcast_concurrency,
+        fsm_cache_max=fsm_cache_max,
+        fsm_ttl_hours=fsm_ttl_hours,
+        workers=workers,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        slow_query_ms=slow_query_ms,
+        retention_days=retention_days,
+        archive_db_path=archive_db_path,
+        slot_schedule_path=slot_schedule_path,
+        nudge_cadets=nudge_cadets,
+        throttle_limits=throttle_limits,
     )
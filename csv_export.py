@@ -0,0 +1,77 @@
+import csv
+import io
+import tempfile
+from datetime import datetime
+
+from aiogram.types import InputFile
+
+from keyboards import OFFICERS_GROUP_CODE
+from time_utils import TZ, slot_applies, slot_label
+
+CSV_HEADER = ("Дата", "Окно", "Группа", "ФИО", "Username", "Телефон", "Отметка", "Время отметки (МСК)")
+# Дальше этого размера выгрузка уходит из памяти во временный файл
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+
+class SpooledInputFile(InputFile):
+    """Загрузка в Telegram из открытого файла кусками, без чтения целиком в память."""
+
+    def __init__(self, file, filename: str):
+        super().__init__(filename=filename)
+        self._file = file
+
+    async def read(self, bot):
+        self._file.seek(0)
+        while chunk := self._file.read(self.chunk_size):
+            yield chunk
+
+
+def _checked_at(created_at: str | None) -> str:
+    if created_at is None:
+        return ""
+    return datetime.fromisoformat(created_at).astimezone(TZ).strftime("%H:%M:%S")
+
+
+async def export_attendance_csv(db, date_from: str, date_to: str, *, group_code: str | None = None):
+    """
+    Выгрузка посещаемости за период в SpooledTemporaryFile (UTF-8 с BOM и «;» —
+    так файл сразу открывается в Excel). Возвращает (файл, число строк);
+    закрыть файл — на вызывающем. Если выгрузка оборвалась, файл
+    закрывается здесь же.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="", write_through=True)
+    try:
+        writer = csv.writer(text, delimiter=";")
+        writer.writerow(CSV_HEADER)
+
+        n = 0
+        rows = db.iter_attendance(
+            date_from,
+            date_to,
+            group_code=group_code,
+            exclude_group_code=None if group_code else OFFICERS_GROUP_CODE,
+        )
+        async for date_str, slot, group, full_name, username, phone, created_at in rows:
+            # Окна отдельных групп и дней недели: остальным в этом окне отмечаться не нужно
+            if created_at is None and not slot_applies(slot, group, date_str):
+                continue
+            writer.writerow((
+                date_str,
+                slot_label(slot),
+                group,
+                full_name,
+                f"@{username}" if username else "",
+                phone or "",
+                "да" if created_at else "нет",
+                _checked_at(created_at),
+            ))
+            n += 1
+
+        text.flush()
+    except BaseException:
+        # Закрывает и spool (вместе с временным файлом, если он уже создан)
+        text.close()
+        raise
+    text.detach()
+    return spool, n
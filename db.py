@@ -1,5 +1,24 @@
+import asyncio
+import inspect
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+
 import aiosqlite
-from datetime import datetime, timezone
+
+from attendance_board import AttendanceBoard
+from metrics import timed_db
+from query_profiler import QueryProfiler
+from time_utils import now_msk, schedule
+from roster_cache import RosterCache
+
+log = logging.getLogger(__name__)
 
 
 CREATE_SCHEMA_SQL = """
@@ -26,94 +45,1000 @@ CREATE TABLE IF NOT EXISTS checkins (
 
 CREATE INDEX IF NOT EXISTS idx_checkins_date_slot ON checkins(date, slot);
 CREATE INDEX IF NOT EXISTS idx_checkins_user ON checkins(tg_user_id);
+
+-- Итоги закрытых окон доклада. Пишутся один раз и больше не меняются.
+CREATE TABLE IF NOT EXISTS report_snapshots (
+  date TEXT NOT NULL,
+  slot TEXT NOT NULL,
+  scope TEXT NOT NULL,         -- '*' (весь курс) | group_code
+  data TEXT NOT NULL,          -- JSON: groups, missing
+  text TEXT NOT NULL,          -- готовый текст списка неотметившихся
+  created_at TEXT NOT NULL,
+  PRIMARY KEY(date, slot, scope)
+);
+
+-- Состояния FSM (регистрация). key — ключ StorageKey aiogram.
+CREATE TABLE IF NOT EXISTS fsm_states (
+  key TEXT PRIMARY KEY,
+  state TEXT,
+  data TEXT NOT NULL,          -- JSON
+  updated_at REAL NOT NULL     -- unix time
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);
+
+-- Аренда ролей между процессами (например, кто запускает планировщик).
+CREATE TABLE IF NOT EXISTS leases (
+  name TEXT PRIMARY KEY,
+  holder TEXT NOT NULL,
+  expires_at REAL NOT NULL     -- unix time
+);
+
+-- Счётчики изменений для согласования кэшей между процессами.
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO meta(key, value) VALUES ('roster_version', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_cadets_roster_ins AFTER INSERT ON cadets
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'roster_version'; END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cadets_roster_upd AFTER UPDATE ON cadets
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'roster_version'; END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cadets_roster_del AFTER DELETE ON cadets
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'roster_version'; END;
 """
 
+# Индексы под горячие запросы:
+# - отметки окна (date, slot) сразу с tg_user_id: подсчёты и LEFT JOIN по окну
+#   не ходят в таблицу; старый (date, slot) — его префикс, а (tg_user_id)
+#   покрывает UNIQUE(tg_user_id, date, slot);
+# - активные курсанты в порядке (group_code, full_name) — ровно ORDER BY
+#   списков неотметившихся и зарегистрированных, без временного B-дерева.
+INDEXES_V2_SQL = """
+CREATE INDEX IF NOT EXISTS idx_checkins_date_slot_user ON checkins(date, slot, tg_user_id);
+DROP INDEX IF EXISTS idx_checkins_date_slot;
+DROP INDEX IF EXISTS idx_checkins_user;
+
+CREATE INDEX IF NOT EXISTS idx_cadets_active_group_name ON cadets(group_code, full_name) WHERE is_active = 1;
+
+ANALYZE;
+"""
+
+# Архив старых отметок — отдельный файл, подключаемый как archive.
+# id сохраняется, UNIQUE защищает от повторного переноса той же строки.
+ARCHIVE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS archive.checkins (
+  id INTEGER PRIMARY KEY,
+  tg_user_id INTEGER NOT NULL,
+  date TEXT NOT NULL,
+  slot TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  UNIQUE(tg_user_id, date, slot)
+);
+
+CREATE INDEX IF NOT EXISTS archive.idx_checkins_date_slot_user ON checkins(date, slot, tg_user_id);
+"""
+
+# Все отметки: оперативные и архивные. Перенос идёт транзакцией через две
+# базы, а в WAL она атомарна только в каждой по отдельности: после сбоя
+# строка может остаться в обеих, поэтому архивная берётся, только если её
+# нет в основной.
+HISTORY_VIEW_SQL = """
+CREATE TEMP VIEW IF NOT EXISTS checkins_history AS
+SELECT id, tg_user_id, date, slot, created_at FROM main.checkins
+UNION ALL
+SELECT a.id, a.tg_user_id, a.date, a.slot, a.created_at FROM archive.checkins a
+WHERE NOT EXISTS (
+  SELECT 1 FROM main.checkins m
+  WHERE m.tg_user_id = a.tg_user_id AND m.date = a.date AND m.slot = a.slot
+)
+"""
+
+# Дневные итоги посещаемости для аналитики за период (обновляет
+# rollup_attendance раз в сутки, только по ещё не обработанным дням).
+# rollup_cadet_daily.checked — маска окон, см. rollup_slot_bits().
+ROLLUPS_V3_SQL = """
+CREATE TABLE IF NOT EXISTS rollup_cadet_daily (
+  tg_user_id INTEGER NOT NULL,
+  date TEXT NOT NULL,
+  group_code TEXT NOT NULL,
+  checked INTEGER NOT NULL,
+  PRIMARY KEY(tg_user_id, date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_rollup_cadet_group_date
+  ON rollup_cadet_daily(group_code, date, tg_user_id, checked);
+
+CREATE TABLE IF NOT EXISTS rollup_group_daily (
+  date TEXT NOT NULL,
+  slot TEXT NOT NULL,
+  group_code TEXT NOT NULL,
+  total INTEGER NOT NULL,
+  checked INTEGER NOT NULL,
+  PRIMARY KEY(date, slot, group_code)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_days (
+  date TEXT PRIMARY KEY,
+  created_at TEXT NOT NULL
+);
+"""
+
+# Маска окон, которые были у курсанта в этот день по расписанию.
+# До неё окон было два и каждый день — утро и вечер (биты 1 и 2).
+ROLLUP_EXPECTED_V4_SQL = """
+ALTER TABLE rollup_cadet_daily ADD COLUMN expected INTEGER NOT NULL DEFAULT 3;
+
+DROP INDEX IF EXISTS idx_rollup_cadet_group_date;
+CREATE INDEX idx_rollup_cadet_group_date
+  ON rollup_cadet_daily(group_code, date, tg_user_id, checked, expected);
+"""
+
+# Курсы (tenants). Данные каждого курса — в своём файле-шарде со своим
+# реестром групп (cadet_groups — в каждом шарде).
+GROUPS_V5_SQL = """
+CREATE TABLE IF NOT EXISTS cadet_groups (
+  group_code TEXT PRIMARY KEY,
+  position INTEGER NOT NULL
+);
+"""
+
+# Справочник курсов ведётся только в основной базе (DB_PATH), она же — шард
+# курса по умолчанию; уже зарегистрированные в ней относятся к этому курсу.
+# Это не миграция: шарды (shard=True) его не создают. В шардах, прошедших
+# v5 до этого разделения, таблицы остались пустыми и не читаются.
+DIRECTORY_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS tenants (
+  code TEXT PRIMARY KEY,
+  title TEXT NOT NULL,
+  db_path TEXT NOT NULL,
+  position INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tenant_users (
+  tg_user_id INTEGER PRIMARY KEY,
+  tenant TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO tenant_users(tg_user_id, tenant) SELECT tg_user_id, 'main' FROM cadets;
+"""
+
+# Исходящие сообщения задач по расписанию. Задача записывает всю рассылку
+# одной транзакцией, отправляет их фоновый разборщик (outbox.Outbox).
+# UNIQUE(job, date, slot, chat_id) — ключ идемпотентности: повторный запуск
+# задачи (перезапуск, смена лидера) не ставит сообщения второй раз.
+# status: pending -> sent | failed | expired; next_at — когда пробовать
+# (у взятых в отправку сдвигается вперёд, упавший процесс их не теряет).
+OUTBOX_V6_SQL = """
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY,
+  job TEXT NOT NULL,
+  date TEXT NOT NULL,
+  slot TEXT NOT NULL,
+  chat_id INTEGER NOT NULL,
+  text TEXT NOT NULL,
+  reply_markup TEXT,           -- JSON разметки клавиатуры
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_at REAL NOT NULL,       -- unix time
+  expires_at REAL,             -- после него не отправлять (напоминания в окне)
+  created_at REAL NOT NULL,
+  sent_at REAL,
+  last_error TEXT,
+  UNIQUE(job, date, slot, chat_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(next_at) WHERE status = 'pending';
+"""
+
+# Миграции схемы: MIGRATIONS[i] переводит базу с user_version = i на i + 1.
+# Первая — исходная схема с IF NOT EXISTS: базы, созданные до появления
+# миграций (user_version = 0), проходят её без изменений.
+# Новые миграции только дописываются в конец.
+MIGRATIONS: list[str] = [
+    CREATE_SCHEMA_SQL,
+    INDEXES_V2_SQL,
+    ROLLUPS_V3_SQL,
+    ROLLUP_EXPECTED_V4_SQL,
+    GROUPS_V5_SQL,
+    OUTBOX_V6_SQL,
+]
+
+# Общие для всех соединений настройки. WAL позволяет читателям работать
+# параллельно с единственным писателем, synchronous=NORMAL в режиме WAL
+# безопасен и избавляет от fsync на каждый коммит (только на checkpoint).
+CONNECTION_PRAGMAS_SQL = """
+PRAGMA synchronous = NORMAL;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -8000;
+PRAGMA mmap_size = 67108864;
+"""
+
+BUSY_TIMEOUT_S = 5.0
+STATEMENT_CACHE_SIZE = 128
+
+# Групповой коммит отметок: сколько строк максимум пишется одной транзакцией
+# и сколько параметров допускается в одном IN (...).
+CHECKIN_BATCH_MAX = 500
+SQL_IN_CHUNK = 500
+
+SNAPSHOT_CACHE_MAX = 256
+
+# Выгрузка: строк за один fetchmany
+EXPORT_FETCH_BATCH = 500
+
+# Постраничный просмотр списков: строк за один запрос
+PAGE_ROWS = 100
+
+# Перенос в архив: строк за одну транзакцию (держит блокировку писателя)
+ARCHIVE_BATCH = 500
+
+# Outbox: сообщений за одну выборку на отправку
+OUTBOX_BATCH = 100
+
+
+class CheckinResult(Enum):
+    INSERTED = "inserted"
+    DUPLICATE = "duplicate"
+    NOT_REGISTERED = "not_registered"
+    OFFICER = "officer"
+    # Открытое окно не для группы курсанта
+    NOT_IN_WINDOW = "not_in_window"
+
+
+def _checkin_refusal(
+    cadet: dict | None, exclude_group_code: str, group_codes: frozenset[str] | None
+) -> CheckinResult | None:
+    """Почему курсант не проходит отбор отметки checkin; None — проходит."""
+    if cadet is None or cadet["is_active"] != 1:
+        return CheckinResult.NOT_REGISTERED
+    if cadet["group_code"] == exclude_group_code:
+        return CheckinResult.OFFICER
+    if group_codes is not None and cadet["group_code"] not in group_codes:
+        return CheckinResult.NOT_IN_WINDOW
+    return None
+
+
+CADET_COLUMNS = ("tg_user_id", "group_code", "full_name", "username", "phone", "created_at", "is_active")
+
+
+def _split_sql(script: str) -> list[str]:
+    """Скрипт на отдельные выражения (триггеры с ; внутри BEGIN ... END — целиком)."""
+    statements: list[str] = []
+    current = ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip().strip(";").strip() and not _is_comment(current):
+                statements.append(current.strip())
+            current = ""
+    if current.strip() and not _is_comment(current):
+        statements.append(current.strip())
+    return statements
+
+
+def _is_comment(sql: str) -> bool:
+    return all(not line.strip() or line.strip().startswith("--") for line in sql.splitlines())
+
+
+def rollup_slot_bits() -> list[tuple[str, int]]:
+    """Биты окон в масках rollup_cadet_daily — по месту окна в расписании."""
+    return [(s.slot, 1 << i) for i, s in enumerate(schedule().slots)]
+
+
+def _keyset(after: int | None, before: int | None) -> tuple[str, str, tuple]:
+    """
+    Условие, направление сортировки и параметры для чтения страницы по ключу
+    (group_code, full_name, tg_user_id). Курсор — tg_user_id крайней строки
+    соседней страницы; сам ключ достаётся подзапросом по первичному ключу.
+    """
+    cursor_key = "(SELECT group_code, full_name, tg_user_id FROM cadets WHERE tg_user_id = ?)"
+    if before is not None:
+        return f" AND (c.group_code, c.full_name, c.tg_user_id) < {cursor_key}", "DESC", (before,)
+    if after is not None:
+        return f" AND (c.group_code, c.full_name, c.tg_user_id) > {cursor_key}", "ASC", (after,)
+    return "", "ASC", ()
+
+
+@dataclass(frozen=True)
+class AttendanceReport:
+    """
+    Итог доклада за (date, slot): по группам — (group_code, всего, отметились),
+    и список неотметившихся (group_code, full_name, username, phone, tg_user_id),
+    упорядоченный по группе, ФИО и tg_user_id — по этому ключу листаются
+    страницы отчёта.
+    """
+    groups: list[tuple[str, int, int]]
+    missing: list[tuple[str, str, str | None, str | None, int]]
+
+    @property
+    def total(self) -> int:
+        return sum(t for _, t, _ in self.groups)
+
+    @property
+    def checked(self) -> int:
+        return sum(c for _, _, c in self.groups)
+
 
 class Database:
-    def __init__(self, db_path: str):
+    """
+    Доступ к SQLite через долгоживущие соединения:
+      - один писатель (все INSERT/UPDATE сериализуются через asyncio.Lock);
+      - пул читателей, которые в режиме WAL не блокируются писателем.
+    Соединения открываются в init() и закрываются в close().
+
+    При checkin_batch_ms > 0 отметки не коммитятся по одной: фоновая задача
+    собирает всё, что пришло за checkin_batch_ms, и пишет одной транзакцией.
+
+    Таблица cadets дополнительно держится в RosterCache: get_cadet и подсчёты
+    регистраций отвечают из памяти, а upsert_cadet/update_username/update_phone
+    обновляют кэш сразу после записи в базу.
+
+    На время открытого окна доклада (open_board/close_board) держится
+    AttendanceBoard: счётчики и списки неотметившихся за это окно отдаются
+    из памяти, каждая успешная отметка сразу вычёркивает курсанта.
+
+    shared=True — с той же базой работают другие процессы. Тогда перед
+    ответом из кэшей sync_shared() сверяет PRAGMA data_version: при чужих
+    коммитах состав перечитывается (если менялся meta.roster_version),
+    а на доску доносятся новые отметки по checkins.id.
+
+    archive_path + retention_days — отметки старше горизонта переносятся
+    в подключённый файл архива (archive_checkins_batch); запросы за даты
+    старше горизонта читают представление checkins_history.
+
+    shard=True — файл курса, а не основная база: справочника курсов
+    (tenants, tenant_users) в нём нет.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        readers: int = 4,
+        checkin_batch_ms: float = 0,
+        roster_cache_max: int = 10000,
+        shared: bool = False,
+        profiler: QueryProfiler | None = None,
+        archive_path: str | None = None,
+        retention_days: int = 0,
+        shard: bool = False,
+    ):
         self._db_path = db_path
+        self._shard = shard
+        self._readers_count = max(1, readers)
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: list[aiosqlite.Connection] = []
+
+        self._checkin_batch_s = max(0.0, checkin_batch_ms) / 1000
+        self._checkin_queue: asyncio.Queue | None = None
+        self._checkin_task: asyncio.Task | None = None
+
+        self._roster = RosterCache(roster_cache_max)
+        self._board: AttendanceBoard | None = None
+        self._snapshots: OrderedDict[tuple[str, str, str], tuple[AttendanceReport, str]] = OrderedDict()
+
+        self._shared = shared
+        self._sync_lock = asyncio.Lock()
+        self._data_version = 0
+        self._roster_version = 0
+        self._last_checkin_id = 0
+        # Растёт при каждом обнаруженном чужом коммите; по нему сбрасывают
+        # свои кэши компоненты вне Database (FSM-хранилище)
+        self.external_epoch = 0
+
+        self.profiler = profiler
+
+        # Отметки старше retention_days дней переносятся в archive_path
+        self._archive_path = archive_path if retention_days > 0 else None
+        self._retention_days = retention_days
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # cached_statements: sqlite3 держит подготовленные выражения между вызовами
+        conn = await aiosqlite.connect(
+            self._db_path,
+            timeout=BUSY_TIMEOUT_S,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        await conn.executescript(CONNECTION_PRAGMAS_SQL)
+        if self._archive_path is not None:
+            await conn.execute("ATTACH DATABASE ? AS archive", (self._archive_path,))
+        return conn
 
     async def init(self) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.executescript(CREATE_SCHEMA_SQL)
-            await db.commit()
+        self._writer = await self._connect()
+        await self._writer.execute("PRAGMA journal_mode = WAL")
+        if self._archive_path is not None:
+            # До первой таблицы действует сразу; существующую базу переводит
+            # enable_incremental_vacuum из ночной задачи архива
+            await self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await self._migrate()
+
+        if self._archive_path is not None:
+            await self._writer.execute("PRAGMA archive.journal_mode = WAL")
+            await self._writer.executescript(ARCHIVE_SCHEMA_SQL)
+            await self._writer.execute(HISTORY_VIEW_SQL)
+
+        for _ in range(self._readers_count):
+            conn = await self._connect()
+            if self._archive_path is not None:
+                await conn.execute(HISTORY_VIEW_SQL)
+            await conn.execute("PRAGMA query_only = 1")
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+        if self._shared:
+            self._data_version = await self._fetch_value("PRAGMA data_version")
+            self._roster_version = await self._fetch_value("SELECT value FROM meta WHERE key = 'roster_version'")
+        await self._warm_roster()
+
+        if self._checkin_batch_s > 0:
+            self._checkin_queue = asyncio.Queue()
+            self._checkin_task = asyncio.create_task(self._checkin_writer(self._checkin_queue))
+
+    async def _migrate(self) -> None:
+        """
+        Применяет недостающие миграции одной транзакцией. BEGIN IMMEDIATE
+        и чтение user_version внутри неё: если несколько процессов стартуют
+        одновременно, миграции выполнит первый, остальные увидят новую версию.
+        В основной базе там же создаётся справочник курсов, если его ещё нет.
+        """
+        db = self._writer
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            cur = await db.execute("PRAGMA user_version")
+            (version,) = await cur.fetchone()
+            for sql in MIGRATIONS[version:]:
+                for statement in _split_sql(sql):
+                    await db.execute(statement)
+            if version < len(MIGRATIONS):
+                await db.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            if not self._shard:
+                cur = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tenant_users'")
+                if await cur.fetchone() is None:
+                    for statement in _split_sql(DIRECTORY_SCHEMA_SQL):
+                        await db.execute(statement)
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
+    async def optimize(self) -> None:
+        """
+        Обслуживание статистики планировщика: PRAGMA optimize сам решает,
+        для каких таблиц нужен ANALYZE (данные заметно выросли с прошлого раза).
+        """
+        async with self._write() as db:
+            await db.execute("PRAGMA optimize")
+
+    async def close(self) -> None:
+        await self._drain_checkins()
+
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+
+        if self._writer is not None:
+            async with self._write_lock:
+                await self._writer.execute("PRAGMA optimize")
+                await self._writer.close()
+                self._writer = None
+
+    def _profiled(self, conn: aiosqlite.Connection):
+        if self.profiler is None:
+            return conn
+        return self.profiler.wrap(conn)
+
+    @asynccontextmanager
+    async def _read(self):
+        conn = await self._readers.get()
+        try:
+            yield self._profiled(conn)
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _write(self):
+        async with self._write_lock:
+            try:
+                yield self._profiled(self._writer)
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+    async def _warm_roster(self) -> None:
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT tg_user_id, group_code, full_name, username, phone, created_at, is_active "
+                "FROM cadets"
+            )
+            rows = await cur.fetchall()
+        self._roster.load([dict(zip(CADET_COLUMNS, r)) for r in rows])
+
+    def roster_cache_stats(self) -> dict:
+        return self._roster.stats()
+
+    async def _fetch_value(self, sql: str, params: tuple = ()):
+        cur = await self._profiled(self._writer).execute(sql, params)
+        (value,) = await cur.fetchone()
+        return value
+
+    async def sync_shared(self) -> None:
+        """
+        Подтягивает в кэши изменения, закоммиченные другими процессами.
+        data_version писателя меняется только от чужих коммитов (наши
+        читатели в базу не пишут), поэтому без чужих записей это один PRAGMA.
+
+        Читаем на писателе под его блокировкой: посреди чужой для нас
+        транзакции (пачка группового коммита до commit) запрос увидел бы
+        её незакоммиченные строки.
+        """
+        if not self._shared:
+            return
+        async with self._sync_lock:
+            new_checkins = []
+            async with self._write_lock:
+                version = await self._fetch_value("PRAGMA data_version")
+                if version == self._data_version:
+                    return
+                self._data_version = version
+                self.external_epoch += 1
+
+                roster_version = await self._fetch_value("SELECT value FROM meta WHERE key = 'roster_version'")
+                roster_changed = roster_version != self._roster_version
+                self._roster_version = roster_version
+                if not roster_changed and self._board is not None:
+                    cur = await self._profiled(self._writer).execute(
+                        "SELECT id, tg_user_id, date, slot FROM checkins WHERE id > ?",
+                        (self._last_checkin_id,),
+                    )
+                    new_checkins = await cur.fetchall()
+
+            if roster_changed:
+                await self._warm_roster()
+                if self._board is not None:
+                    await self.open_board(self._board.date_str, self._board.slot)
+                return
+
+            for checkin_id, tg_user_id, date_str, slot in new_checkins:
+                self._board_mark(tg_user_id, date_str, slot)
+                self._last_checkin_id = max(self._last_checkin_id, checkin_id)
 
     async def get_cadet(self, tg_user_id: int) -> dict | None:
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
+        await self.sync_shared()
+        cached, cadet = self._roster.get(tg_user_id)
+        if cached:
+            return cadet
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT tg_user_id, group_code, full_name, username, phone, created_at, is_active "
                 "FROM cadets WHERE tg_user_id = ?",
                 (tg_user_id,),
             )
             row = await cur.fetchone()
-            return dict(row) if row else None
+        if not row:
+            return None
+        cadet = dict(zip(CADET_COLUMNS, row))
+        self._roster.put(cadet)
+        return dict(cadet)
+
+    async def get_cadets(self, tg_user_ids) -> dict[int, dict]:
+        """
+        Пакетный get_cadet: всё, чего нет в кэше, добирается одним IN (...).
+        Незарегистрированных в результате нет.
+        """
+        await self.sync_shared()
+        result: dict[int, dict] = {}
+        misses: list[int] = []
+        for tg_user_id in tg_user_ids:
+            cached, cadet = self._roster.get(tg_user_id)
+            if not cached:
+                misses.append(tg_user_id)
+            elif cadet is not None:
+                result[tg_user_id] = cadet
+
+        if not misses:
+            return result
+
+        async with self._read() as db:
+            for i in range(0, len(misses), SQL_IN_CHUNK):
+                chunk = misses[i:i + SQL_IN_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                cur = await db.execute(
+                    "SELECT tg_user_id, group_code, full_name, username, phone, created_at, is_active "
+                    f"FROM cadets WHERE tg_user_id IN ({marks})",
+                    chunk,
+                )
+                for row in await cur.fetchall():
+                    cadet = dict(zip(CADET_COLUMNS, row))
+                    self._roster.put(cadet)
+                    result[cadet["tg_user_id"]] = dict(cadet)
+        return result
 
     async def upsert_cadet(self, tg_user_id: int, group_code: str, full_name: str, username: str | None) -> None:
         created_at = datetime.now(timezone.utc).isoformat()
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
+        async with self._write() as db:
+            cur = await db.execute(
                 "INSERT INTO cadets(tg_user_id, group_code, full_name, username, phone, created_at, is_active) "
                 "VALUES (?, ?, ?, ?, NULL, ?, 1) "
                 "ON CONFLICT(tg_user_id) DO UPDATE SET "
                 "group_code=excluded.group_code, "
                 "full_name=excluded.full_name, "
-                "username=excluded.username",
+                "username=excluded.username, "
+                "is_active=1 "
+                "RETURNING tg_user_id, group_code, full_name, username, phone, created_at, is_active",
                 (tg_user_id, group_code, full_name, username, created_at),
             )
-            await db.commit()
+            row = await cur.fetchone()
+        cadet = dict(zip(CADET_COLUMNS, row))
+        self._roster.put(cadet)
+        if self._board is not None:
+            self._board.upsert_cadet(cadet)
+
+    async def deactivate_cadet(self, tg_user_id: int) -> None:
+        """
+        Курсант ушёл из этого курса (перерегистрировался на другом): строка
+        остаётся ради истории отметок, но из состава и списков он выбывает.
+        """
+        async with self._write() as db:
+            cur = await db.execute(
+                "UPDATE cadets SET is_active = 0 WHERE tg_user_id = ? "
+                "RETURNING tg_user_id, group_code, full_name, username, phone, created_at, is_active",
+                (tg_user_id,),
+            )
+            row = await cur.fetchone()
+        if not row:
+            return
+        cadet = dict(zip(CADET_COLUMNS, row))
+        self._roster.put(cadet)
+        if self._board is not None:
+            self._board.upsert_cadet(cadet)
 
     async def update_username(self, tg_user_id: int, username: str | None) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE cadets SET username = ? WHERE tg_user_id = ?",
                 (username, tg_user_id),
             )
-            await db.commit()
+        self._roster.update(tg_user_id, username=username)
+        if self._board is not None:
+            self._board.update_contact(tg_user_id, username=username)
 
     async def update_phone(self, tg_user_id: int, phone: str | None) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE cadets SET phone = ? WHERE tg_user_id = ?",
                 (phone, tg_user_id),
             )
-            await db.commit()
+        self._roster.update(tg_user_id, phone=phone)
+        if self._board is not None:
+            self._board.update_contact(tg_user_id, phone=phone)
 
     async def add_checkin(self, tg_user_id: int, date_str: str, slot: str) -> bool:
         created_at = datetime.now(timezone.utc).isoformat()
-        async with aiosqlite.connect(self._db_path) as db:
+        if self._checkin_queue is not None:
+            fut = asyncio.get_running_loop().create_future()
+            self._checkin_queue.put_nowait(((tg_user_id, date_str, slot, created_at), fut, None))
+            return await fut
+
+        async with self._write() as db:
             cur = await db.execute(
                 "INSERT OR IGNORE INTO checkins(tg_user_id, date, slot, created_at) "
                 "VALUES (?, ?, ?, ?)",
                 (tg_user_id, date_str, slot, created_at),
             )
-            await db.commit()
-            return cur.rowcount == 1
+            inserted = cur.rowcount == 1
+        if inserted:
+            self._board_mark(tg_user_id, date_str, slot)
+        return inserted
+
+    async def checkin(
+        self,
+        tg_user_id: int,
+        date_str: str,
+        slot: str,
+        *,
+        exclude_group_code: str,
+        group_codes: frozenset[str] | None = None,
+    ) -> CheckinResult:
+        """
+        Отметка с проверкой регистрации одним запросом: INSERT ... SELECT
+        из cadets (активный, не exclude_group_code, из group_codes, если окно
+        только для них). ON CONFLICT DO UPDATE без изменений нужен ради
+        RETURNING: строку возвращает и вставка, и повтор, а различает их
+        created_at. Пустой ответ — курсант не подошёл (редкий случай); причину
+        называет его строка в cadets, прочитанная в той же транзакции.
+
+        При групповом коммите отметка уходит в общую пачку, проверка
+        регистрации — один запрос на пачку.
+        """
+        created_at = datetime.now(timezone.utc).isoformat()
+        if self._checkin_queue is not None:
+            fut = asyncio.get_running_loop().create_future()
+            rule = (exclude_group_code, group_codes)
+            self._checkin_queue.put_nowait(((tg_user_id, date_str, slot, created_at), fut, rule))
+            return await fut
+
+        groups_sql, groups = "", ()
+        if group_codes is not None:
+            groups = tuple(sorted(group_codes))
+            groups_sql = f" AND group_code IN ({','.join('?' * len(groups))})"
+        async with self._write() as db:
+            cur = await db.execute(
+                "INSERT INTO checkins(tg_user_id, date, slot, created_at) "
+                "SELECT tg_user_id, ?, ?, ? FROM cadets "
+                f"WHERE tg_user_id = ? AND is_active = 1 AND group_code <> ?{groups_sql} "
+                "ON CONFLICT(tg_user_id, date, slot) DO UPDATE SET created_at = checkins.created_at "
+                "RETURNING created_at",
+                (date_str, slot, created_at, tg_user_id, exclude_group_code, *groups),
+            )
+            row = await cur.fetchone()
+            if row is None:
+                # INSERT уже открыл транзакцию писателя: состав тот же, что видел отбор
+                cur = await db.execute(
+                    "SELECT group_code, is_active FROM cadets WHERE tg_user_id = ?",
+                    (tg_user_id,),
+                )
+                cadet = await cur.fetchone()
+                refusal = _checkin_refusal(
+                    {"group_code": cadet[0], "is_active": cadet[1]} if cadet else None,
+                    exclude_group_code,
+                    group_codes,
+                )
+                if refusal is None:
+                    raise RuntimeError(f"checkin: cadet {tg_user_id} passed the rule but was not inserted")
+
+        if row is None:
+            return refusal
+        if row[0] != created_at:
+            return CheckinResult.DUPLICATE
+        self._board_mark(tg_user_id, date_str, slot)
+        return CheckinResult.INSERTED
+
+    async def _checkin_writer(self, queue: asyncio.Queue) -> None:
+        """
+        Фоновая задача группового коммита. None в очереди — сигнал остановки:
+        всё, что было поставлено до него, будет записано.
+        """
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self._checkin_batch_s
+            while len(batch) < CHECKIN_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush_checkins(batch)
+
+    async def _flush_checkins(self, batch: list) -> None:
+        """
+        batch: (row, future, rule). rule=None — отметка add_checkin
+        (результат bool), иначе (exclude_group_code, group_codes) от checkin:
+        регистрация проверяется в той же транзакции, результат — CheckinResult.
+        """
+        try:
+            async with self._write() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                refused = await self._checkin_refusals(db, batch)
+                rows = [row for i, (row, _, _) in enumerate(batch) if i not in refused]
+                inserted = iter(await self._insert_checkins_many(db, rows))
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for i, (row, fut, rule) in enumerate(batch):
+            if i in refused:
+                result = refused[i]
+            else:
+                ok = next(inserted)
+                if ok:
+                    self._board_mark(row[0], row[1], row[2])
+                if rule is None:
+                    result = ok
+                else:
+                    result = CheckinResult.INSERTED if ok else CheckinResult.DUPLICATE
+            if not fut.done():
+                fut.set_result(result)
+
+    @staticmethod
+    async def _checkin_refusals(db: aiosqlite.Connection, batch: list) -> dict[int, CheckinResult]:
+        """Для отметок checkin в пачке: кто не подходит (индекс -> причина) — одним запросом на SQL_IN_CHUNK."""
+        user_ids = list({row[0] for row, _, rule in batch if rule is not None})
+        cadets: dict[int, dict] = {}
+        for i in range(0, len(user_ids), SQL_IN_CHUNK):
+            chunk = user_ids[i:i + SQL_IN_CHUNK]
+            cur = await db.execute(
+                f"SELECT tg_user_id, group_code, is_active FROM cadets WHERE tg_user_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for tg_user_id, group_code, is_active in await cur.fetchall():
+                cadets[tg_user_id] = {"group_code": group_code, "is_active": is_active}
+
+        refused: dict[int, CheckinResult] = {}
+        for i, (row, _, rule) in enumerate(batch):
+            if rule is None:
+                continue
+            refusal = _checkin_refusal(cadets.get(row[0]), *rule)
+            if refusal is not None:
+                refused[i] = refusal
+        return refused
+
+    @staticmethod
+    async def _insert_checkins_many(db: aiosqlite.Connection, rows: list[tuple]) -> list[bool]:
+        """
+        INSERT OR IGNORE пачкой через executemany. rowcount у executemany общий,
+        поэтому результат для каждой строки определяем заранее: под
+        BEGIN IMMEDIATE (его открывает вызывающий) смотрим, какие
+        (tg_user_id, date, slot) уже есть.
+        Повтор внутри пачки считается дублем первой строки.
+        """
+        by_slot: dict[tuple[str, str], list[int]] = {}
+        for tg_user_id, date_str, slot, _ in rows:
+            by_slot.setdefault((date_str, slot), []).append(tg_user_id)
+
+        existing: set[tuple[int, str, str]] = set()
+        for (date_str, slot), user_ids in by_slot.items():
+            for i in range(0, len(user_ids), SQL_IN_CHUNK):
+                chunk = user_ids[i:i + SQL_IN_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                cur = await db.execute(
+                    "SELECT tg_user_id FROM checkins "
+                    f"WHERE date = ? AND slot = ? AND tg_user_id IN ({marks})",
+                    (date_str, slot, *chunk),
+                )
+                existing.update((r[0], date_str, slot) for r in await cur.fetchall())
+
+        inserted: list[bool] = []
+        new_rows: list[tuple] = []
+        for row in rows:
+            key = (row[0], row[1], row[2])
+            if key in existing:
+                inserted.append(False)
+                continue
+            existing.add(key)
+            new_rows.append(row)
+            inserted.append(True)
+
+        if new_rows:
+            await db.executemany(
+                "INSERT OR IGNORE INTO checkins(tg_user_id, date, slot, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                new_rows,
+            )
+        return inserted
+
+    async def _drain_checkins(self) -> None:
+        """
+        Останавливает групповой коммит, дописав всё из очереди.
+        Новые отметки после этого пишутся напрямую.
+        """
+        queue, task = self._checkin_queue, self._checkin_task
+        if queue is None or task is None:
+            return
+        self._checkin_queue = None
+        self._checkin_task = None
+
+        queue.put_nowait(None)
+        await task
+
+    async def open_board(self, date_str: str, slot: str) -> None:
+        """
+        Строит доску окна (date_str, slot) по активному составу и уже
+        принятым отметкам. Читаем под блокировкой писателя, чтобы ни одна
+        отметка не проскочила между снимком и установкой доски.
+        """
+        board = AttendanceBoard(date_str, slot)
+        async with self._write_lock:
+            cur = await self._profiled(self._writer).execute(
+                "SELECT c.tg_user_id, c.group_code, c.full_name, c.username, c.phone, "
+                "  ch.tg_user_id IS NOT NULL "
+                "FROM cadets c "
+                "LEFT JOIN checkins ch "
+                "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ? "
+                "WHERE c.is_active = 1",
+                (date_str, slot),
+            )
+            for tg_user_id, group_code, full_name, username, phone, checked in await cur.fetchall():
+                board.add(
+                    {
+                        "tg_user_id": tg_user_id,
+                        "group_code": group_code,
+                        "full_name": full_name,
+                        "username": username,
+                        "phone": phone,
+                    },
+                    bool(checked),
+                )
+            self._last_checkin_id = await self._fetch_value("SELECT COALESCE(MAX(id), 0) FROM checkins")
+            self._board = board
+
+    def close_board(self) -> None:
+        self._board = None
+
+    def _board_for(self, date_str: str, slot: str) -> AttendanceBoard | None:
+        board = self._board
+        if board is not None and board.matches(date_str, slot):
+            return board
+        return None
+
+    def _board_mark(self, tg_user_id: int, date_str: str, slot: str) -> None:
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            board.mark_checked(tg_user_id)
+
+    def _history_cutoff(self) -> str:
+        """Первая дата, отметки за которую точно не переносились в архив."""
+        return (now_msk().date() - timedelta(days=self._retention_days)).isoformat()
+
+    def _checkins_for(self, date_str: str) -> str:
+        if self._archive_path is not None and date_str < self._history_cutoff():
+            return "checkins_history"
+        return "checkins"
 
     async def count_registered_in_group(self, group_code: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        n = self._roster.count_in_group(group_code)
+        if n is not None:
+            return n
+
+        async with self._read() as db:
             cur = await db.execute(
-                "SELECT COUNT(*) FROM cadets WHERE group_code = ?",
+                "SELECT COUNT(*) FROM cadets WHERE is_active = 1 AND group_code = ?",
                 (group_code,),
             )
             (n,) = await cur.fetchone()
             return int(n)
 
     async def count_registered_course(self, *, exclude_group_code: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        by_group = self._roster.count_by_group(exclude_group_code=exclude_group_code)
+        if by_group is not None:
+            return sum(n for _, n in by_group)
+
+        async with self._read() as db:
             cur = await db.execute(
-                "SELECT COUNT(*) FROM cadets WHERE group_code <> ?",
+                "SELECT COUNT(*) FROM cadets WHERE is_active = 1 AND group_code <> ?",
                 (exclude_group_code,),
             )
             (n,) = await cur.fetchone()
             return int(n)
 
     async def count_registered_by_group_course(self, *, exclude_group_code: str) -> list[tuple[str, int]]:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        by_group = self._roster.count_by_group(exclude_group_code=exclude_group_code)
+        if by_group is not None:
+            return by_group
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT group_code, COUNT(*) "
                 "FROM cadets "
-                "WHERE group_code <> ? "
+                "WHERE is_active = 1 AND group_code <> ? "
                 "GROUP BY group_code "
                 "ORDER BY group_code",
                 (exclude_group_code,),
@@ -122,7 +1047,12 @@ class Database:
             return [(r[0], int(r[1])) for r in rows]
 
     async def list_registered_in_group(self, group_code: str) -> list[tuple[str, str | None, str | None]]:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        members = self._roster.list_active_in_group(group_code)
+        if members is not None:
+            return members
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT full_name, username, phone "
                 "FROM cadets "
@@ -133,8 +1063,29 @@ class Database:
             rows = await cur.fetchall()
             return [(r[0], r[1], r[2]) for r in rows]
 
+    async def registered_page(
+        self, group_code: str, *, after: int | None = None, before: int | None = None, limit: int = PAGE_ROWS
+    ) -> list[tuple[int, str, str, str | None, str | None]]:
+        """
+        Страница списка активных курсантов группы: (tg_user_id, group_code,
+        full_name, username, phone) после курсора after или перед курсором
+        before. При before строки идут от курсора назад.
+        """
+        keyset, order, cursor = _keyset(after, before)
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT c.tg_user_id, c.group_code, c.full_name, c.username, c.phone "
+                "FROM cadets c "
+                f"WHERE c.is_active = 1 AND c.group_code = ?{keyset} "
+                f"ORDER BY c.group_code {order}, c.full_name {order}, c.tg_user_id {order} "
+                "LIMIT ?",
+                (group_code, *cursor, limit),
+            )
+            rows = await cur.fetchall()
+            return [tuple(r) for r in rows]
+
     async def count_group_total(self, group_code: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT COUNT(*) FROM cadets WHERE is_active = 1 AND group_code = ?",
                 (group_code,),
@@ -143,11 +1094,16 @@ class Database:
             return int(n)
 
     async def count_group_checked(self, group_code: str, date_str: str, slot: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            return board.checked(group_code)
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT COUNT(*) "
                 "FROM cadets c "
-                "JOIN checkins ch ON ch.tg_user_id = c.tg_user_id "
+                f"JOIN {self._checkins_for(date_str)} ch ON ch.tg_user_id = c.tg_user_id "
                 "WHERE c.is_active = 1 AND c.group_code = ? AND ch.date = ? AND ch.slot = ?",
                 (group_code, date_str, slot),
             )
@@ -155,7 +1111,7 @@ class Database:
             return int(n)
 
     async def count_course_total(self, *, exclude_group_code: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT COUNT(*) FROM cadets WHERE is_active = 1 AND group_code <> ?",
                 (exclude_group_code,),
@@ -164,11 +1120,16 @@ class Database:
             return int(n)
 
     async def count_course_checked(self, *, exclude_group_code: str, date_str: str, slot: str) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            return sum(board.checked(g) for g in board.groups(exclude_group_code=exclude_group_code))
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT COUNT(*) "
                 "FROM cadets c "
-                "JOIN checkins ch ON ch.tg_user_id = c.tg_user_id "
+                f"JOIN {self._checkins_for(date_str)} ch ON ch.tg_user_id = c.tg_user_id "
                 "WHERE c.is_active = 1 AND c.group_code <> ? AND ch.date = ? AND ch.slot = ?",
                 (exclude_group_code, date_str, slot),
             )
@@ -176,11 +1137,16 @@ class Database:
             return int(n)
 
     async def missing_by_group(self, group_code: str, date_str: str, slot: str) -> list[tuple[str, str | None, str | None]]:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            return board.missing(group_code)
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT c.full_name, c.username, c.phone "
                 "FROM cadets c "
-                "LEFT JOIN checkins ch "
+                f"LEFT JOIN {self._checkins_for(date_str)} ch "
                 "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ? "
                 "WHERE c.is_active = 1 AND c.group_code = ? AND ch.tg_user_id IS NULL "
                 "ORDER BY c.full_name",
@@ -192,11 +1158,20 @@ class Database:
     async def missing_all_groups(
         self, date_str: str, slot: str, officers_group_code: str
     ) -> list[tuple[str, str, str | None, str | None]]:
-        async with aiosqlite.connect(self._db_path) as db:
+        await self.sync_shared()
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            return [
+                (g, *row)
+                for g in board.groups(exclude_group_code=officers_group_code)
+                for row in board.missing(g)
+            ]
+
+        async with self._read() as db:
             cur = await db.execute(
                 "SELECT c.group_code, c.full_name, c.username, c.phone "
                 "FROM cadets c "
-                "LEFT JOIN checkins ch "
+                f"LEFT JOIN {self._checkins_for(date_str)} ch "
                 "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ? "
                 "WHERE c.is_active = 1 AND c.group_code <> ? AND ch.tg_user_id IS NULL "
                 "ORDER BY c.group_code, c.full_name",
@@ -204,3 +1179,555 @@ class Database:
             )
             rows = await cur.fetchall()
             return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+    async def missing_user_ids(
+        self, date_str: str, slot: str, *, exclude_group_code: str
+    ) -> list[tuple[int, str]]:
+        """
+        (tg_user_id, group_code) всех активных курсантов, ещё не отметившихся
+        за (date, slot), — одним антиджойном, без запросов по каждому курсанту.
+        """
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT c.tg_user_id, c.group_code "
+                "FROM cadets c "
+                f"LEFT JOIN {self._checkins_for(date_str)} ch "
+                "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ? "
+                "WHERE c.is_active = 1 AND c.group_code <> ? AND ch.tg_user_id IS NULL",
+                (date_str, slot, exclude_group_code),
+            )
+            rows = await cur.fetchall()
+            return [(r[0], r[1]) for r in rows]
+
+    async def attendance_report(
+        self,
+        date_str: str,
+        slot: str,
+        *,
+        group_code: str | None = None,
+        exclude_group_code: str | None = None,
+    ) -> AttendanceReport:
+        """
+        Всего/отметились/неотметившиеся за один проход по cadets LEFT JOIN checkins:
+        либо по одной группе (group_code), либо по курсу (exclude_group_code).
+        """
+        await self.sync_shared()
+        board = self._board_for(date_str, slot)
+        if board is not None:
+            if group_code is not None:
+                group_codes = [group_code] if board.total(group_code) else []
+            else:
+                group_codes = board.groups(exclude_group_code=exclude_group_code)
+            return AttendanceReport(
+                groups=[(g, board.total(g), board.checked(g)) for g in group_codes],
+                missing=[(g, *row) for g in group_codes for row in board.missing_rows(g)],
+            )
+
+        if group_code is not None:
+            where, param = "c.group_code = ?", group_code
+        else:
+            where, param = "c.group_code <> ?", exclude_group_code
+
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT c.group_code, ch.tg_user_id IS NOT NULL, "
+                "  CASE WHEN ch.tg_user_id IS NULL THEN c.full_name END, "
+                "  CASE WHEN ch.tg_user_id IS NULL THEN c.username END, "
+                "  CASE WHEN ch.tg_user_id IS NULL THEN c.phone END, "
+                "  c.tg_user_id "
+                "FROM cadets c "
+                f"LEFT JOIN {self._checkins_for(date_str)} ch "
+                "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ? "
+                f"WHERE c.is_active = 1 AND {where} "
+                "ORDER BY c.group_code, c.full_name, c.tg_user_id",
+                (date_str, slot, param),
+            )
+            rows = await cur.fetchall()
+
+        groups: dict[str, list[int]] = {}
+        missing: list[tuple[str, str, str | None, str | None, int]] = []
+        for g, checked, full_name, username, phone, tg_user_id in rows:
+            counts = groups.setdefault(g, [0, 0])
+            counts[0] += 1
+            if checked:
+                counts[1] += 1
+            else:
+                missing.append((g, full_name, username, phone, tg_user_id))
+
+        return AttendanceReport(
+            groups=[(g, t, c) for g, (t, c) in groups.items()],
+            missing=missing,
+        )
+
+    async def iter_attendance(
+        self,
+        date_from: str,
+        date_to: str,
+        *,
+        group_code: str | None = None,
+        exclude_group_code: str | None = None,
+        batch: int = EXPORT_FETCH_BATCH,
+    ):
+        """
+        Построчно (date, slot, group_code, full_name, username, phone, created_at
+        отметки или None) по каждому окну периода, в котором были отметки,
+        и каждому активному курсанту.
+
+        Окна (их не больше двух на день) читаются списком, дальше на каждое —
+        свой запрос, который идёт по idx_cadets_active_group_name уже в
+        нужном порядке, а отметку берёт поиском по ключу. Сортировки всего
+        результата во временном B-дереве нет, строки читаются курсором пачками
+        по batch, поэтому память не зависит от длины периода. Все запросы —
+        в одной читающей транзакции, так что выгрузка видит один снимок базы.
+        """
+        if group_code is not None:
+            where, param = "c.group_code = ?", group_code
+        else:
+            where, param = "c.group_code <> ?", exclude_group_code
+        source = self._checkins_for(date_from)
+
+        async with self._read() as db:
+            await db.execute("BEGIN")
+            try:
+                cur = await db.execute(
+                    f"SELECT DISTINCT date, slot FROM {source} WHERE date BETWEEN ? AND ?",
+                    (date_from, date_to),
+                )
+                windows = sorted(await cur.fetchall())
+                for date_str, slot in windows:
+                    cur = await db.execute(
+                        "SELECT c.group_code, c.full_name, c.username, c.phone, "
+                        f"  (SELECT ch.created_at FROM {source} ch "
+                        "   WHERE ch.tg_user_id = c.tg_user_id AND ch.date = ? AND ch.slot = ?) "
+                        "FROM cadets c "
+                        f"WHERE c.is_active = 1 AND {where} "
+                        "ORDER BY c.group_code, c.full_name",
+                        (date_str, slot, param),
+                    )
+                    while True:
+                        rows = await cur.fetchmany(batch)
+                        if not rows:
+                            break
+                        for row in rows:
+                            yield (date_str, slot, *row)
+            finally:
+                await db.rollback()
+
+    async def save_report_snapshots(
+        self, date_str: str, slot: str, snapshots: dict[str, tuple[AttendanceReport, str]]
+    ) -> None:
+        """
+        Сохраняет итоги окна по областям (scope -> (отчёт, текст)).
+        Уже записанные области не перезаписываются.
+        """
+        created_at = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (
+                date_str,
+                slot,
+                scope,
+                json.dumps({"groups": report.groups, "missing": report.missing}, ensure_ascii=False),
+                text,
+                created_at,
+            )
+            for scope, (report, text) in snapshots.items()
+        ]
+        async with self._write() as db:
+            await db.executemany(
+                "INSERT OR IGNORE INTO report_snapshots(date, slot, scope, data, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        for scope, snapshot in snapshots.items():
+            self._cache_snapshot((date_str, slot, scope), snapshot)
+
+    async def get_report_snapshot(
+        self, date_str: str, slot: str, scope: str
+    ) -> tuple[AttendanceReport, str] | None:
+        key = (date_str, slot, scope)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            self._snapshots.move_to_end(key)
+            return snapshot
+
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT data, text FROM report_snapshots WHERE date = ? AND slot = ? AND scope = ?",
+                key,
+            )
+            row = await cur.fetchone()
+        if not row:
+            return None
+
+        data = json.loads(row[0])
+        # В снимках, записанных до страниц по ключу, нет tg_user_id:
+        # ключом строки служит её номер — он тоже уникален и идёт по порядку
+        report = AttendanceReport(
+            groups=[tuple(g) for g in data["groups"]],
+            missing=[tuple(m) if len(m) == 5 else (*m, i) for i, m in enumerate(data["missing"], start=1)],
+        )
+        snapshot = (report, row[1])
+        self._cache_snapshot(key, snapshot)
+        return snapshot
+
+    def _cache_snapshot(self, key: tuple[str, str, str], snapshot: tuple[AttendanceReport, str]) -> None:
+        self._snapshots[key] = snapshot
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > SNAPSHOT_CACHE_MAX:
+            self._snapshots.popitem(last=False)
+
+    async def rollup_pending_dates(self, before: str) -> list[str]:
+        """
+        Дни с отметками до before (не включая), ещё не свёрнутые в итоги.
+        Берутся только дни после последнего свёрнутого, так что запрос
+        читает диапазон индекса, а не всю историю.
+        """
+        async with self._read() as db:
+            cur = await db.execute("SELECT COALESCE(MAX(date), '') FROM rollup_days")
+            (last,) = await cur.fetchone()
+            cur = await db.execute(
+                f"SELECT DISTINCT date FROM {self._checkins_for(last)} WHERE date > ? AND date < ? ORDER BY date",
+                (last, before),
+            )
+            return [r[0] for r in await cur.fetchall()]
+
+    async def rollup_day(self, date_str: str, *, exclude_group_code: str) -> int:
+        """
+        Сворачивает закрытый день: по строке на активного курсанта (кроме
+        exclude_group_code), зарегистрированного не позже этого дня, — маски
+        отмеченных и положенных по расписанию окон, и итоги по группам на
+        каждое положенное группе окно. Возвращает число курсантов.
+        """
+        bits = dict(rollup_slot_bits())
+        # Имена окон — из SLOT_SCHEDULE: в запрос только параметрами
+        cases = " ".join("WHEN ? THEN ?" for _ in bits)
+        case_params = [value for slot_bit in bits.items() for value in slot_bit]
+        async with self._read() as db:
+            cur = await db.execute(
+                f"SELECT c.tg_user_id, c.group_code, COALESCE(SUM(CASE ch.slot {cases} ELSE 0 END), 0) "
+                "FROM cadets c "
+                f"LEFT JOIN {self._checkins_for(date_str)} ch "
+                "  ON ch.tg_user_id = c.tg_user_id AND ch.date = ? "
+                "WHERE c.is_active = 1 AND c.group_code <> ? AND substr(c.created_at, 1, 10) <= ? "
+                "GROUP BY c.tg_user_id",
+                (*case_params, date_str, exclude_group_code, date_str),
+            )
+            rows = await cur.fetchall()
+
+        day = date.fromisoformat(date_str)
+        slots_by_group: dict[str, list[tuple[str, int]]] = {}
+        groups: dict[tuple[str, str], list[int]] = {}
+        cadet_rows = []
+        for tg_user_id, group_code, checked in rows:
+            slots = slots_by_group.get(group_code)
+            if slots is None:
+                slots = slots_by_group[group_code] = [
+                    (s.slot, bits[s.slot]) for s in schedule().slots_on(day, group_code)
+                ]
+            expected = 0
+            for slot, bit in slots:
+                expected |= bit
+                counts = groups.setdefault((slot, group_code), [0, 0])
+                counts[0] += 1
+                if checked & bit:
+                    counts[1] += 1
+            cadet_rows.append((tg_user_id, date_str, group_code, checked, expected))
+
+        created_at = datetime.now(timezone.utc).isoformat()
+        async with self._write() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO rollup_cadet_daily(tg_user_id, date, group_code, checked, expected) "
+                "VALUES (?, ?, ?, ?, ?)",
+                cadet_rows,
+            )
+            await db.executemany(
+                "INSERT OR REPLACE INTO rollup_group_daily(date, slot, group_code, total, checked) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(date_str, slot, g, total, checked) for (slot, g), (total, checked) in groups.items()],
+            )
+            await db.execute(
+                "INSERT OR REPLACE INTO rollup_days(date, created_at) VALUES (?, ?)",
+                (date_str, created_at),
+            )
+        return len(rows)
+
+    async def rollup_last_date(self) -> str | None:
+        async with self._read() as db:
+            cur = await db.execute("SELECT MAX(date) FROM rollup_days")
+            (last,) = await cur.fetchone()
+            return last
+
+    async def group_rollups(
+        self, date_from: str, date_to: str, *, exclude_group_code: str
+    ) -> list[tuple[str, int, int]]:
+        """(group_code, ожидалось отметок, отметились) за период по всем окнам."""
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT group_code, SUM(total), SUM(checked) "
+                "FROM rollup_group_daily "
+                "WHERE date BETWEEN ? AND ? AND group_code <> ? "
+                "GROUP BY group_code "
+                "ORDER BY group_code",
+                (date_from, date_to, exclude_group_code),
+            )
+            rows = await cur.fetchall()
+            return [(r[0], int(r[1]), int(r[2])) for r in rows]
+
+    async def cadet_rollups(
+        self, group_code: str, date_from: str, date_to: str
+    ) -> list[tuple[int, str, str, int, int]]:
+        """
+        (tg_user_id, full_name, date, маска отмеченных окон, маска положенных
+        окон) курсантов группы за период, по курсанту подряд в порядке дат.
+        """
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT r.tg_user_id, COALESCE(c.full_name, ''), r.date, r.checked, r.expected "
+                "FROM rollup_cadet_daily r "
+                "LEFT JOIN cadets c ON c.tg_user_id = r.tg_user_id "
+                "WHERE r.group_code = ? AND r.date BETWEEN ? AND ? "
+                "ORDER BY r.tg_user_id, r.date",
+                (group_code, date_from, date_to),
+            )
+            rows = await cur.fetchall()
+            return [(r[0], r[1], r[2], r[3], r[4]) for r in rows]
+
+    async def fsm_get(self, key: str) -> tuple[str | None, str, float] | None:
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+                (key,),
+            )
+            row = await cur.fetchone()
+            return (row[0], row[1], row[2]) if row else None
+
+    async def fsm_save_many(self, upserts: list[tuple[str, str | None, str, float]], deletes: list[str]) -> None:
+        """
+        upserts: (key, state, data_json, updated_at); deletes: ключи очищенных состояний.
+        Всё пишется одной транзакцией.
+        """
+        async with self._write() as db:
+            if upserts:
+                await db.executemany(
+                    "INSERT INTO fsm_states(key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET "
+                    "state=excluded.state, data=excluded.data, updated_at=excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                await db.executemany(
+                    "DELETE FROM fsm_states WHERE key = ?",
+                    [(k,) for k in deletes],
+                )
+
+    async def fsm_delete_expired(self, before: float) -> int:
+        async with self._write() as db:
+            cur = await db.execute(
+                "DELETE FROM fsm_states WHERE updated_at < ?",
+                (before,),
+            )
+            return cur.rowcount
+
+    async def list_groups(self) -> list[str]:
+        """Реестр учебных групп курса в порядке показа."""
+        async with self._read() as db:
+            cur = await db.execute("SELECT group_code FROM cadet_groups ORDER BY position, group_code")
+            return [r[0] for r in await cur.fetchall()]
+
+    async def set_groups(self, group_codes: list[str]) -> None:
+        async with self._write() as db:
+            await db.execute("DELETE FROM cadet_groups")
+            await db.executemany(
+                "INSERT INTO cadet_groups(group_code, position) VALUES (?, ?)",
+                [(g, i) for i, g in enumerate(group_codes)],
+            )
+
+    async def list_tenants(self) -> list[tuple[str, str, str]]:
+        """(code, title, db_path) курсов — только в основной базе."""
+        async with self._read() as db:
+            cur = await db.execute("SELECT code, title, db_path FROM tenants ORDER BY position, code")
+            return [(r[0], r[1], r[2]) for r in await cur.fetchall()]
+
+    async def upsert_tenant(self, code: str, title: str, db_path: str) -> None:
+        async with self._write() as db:
+            await db.execute(
+                "INSERT INTO tenants(code, title, db_path, position) "
+                "VALUES (?, ?, ?, (SELECT COUNT(*) FROM tenants)) "
+                "ON CONFLICT(code) DO UPDATE SET title=excluded.title, db_path=excluded.db_path",
+                (code, title, db_path),
+            )
+
+    async def get_user_tenant(self, tg_user_id: int) -> str | None:
+        async with self._read() as db:
+            cur = await db.execute("SELECT tenant FROM tenant_users WHERE tg_user_id = ?", (tg_user_id,))
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def set_user_tenant(self, tg_user_id: int, tenant: str) -> None:
+        async with self._write() as db:
+            await db.execute(
+                "INSERT INTO tenant_users(tg_user_id, tenant) VALUES (?, ?) "
+                "ON CONFLICT(tg_user_id) DO UPDATE SET tenant=excluded.tenant",
+                (tg_user_id, tenant),
+            )
+
+    async def enqueue_outbox(self, rows: list[tuple], expires_at: float | None = None) -> int:
+        """
+        rows: (job, date, slot, chat_id, text, reply_markup_json) — одной
+        транзакцией. Уже поставленные (тот же ключ) пропускаются; возвращает
+        число новых сообщений.
+        """
+        now = time.time()
+        async with self._write() as db:
+            cur = await db.executemany(
+                "INSERT OR IGNORE INTO outbox(job, date, slot, chat_id, text, reply_markup, next_at, expires_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*row, now, expires_at, now) for row in rows],
+            )
+            return max(cur.rowcount, 0)
+
+    async def claim_outbox(self, limit: int, claim_s: float) -> list[tuple]:
+        """
+        Берёт в отправку до limit сообщений, срок которых настал:
+        (id, job, chat_id, text, reply_markup, attempts, expires_at).
+        next_at сдвигается на claim_s — если процесс упадёт посреди
+        отправки, сообщения снова станут доступны.
+        """
+        now = time.time()
+        async with self._write() as db:
+            cur = await db.execute(
+                "UPDATE outbox SET next_at = ? "
+                "WHERE id IN ("
+                "  SELECT id FROM outbox WHERE status = 'pending' AND next_at <= ? ORDER BY next_at LIMIT ?"
+                ") "
+                "RETURNING id, job, chat_id, text, reply_markup, attempts, expires_at",
+                (now + claim_s, now, limit),
+            )
+            return await cur.fetchall()
+
+    async def finish_outbox(
+        self,
+        sent: list[int],
+        retry: list[tuple[int, float, str]],
+        done: list[tuple[int, str, str]],
+    ) -> None:
+        """
+        Итоги отправки одной транзакцией: sent — id доставленных;
+        retry — (id, next_at, ошибка); done — (id, status, ошибка) для
+        сообщений, которые больше не отправляются (failed/expired).
+        """
+        now = time.time()
+        async with self._write() as db:
+            if sent:
+                await db.executemany(
+                    "UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_at = ? WHERE id = ?",
+                    [(now, i) for i in sent],
+                )
+            if retry:
+                await db.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, next_at = ?, last_error = ? WHERE id = ?",
+                    [(next_at, error, i) for i, next_at, error in retry],
+                )
+            if done:
+                await db.executemany(
+                    "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    [(status, error, i) for i, status, error in done],
+                )
+
+    async def purge_outbox(self, older_than_s: float) -> int:
+        """Удаляет обработанные сообщения старше older_than_s секунд."""
+        async with self._write() as db:
+            cur = await db.execute(
+                "DELETE FROM outbox WHERE status <> 'pending' AND created_at < ?",
+                (time.time() - older_than_s,),
+            )
+            return cur.rowcount
+
+    async def try_acquire_lease(self, name: str, holder: str, ttl_s: float) -> bool:
+        """
+        Захват или продление аренды name. Удаётся, если аренда свободна,
+        истекла или уже принадлежит holder.
+        """
+        now = time.time()
+        async with self._write() as db:
+            cur = await db.execute(
+                "INSERT INTO leases(name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + ttl_s, now),
+            )
+            return cur.rowcount == 1
+
+    async def release_lease(self, name: str, holder: str) -> None:
+        async with self._write() as db:
+            await db.execute(
+                "DELETE FROM leases WHERE name = ? AND holder = ?",
+                (name, holder),
+            )
+
+    async def archive_checkins_batch(self, limit: int = ARCHIVE_BATCH) -> int:
+        """
+        Переносит в архив до limit отметок старше горизонта хранения одной
+        короткой транзакцией. Возвращает число перенесённых строк
+        (меньше limit — переносить больше нечего).
+        """
+        if self._archive_path is None:
+            return 0
+        async with self._write() as db:
+            cur = await db.execute(
+                "SELECT id FROM checkins WHERE date < ? ORDER BY date LIMIT ?",
+                (self._history_cutoff(), limit),
+            )
+            ids = [r[0] for r in await cur.fetchall()]
+            if not ids:
+                return 0
+            marks = ",".join("?" * len(ids))
+            await db.execute(
+                "INSERT OR IGNORE INTO archive.checkins(id, tg_user_id, date, slot, created_at) "
+                f"SELECT id, tg_user_id, date, slot, created_at FROM checkins WHERE id IN ({marks})",
+                ids,
+            )
+            await db.execute(f"DELETE FROM checkins WHERE id IN ({marks})", ids)
+        return len(ids)
+
+    async def enable_incremental_vacuum(self) -> bool:
+        """
+        Переводит базу, созданную без auto_vacuum, в INCREMENTAL одним VACUUM.
+        VACUUM перестраивает файл целиком, поэтому его запускает только
+        ночная задача архива у лидера, и только пока база не переведена.
+        Возвращает True, если файл перестроен сейчас. Если файл занят
+        другим процессом — попробуем в следующую ночь.
+        """
+        if self._archive_path is None:
+            return False
+        async with self._write_lock:
+            cur = await self._writer.execute("PRAGMA auto_vacuum")
+            (mode,) = await cur.fetchone()
+            if mode == 2:
+                return False
+            try:
+                await self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await self._writer.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                log.warning("auto_vacuum: VACUUM skipped: %s", e)
+                return False
+        return True
+
+    async def reclaim_space(self, max_pages: int = 0) -> int:
+        """
+        Возвращает ОС свободные страницы (auto_vacuum = INCREMENTAL).
+        max_pages = 0 — все. Возвращает число освобождённых страниц.
+        """
+        async with self._write() as db:
+            cur = await db.execute("PRAGMA freelist_count")
+            (before,) = await cur.fetchone()
+            cur = await db.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            await cur.fetchall()
+            cur = await db.execute("PRAGMA freelist_count")
+            (after,) = await cur.fetchone()
+        return before - after
+
+# Время каждого публичного метода — в метрику bot_db_seconds
+for _name, _method in list(vars(Database).items()):
+    if not _name.startswith("_") and inspect.iscoroutinefunction(_method):
+        setattr(Database, _name, timed_db(_method))
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+log = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_S = 1.0
+EXPIRE_INTERVAL_S = 600.0
+
+
+@dataclass
+class _Record:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states той же базы.
+
+    Перед базой стоит LRU-кэш не больше cache_max записей (включая «пустые»:
+    FSM-middleware читает состояние на каждом апдейте). Изменения копятся
+    в кэше и раз в FLUSH_INTERVAL_S пишутся одной транзакцией; вытесненные
+    из кэша несохранённые записи уходят в ту же пачку. Состояния, которые
+    не менялись дольше ttl_s (брошенная регистрация), удаляются.
+
+    shared=True — апдейты одного пользователя могут попасть в разные
+    процессы: изменения пишутся сразу, а кэш сбрасывается, как только
+    база увидела чужой коммит (db.external_epoch).
+    """
+
+    def __init__(self, db, *, cache_max: int = 1000, ttl_s: float = 86400.0, shared: bool = False):
+        self._db = db
+        self._cache_max = max(1, cache_max)
+        self._ttl_s = ttl_s
+        self._shared = shared
+        self._epoch = 0
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._evicted: dict[str, _Record] = {}
+        self._flusher: asyncio.Task | None = None
+
+    async def _load(self, key: StorageKey) -> tuple[str, _Record]:
+        k = self._key_builder.build(key)
+        if self._shared:
+            await self._db.sync_shared()
+            if self._db.external_epoch != self._epoch:
+                self._epoch = self._db.external_epoch
+                self._cache = OrderedDict((c, r) for c, r in self._cache.items() if c in self._dirty)
+        record = self._cache.get(k)
+        if record is not None:
+            self._cache.move_to_end(k)
+            return k, record
+
+        record = self._evicted.pop(k, None)
+        if record is not None:
+            self._dirty.add(k)
+        else:
+            row = await self._db.fsm_get(k)
+            record = self._cache.get(k)  # мог появиться, пока ждали базу
+            if record is None:
+                record = _Record()
+                if row is not None and row[2] >= time.time() - self._ttl_s:
+                    record = _Record(state=row[0], data=json.loads(row[1]), updated_at=row[2])
+
+        self._cache[k] = record
+        self._evict()
+        return k, record
+
+    def _touch(self, k: str, record: _Record) -> None:
+        record.updated_at = time.time()
+        self._dirty.add(k)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _evict(self) -> None:
+        while len(self._cache) > self._cache_max:
+            k, record = self._cache.popitem(last=False)
+            if k in self._dirty:
+                self._dirty.discard(k)
+                self._evicted[k] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, record = await self._load(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(k, record)
+        if self._shared:
+            await self.flush()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, record = await self._load(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        k, record = await self._load(key)
+        record.data = data.copy()
+        self._touch(k, record)
+        if self._shared:
+            await self.flush()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, record = await self._load(key)
+        return record.data.copy()
+
+    async def flush(self) -> None:
+        batch = {k: self._cache[k] for k in self._dirty if k in self._cache}
+        batch.update(self._evicted)
+        self._dirty.clear()
+        self._evicted.clear()
+        if not batch:
+            return
+
+        upserts = []
+        deletes = []
+        for k, record in batch.items():
+            if record.empty:
+                deletes.append(k)
+            else:
+                upserts.append((k, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+        try:
+            await self._db.fsm_save_many(upserts, deletes)
+        except BaseException:
+            # Не потерять изменения: вернуть пачку в очередь на следующий сброс
+            for k, record in batch.items():
+                if k in self._cache:
+                    self._dirty.add(k)
+                else:
+                    self._evicted.setdefault(k, record)
+            raise
+
+    async def expire(self) -> None:
+        before = time.time() - self._ttl_s
+        stale = [k for k, r in self._cache.items() if not r.empty and r.updated_at < before]
+        for k in stale:
+            self._cache[k] = _Record()
+            self._dirty.add(k)
+        await self.flush()
+        n = await self._db.fsm_delete_expired(before)
+        if n:
+            log.info("fsm: expired %d stale states", n)
+
+    async def _flush_loop(self) -> None:
+        last_expire = time.monotonic()
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_S)
+            try:
+                await self.flush()
+                if time.monotonic() - last_expire >= EXPIRE_INTERVAL_S:
+                    last_expire = time.monotonic()
+                    await self.expire()
+            except Exception:
+                log.exception("fsm flush failed")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
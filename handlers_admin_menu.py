@@ -1,6 +1,7 @@
-from datetime import timedelta
+from contextlib import suppress
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery
 
 from keyboards import (
@@ -12,10 +13,15 @@ from keyboards import (
     officer_groups_kb,
     OFFICERS_GROUP_CODE,
 )
-from time_utils import now_msk, date_str_msk, current_slot, MORNING, EVENING, SLOT_MORNING, SLOT_EVENING
-from reporting import build_missing_report_all, build_missing_report_one_group
+from time_utils import now_msk, date_str_msk, current_slot, last_closed_slot_and_date
+from report_pages import KIND_MISSING, KIND_REGISTERED, PAGE_CALLBACK_PREFIX, PageRequest, render_page, report_scopes
+from report_snapshots import COURSE_SCOPE
+from tenants import TenantRequiredMiddleware
 
 router = Router()
+# Без курса (db=None) — только регистрация
+router.message.middleware(TenantRequiredMiddleware())
+router.callback_query.middleware(TenantRequiredMiddleware())
 
 
 def is_officer(user_id: int, officer_ids: set[int]) -> bool:
@@ -34,51 +40,6 @@ def format_contact(username: str | None, phone: str | None) -> str:
     return ""
 
 
-def _split_long_text(text: str, max_len: int = 3500) -> list[str]:
-    lines = text.splitlines()
-    parts: list[str] = []
-    buf: list[str] = []
-    cur = 0
-    for line in lines:
-        add = len(line) + 1
-        if buf and cur + add > max_len:
-            parts.append("\n".join(buf))
-            buf = []
-            cur = 0
-        buf.append(line)
-        cur += add
-    if buf:
-        parts.append("\n".join(buf))
-    return parts
-
-
-def last_closed_slot_and_date(dt) -> tuple[str, str]:
-    """
-    Возвращает (date_str, slot) для последнего ЗАКРЫТОГО окна доклада.
-    При окнах:
-      утро: 07:00–07:30
-      вечер: 21:30–22:00
-    Логика:
-      - до закрытия утреннего окна -> последний закрытый = вчерашний вечер
-      - после закрытия утреннего и до закрытия вечернего -> последний закрытый = утро сегодня
-      - после закрытия вечернего -> последний закрытый = вечер сегодня
-    """
-    t = dt.timetz().replace(tzinfo=None)
-
-    if t <= MORNING.close:
-        prev = dt - timedelta(days=1)
-        return date_str_msk(prev), SLOT_EVENING
-
-    if t <= EVENING.close:
-        return date_str_msk(dt), SLOT_MORNING
-
-    return date_str_msk(dt), SLOT_EVENING
-
-
-def slot_label(slot: str) -> str:
-    return "Утренний" if slot == SLOT_MORNING else "Вечерний"
-
-
 @router.message(F.text == BTN_LAST_REPORT)
 async def last_report_stats(message: Message, db, config):
     user_id = message.from_user.id
@@ -90,23 +51,12 @@ async def last_report_stats(message: Message, db, config):
         return
 
     dt = now_msk()
-    rep_date, rep_slot = last_closed_slot_and_date(dt)
-    rep_title = f"{slot_label(rep_slot)} отчёт ({rep_date})"
 
     if officer:
-        total = await db.count_course_total(exclude_group_code=OFFICERS_GROUP_CODE)
-        checked = await db.count_course_checked(exclude_group_code=OFFICERS_GROUP_CODE, date_str=rep_date, slot=rep_slot)
-
-        rows = await db.missing_all_groups(rep_date, rep_slot, OFFICERS_GROUP_CODE)
-        report = build_missing_report_all(rows)
-
-        text = (
-            f"{rep_title}\n"
-            f"Отметились {checked}/{total} курсантов\n\n"
-            f"{report}"
-        )
-        for part in _split_long_text(text):
-            await message.answer(part)
+        rep_date, rep_slot = last_closed_slot_and_date(dt)
+        for scope in report_scopes(rep_slot):
+            text, markup = await render_page(db, PageRequest(KIND_MISSING, scope, rep_date, rep_slot))
+            await message.answer(text, reply_markup=markup)
         return
 
     # admin-cadet
@@ -115,20 +65,33 @@ async def last_report_stats(message: Message, db, config):
         await message.answer("Команда недоступна: вы не зарегистрированы как курсант.")
         return
 
-    group_code = cadet["group_code"]
-    total = await db.count_group_total(group_code)
-    checked = await db.count_group_checked(group_code, rep_date, rep_slot)
+    rep_date, rep_slot = last_closed_slot_and_date(dt, cadet["group_code"])
+    text, markup = await render_page(db, PageRequest(KIND_MISSING, cadet["group_code"], rep_date, rep_slot))
+    await message.answer(text, reply_markup=markup)
 
-    missing = await db.missing_by_group(group_code, rep_date, rep_slot)
-    report = build_missing_report_one_group(group_code, missing)
 
-    text = (
-        f"{rep_title}\n"
-        f"Отметились {checked}/{total} курсантов\n\n"
-        f"{report}"
-    )
-    for part in _split_long_text(text):
-        await message.answer(part)
+@router.callback_query(F.data.startswith(PAGE_CALLBACK_PREFIX))
+async def report_page(cb: CallbackQuery, db, config):
+    req = PageRequest.parse(cb.data)
+    if req is None:
+        await cb.answer()
+        return
+
+    # Офицеры листают любые списки, админ-курсант — только своей группы
+    user_id = cb.from_user.id
+    allowed = is_officer(user_id, config.officer_ids)
+    if not allowed and req.scope != COURSE_SCOPE and is_admin_cadet(user_id, config.admin_ids, config.officer_ids):
+        cadet = await db.get_cadet(user_id)
+        allowed = cadet is not None and cadet["group_code"] == req.scope
+    if not allowed:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+
+    await cb.answer()
+    text, markup = await render_page(db, req)
+    # Повторное нажатие на ту же кнопку: текст не изменился
+    with suppress(TelegramBadRequest):
+        await cb.message.edit_text(text, reply_markup=markup)
 
 
 @router.message(F.text == BTN_NOT_REPORTED)
@@ -143,7 +106,7 @@ async def not_reported(message: Message, db, config):
         return
 
     dt = now_msk()
-    slot = current_slot(dt)
+    slot = current_slot(dt, cadet["group_code"])
     if slot is None:
         await message.answer("Не время доклада")
         return
@@ -184,33 +147,19 @@ async def admin_my_group_stats(message: Message, db, config):
         )
         return
 
-    group_code = cadet["group_code"]
-    members = await db.list_registered_in_group(group_code)
-
-    lines = [
-        "Статистика: моя группа",
-        "",
-        f"{group_code}: {len(members)}",
-        "",
-        "Список зарегистрированных:",
-    ]
-    for i, (name, username, phone) in enumerate(members, start=1):
-        c = format_contact(username, phone)
-        lines.append(f"{i}. {name}" + (f" ({c})" if c else ""))
-
-    for part in _split_long_text("\n".join(lines)):
-        await message.answer(part)
+    text, markup = await render_page(db, PageRequest(KIND_REGISTERED, cadet["group_code"]))
+    await message.answer(text, reply_markup=markup)
 
 
 @router.message(F.text == BTN_PICK_GROUP)
-async def officer_pick_group(message: Message, config):
+async def officer_pick_group(message: Message, db, config):
     user_id = message.from_user.id
     if not is_officer(user_id, config.officer_ids):
         return
 
     await message.answer(
         "Выберите учебную группу:",
-        reply_markup=officer_groups_kb(),
+        reply_markup=officer_groups_kb(await db.list_groups()),
     )
 
 
@@ -228,7 +177,7 @@ async def officer_group_stats(cb: CallbackQuery, db, config):
     await cb.message.edit_text(
         "Статистика: выбранная группа\n\n"
         f"{group_code}: {n}",
-        reply_markup=officer_groups_kb(),
+        reply_markup=officer_groups_kb(await db.list_groups()),
     )
 
 
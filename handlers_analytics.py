@@ -0,0 +1,106 @@
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery
+
+from analytics import cadet_attendance, longest_streaks, period, worst_groups
+from handlers_admin_menu import is_officer
+from keyboards import (
+    BTN_ANALYTICS,
+    ANALYTICS_PERIODS,
+    OFFICERS_GROUP_CODE,
+    analytics_kb,
+    analytics_groups_kb,
+)
+from reporting import (
+    build_cadet_rates_text,
+    build_group_rates_text,
+    build_streaks_text,
+    build_worst_groups_text,
+    split_long_text,
+)
+from tenants import TenantRequiredMiddleware
+
+router = Router()
+# Без курса (db=None) — только регистрация
+router.message.middleware(TenantRequiredMiddleware())
+router.callback_query.middleware(TenantRequiredMiddleware())
+
+ANALYTICS_TITLE = "Аналитика посещаемости"
+
+
+def _period_title(label: str, date_from: str, date_to: str) -> str:
+    return f"{label} ({date_from} — {date_to})"
+
+
+@router.message(F.text == BTN_ANALYTICS)
+async def analytics_menu(message: Message, config):
+    if not is_officer(message.from_user.id, config.officer_ids):
+        return
+    await message.answer(f"{ANALYTICS_TITLE}\n\nВыберите отчёт:", reply_markup=analytics_kb())
+
+
+@router.callback_query(F.data == "an:menu")
+async def analytics_menu_back(cb: CallbackQuery, config):
+    if not is_officer(cb.from_user.id, config.officer_ids):
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.answer()
+    await cb.message.edit_text(f"{ANALYTICS_TITLE}\n\nВыберите отчёт:", reply_markup=analytics_kb())
+
+
+@router.callback_query(F.data.startswith("an:"))
+async def analytics_report(cb: CallbackQuery, db, config):
+    """
+    Отчёты строятся по дневным итогам (rollup_*), а не по отметкам:
+    объём чтения зависит от длины периода, но не от всей истории.
+    """
+    if not is_officer(cb.from_user.id, config.officer_ids):
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+
+    parts = cb.data.split(":", 3)
+    kind = parts[1]
+    days = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    if days not in ANALYTICS_PERIODS:
+        await cb.answer()
+        return
+
+    if kind == "pick":
+        await cb.answer()
+        await cb.message.edit_text(
+            "Выберите учебную группу:", reply_markup=analytics_groups_kb(days, await db.list_groups())
+        )
+        return
+
+    await cb.answer()
+    last = await db.rollup_last_date()
+    if last is None:
+        await cb.message.answer("Итоги посещаемости ещё не подсчитаны.")
+        return
+    date_from, date_to = period(last, days)
+
+    if kind == "group" and len(parts) == 4:
+        group_code = parts[3]
+        cadets = cadet_attendance(await db.cadet_rollups(group_code, date_from, date_to))
+        cadets.sort(key=lambda c: (c.rate, c.full_name))
+        text = build_cadet_rates_text(_period_title(f"Посещаемость: {group_code}", date_from, date_to), cadets)
+    else:
+        groups = await db.group_rollups(date_from, date_to, exclude_group_code=OFFICERS_GROUP_CODE)
+        if kind == "groups":
+            text = build_group_rates_text(_period_title("Посещаемость по группам", date_from, date_to), groups)
+        elif kind == "worst":
+            text = build_worst_groups_text(
+                _period_title("Группы с худшей посещаемостью", date_from, date_to), worst_groups(groups)
+            )
+        elif kind == "streaks":
+            by_group = {
+                g: cadet_attendance(await db.cadet_rollups(g, date_from, date_to))
+                for g, _, _ in groups
+            }
+            text = build_streaks_text(
+                _period_title("Самые длинные серии пропусков", date_from, date_to), longest_streaks(by_group)
+            )
+        else:
+            return
+
+    for part in split_long_text(text):
+        await cb.message.answer(part)
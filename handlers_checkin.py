@@ -1,35 +1,79 @@
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
 
-from keyboards import BTN_CHECKIN, OFFICERS_GROUP_CODE
+from db import CheckinResult
+from keyboards import BTN_CHECKIN, CHECKIN_CALLBACK_PREFIX, OFFICERS_GROUP_CODE
 from time_utils import now_msk, date_str_msk, current_slot, slot_config
+from tenants import TenantRequiredMiddleware
 
 router = Router()
+# Без курса (db=None) — только регистрация
+router.message.middleware(TenantRequiredMiddleware())
+router.callback_query.middleware(TenantRequiredMiddleware())
 
-@router.message(F.text == BTN_CHECKIN)
-async def do_checkin(message: Message, db):
-    user_id = message.from_user.id
 
-    cadet = await db.get_cadet(user_id)
-    if not cadet:
-        await message.answer("Вы не зарегистрированы. Используйте /start.")
-        return
+def _checkin_rule(slot: str) -> dict:
+    # Отбор курсанта делает сам запрос отметки (Database.checkin)
+    return {"exclude_group_code": OFFICERS_GROUP_CODE, "group_codes": slot_config(slot).groups}
 
-    if cadet["group_code"] == OFFICERS_GROUP_CODE:
-        await message.answer("Для офицеров отметка не требуется.")
-        return
+
+@router.message(F.text == BTN_CHECKIN)
+async def do_checkin(message: Message, db, checkin_memo=None):
+    """
+    Ответы возвращаются методом (без await): в режиме вебхука aiogram отдаёт
+    их Telegram прямо в HTTP-ответе, при поллинге — отправляет сам.
+
+    Вне окна база не нужна вовсе; в окне — один запрос: проверка
+    регистрации и вставка отметки.
+    """
+    user_id = message.from_user.id
 
     dt = now_msk()
     slot = current_slot(dt)
     if slot is None:
-        await message.answer("Не время доклада")
-        return
+        return message.answer("Не время доклада")
+
+    date_str = date_str_msk(dt)
+    result = await db.checkin(user_id, date_str, slot, **_checkin_rule(slot))
+    if result is CheckinResult.NOT_REGISTERED:
+        return message.answer("Вы не зарегистрированы. Используйте /start.")
+    if result is CheckinResult.OFFICER:
+        return message.answer("Для офицеров отметка не требуется.")
+    if result is CheckinResult.NOT_IN_WINDOW:
+        return message.answer("Не время доклада")
+
+    if checkin_memo is not None:
+        # Дальше до закрытия окна повторные нажатия отвечает ThrottlingMiddleware
+        checkin_memo.remember(user_id, date_str, slot)
+    if result is CheckinResult.INSERTED:
+        return message.answer("Доклад принят.")
+    return message.answer("Доклад уже был принят.")
+
+
+@router.callback_query(F.data.startswith(CHECKIN_CALLBACK_PREFIX))
+async def do_checkin_inline(cb: CallbackQuery, db, checkin_memo=None):
+    """
+    Кнопка из напоминания (nudge_missing_cadets). Ответ — answerCallbackQuery
+    (всплывающее уведомление), без нового сообщения в чат.
+    """
+    user_id = cb.from_user.id
 
+    dt = now_msk()
     date_str = date_str_msk(dt)
-    inserted = await db.add_checkin(user_id, date_str, slot)
+    slot = current_slot(dt)
+    if slot is None or cb.data != f"{CHECKIN_CALLBACK_PREFIX}{date_str}:{slot}":
+        return cb.answer("Это время доклада уже закончилось.", show_alert=True)
+
+    result = await db.checkin(user_id, date_str, slot, **_checkin_rule(slot))
+    if result is CheckinResult.NOT_REGISTERED:
+        return cb.answer("Вы не зарегистрированы. Используйте /start.", show_alert=True)
+    if result is CheckinResult.OFFICER:
+        return cb.answer("Для офицеров отметка не требуется.")
+    if result is CheckinResult.NOT_IN_WINDOW:
+        return cb.answer("Это время доклада уже закончилось.", show_alert=True)
 
-    cfg = slot_config(slot)
-    if inserted:
-        await message.answer("Доклад принят.")
-    else:
-        await message.answer("Доклад уже был принят.")
+    if checkin_memo is not None:
+        checkin_memo.remember(user_id, date_str, slot)
+    if result is CheckinResult.INSERTED:
+        return cb.answer("Доклад принят.")
+    return cb.answer("Доклад уже был принят.")
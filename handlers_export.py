@@ -0,0 +1,63 @@
+from datetime import date
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from csv_export import SpooledInputFile, export_attendance_csv
+from handlers_admin_menu import is_officer
+from tenants import TenantRequiredMiddleware
+
+router = Router()
+# Без курса (db=None) — только регистрация
+router.message.middleware(TenantRequiredMiddleware())
+router.callback_query.middleware(TenantRequiredMiddleware())
+
+EXPORT_MAX_DAYS = 366
+EXPORT_USAGE = (
+    "Выгрузка посещаемости в CSV:\n"
+    "/export 2025-09-01 2025-12-31 — весь курс\n"
+    "/export 2025-09-01 2025-12-31 841/11 — одна группа"
+)
+
+
+def _parse_export_args(args: str | None, groups: list[str]) -> tuple[str, str, str | None] | None:
+    parts = (args or "").split()
+    if len(parts) not in (2, 3):
+        return None
+    try:
+        date_from = date.fromisoformat(parts[0])
+        date_to = date.fromisoformat(parts[1])
+    except ValueError:
+        return None
+    if date_from > date_to or (date_to - date_from).days >= EXPORT_MAX_DAYS:
+        return None
+    group_code = parts[2] if len(parts) == 3 else None
+    if group_code is not None and group_code not in groups:
+        return None
+    return date_from.isoformat(), date_to.isoformat(), group_code
+
+
+@router.message(Command("export"))
+async def export_attendance(message: Message, command: CommandObject, db, config):
+    if not is_officer(message.from_user.id, config.officer_ids):
+        return
+
+    parsed = _parse_export_args(command.args, await db.list_groups())
+    if parsed is None:
+        await message.answer(EXPORT_USAGE)
+        return
+    date_from, date_to, group_code = parsed
+
+    spool, n = await export_attendance_csv(db, date_from, date_to, group_code=group_code)
+    try:
+        if n == 0:
+            await message.answer("За этот период отметок нет.")
+            return
+        scope = group_code.replace("/", "-") if group_code else "course"
+        await message.answer_document(
+            SpooledInputFile(spool, filename=f"attendance_{scope}_{date_from}_{date_to}.csv"),
+            caption=f"Посещаемость {date_from} — {date_to}" + (f", {group_code}" if group_code else "") + f": {n} строк",
+        )
+    finally:
+        spool.close()
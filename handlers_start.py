@@ -12,6 +12,7 @@ from keyboards import (
     officer_only_kb,
     registered_kb_inline,
     role_menu_kb,
+    tenants_kb,
     OFFICERS_GROUP_CODE,
     OFFICERS_GROUP_LABEL,
 )
@@ -107,13 +108,39 @@ def normalize_ru_phone(raw: str) -> str | None:
     return "+7" + digits[1:]
 
 
+async def _registration_tenant(state: FSMContext, tenant, tenants):
+    """Курс, на который идёт регистрация: выбранный на первом шаге, иначе текущий."""
+    code = (await state.get_data()).get("tenant")
+    return tenants.get(code) if code else tenant
+
+
+async def _ask_group(send, state: FSMContext, tenant, officer: bool) -> None:
+    await state.set_state(Registration.choose_group)
+    if officer:
+        await send("Подтвердите регистрацию как офицер:", reply_markup=officer_only_kb())
+    else:
+        await send("Выберите учебную группу:", reply_markup=cadet_groups_kb(await tenant.db.list_groups()))
+
+
+async def _begin_registration(send, state: FSMContext, tenant, tenants, officer: bool) -> None:
+    # Курсов несколько — сначала выбор курса, в том числе при перерегистрации
+    if tenants.multi:
+        await state.set_state(Registration.choose_tenant)
+        await send(
+            "Выберите курс:",
+            reply_markup=tenants_kb([(t.code, t.title) for t in tenants.all()]),
+        )
+        return
+    await _ask_group(send, state, tenant, officer)
+
+
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext, db, config):
+async def cmd_start(message: Message, state: FSMContext, db, tenant, tenants, config):
     user_id = message.from_user.id
     officer, admin_cadet, show_not_reported = compute_menu_flags(user_id=user_id, config=config)
     menu = build_role_menu(officer=officer, admin_cadet=admin_cadet, show_not_reported=show_not_reported)
 
-    cadet = await db.get_cadet(user_id)
+    cadet = await db.get_cadet(user_id) if db is not None else None
 
     # Уже зарегистрирован
     if cadet:
@@ -122,7 +149,8 @@ async def cmd_start(message: Message, state: FSMContext, db, config):
         grp_label = group_label_from_code(cadet["group_code"])
         text = (
             "Вы уже зарегистрированы.\n\n"
-            f"Группа: {grp_label}\n"
+            + (f"Курс: {tenant.title}\n" if tenants.multi else "")
+            + f"Группа: {grp_label}\n"
             f"ФИО: {cadet['full_name']}\n"
         )
         await message.answer(text, reply_markup=menu)
@@ -130,50 +158,46 @@ async def cmd_start(message: Message, state: FSMContext, db, config):
         return
 
     # Не зарегистрирован: запускаем регистрацию (без показа меню)
-    await state.set_state(Registration.choose_group)
-
-    if officer:
-        await message.answer(
-            "Подтвердите регистрацию как офицер:",
-            reply_markup=officer_only_kb(),
-        )
-    else:
-        await message.answer(
-            "Выберите учебную группу:",
-            reply_markup=cadet_groups_kb(),
-        )
+    await state.set_data({})
+    await _begin_registration(message.answer, state, tenant, tenants, officer)
 
 
 @router.callback_query(F.data == "reg:restart")
-async def reg_restart(cb: CallbackQuery, state: FSMContext, config):
-    user_id = cb.from_user.id
-    officer = is_officer(user_id, config.officer_ids)
+async def reg_restart(cb: CallbackQuery, state: FSMContext, tenant, tenants, config):
+    officer = is_officer(cb.from_user.id, config.officer_ids)
 
     await cb.answer()
-    await state.set_state(Registration.choose_group)
+    await state.set_data({})
+    await _begin_registration(cb.message.edit_text, state, tenant, tenants, officer)
 
-    if officer:
-        await cb.message.edit_text(
-            "Подтвердите регистрацию как офицер:",
-            reply_markup=officer_only_kb(),
-        )
-    else:
-        await cb.message.edit_text(
-            "Выберите учебную группу:",
-            reply_markup=cadet_groups_kb(),
-        )
+
+@router.callback_query(Registration.choose_tenant, F.data.startswith("tenant:"))
+async def choose_tenant(cb: CallbackQuery, state: FSMContext, tenants, config):
+    chosen = tenants.get(cb.data.split(":", 1)[1])
+    if chosen is None:
+        await cb.answer("Курс не найден.", show_alert=True)
+        return
+
+    await cb.answer()
+    await state.update_data(tenant=chosen.code)
+    await _ask_group(cb.message.edit_text, state, chosen, is_officer(cb.from_user.id, config.officer_ids))
 
 
 @router.callback_query(Registration.choose_group, F.data.startswith("group:"))
-async def choose_group(cb: CallbackQuery, state: FSMContext, config):
+async def choose_group(cb: CallbackQuery, state: FSMContext, tenant, tenants, config):
     group_code = cb.data.split(":", 1)[1]
     user_id = cb.from_user.id
     officer = is_officer(user_id, config.officer_ids)
+    reg_tenant = await _registration_tenant(state, tenant, tenants)
+    if reg_tenant is None:
+        await cb.answer()
+        await _begin_registration(cb.message.edit_text, state, tenant, tenants, officer)
+        return
 
     # Серверная защита от подмены callback
     if not officer and group_code == OFFICERS_GROUP_CODE:
         await cb.answer("Регистрация как офицер запрещена для вашего аккаунта.", show_alert=True)
-        await cb.message.edit_text("Выберите учебную группу:", reply_markup=cadet_groups_kb())
+        await _ask_group(cb.message.edit_text, state, reg_tenant, officer)
         return
 
     if officer and group_code != OFFICERS_GROUP_CODE:
@@ -181,6 +205,12 @@ async def choose_group(cb: CallbackQuery, state: FSMContext, config):
         await cb.message.edit_text("Подтвердите регистрацию как офицер:", reply_markup=officer_only_kb())
         return
 
+    # Группа должна быть в реестре курса (кнопки могли остаться от старого списка)
+    if not officer and group_code not in await reg_tenant.db.list_groups():
+        await cb.answer("Такой группы нет на курсе.", show_alert=True)
+        await _ask_group(cb.message.edit_text, state, reg_tenant, officer)
+        return
+
     await cb.answer()
     await state.update_data(group_code=group_code)
     await state.set_state(Registration.enter_name)
@@ -192,7 +222,7 @@ async def choose_group(cb: CallbackQuery, state: FSMContext, config):
 
 
 @router.message(Registration.enter_name)
-async def enter_name(message: Message, state: FSMContext, db, config):
+async def enter_name(message: Message, state: FSMContext, tenant, tenants, config):
     full_name = normalize_full_name(message.text or "")
     if not looks_like_full_name(full_name):
         await message.answer("Некорректный формат. Введите Фамилия И. О. (например: Иванов И. И.)")
@@ -202,19 +232,23 @@ async def enter_name(message: Message, state: FSMContext, db, config):
     group_code = data.get("group_code")
     user_id = message.from_user.id
     officer = is_officer(user_id, config.officer_ids)
+    reg_tenant = await _registration_tenant(state, tenant, tenants)
+
+    if reg_tenant is None:
+        await _begin_registration(message.answer, state, tenant, tenants, officer)
+        return
 
     if not group_code:
-        await state.set_state(Registration.choose_group)
-        if officer:
-            await message.answer("Подтвердите регистрацию как офицер:", reply_markup=officer_only_kb())
-        else:
-            await message.answer("Выберите учебную группу:", reply_markup=cadet_groups_kb())
+        await _ask_group(message.answer, state, reg_tenant, officer)
         return
 
     # Дублирующая серверная защита
     if not officer and group_code == OFFICERS_GROUP_CODE:
         await state.set_state(Registration.choose_group)
-        await message.answer("Регистрация как офицер запрещена. Выберите учебную группу:", reply_markup=cadet_groups_kb())
+        await message.answer(
+            "Регистрация как офицер запрещена. Выберите учебную группу:",
+            reply_markup=cadet_groups_kb(await reg_tenant.db.list_groups()),
+        )
         return
 
     if officer and group_code != OFFICERS_GROUP_CODE:
@@ -223,7 +257,8 @@ async def enter_name(message: Message, state: FSMContext, db, config):
         return
 
     username = message.from_user.username
-    await db.upsert_cadet(tg_user_id=user_id, group_code=group_code, full_name=full_name, username=username)
+    await reg_tenant.db.upsert_cadet(tg_user_id=user_id, group_code=group_code, full_name=full_name, username=username)
+    await tenants.assign(user_id, reg_tenant)
 
     if officer:
         # Офицеру телефон не нужен: завершаем регистрацию и показываем меню
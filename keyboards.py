@@ -8,7 +8,9 @@ from aiogram.types import (
 OFFICERS_GROUP_CODE = "OFFICERS"
 OFFICERS_GROUP_LABEL = "Офицер"
 
-CADET_GROUPS: list[str] = ["841/11", "841/12", "841/13", "842/11", "842/12", "843/11", "843/12"]
+# Группы курса по умолчанию: ими заполняется реестр (db.list_groups)
+# основной базы при первом запуске, дальше список ведётся в базе
+DEFAULT_CADET_GROUPS: list[str] = ["841/11", "841/12", "841/13", "842/11", "842/12", "843/11", "843/12"]
 
 BTN_MY_GROUP = "Статистика: моя группа"
 BTN_PICK_GROUP = "Зарегистрировано: выбрать группу"
@@ -16,13 +18,18 @@ BTN_COURSE = "Зарегистрировано: весь курс"
 BTN_NOT_REPORTED = "Не доложили"
 BTN_CHECKIN = "✅ Отметиться"
 BTN_LAST_REPORT = "Статистика последнего доклада"
+BTN_ANALYTICS = "Аналитика посещаемости"
 
+ANALYTICS_PERIODS = (7, 30)
 
-def cadet_groups_kb() -> InlineKeyboardMarkup:
+CHECKIN_CALLBACK_PREFIX = "checkin:"
+
+
+def cadet_groups_kb(groups: list[str]) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     row: list[InlineKeyboardButton] = []
 
-    for i, g in enumerate(CADET_GROUPS, start=1):
+    for i, g in enumerate(groups, start=1):
         row.append(InlineKeyboardButton(text=g, callback_data=f"group:{g}"))
         if i % 2 == 0:
             rows.append(row)
@@ -33,6 +40,13 @@ def cadet_groups_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def tenants_kb(tenants: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    # (code, title) курсов, по кнопке в строке
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text=title, callback_data=f"tenant:{code}")] for code, title in tenants]
+    )
+
+
 def officer_only_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -55,6 +69,7 @@ def role_menu_kb(*, is_officer: bool, is_admin_cadet: bool, show_not_reported: b
             [KeyboardButton(text=BTN_LAST_REPORT)],
             [KeyboardButton(text=BTN_PICK_GROUP)],
             [KeyboardButton(text=BTN_COURSE)],
+            [KeyboardButton(text=BTN_ANALYTICS)],
         ]
     elif is_admin_cadet:
         rows = [
@@ -77,11 +92,11 @@ def role_menu_kb(*, is_officer: bool, is_admin_cadet: bool, show_not_reported: b
     )
 
 
-def officer_groups_kb() -> InlineKeyboardMarkup:
+def officer_groups_kb(groups: list[str]) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     row: list[InlineKeyboardButton] = []
 
-    for i, g in enumerate(CADET_GROUPS, start=1):
+    for i, g in enumerate(groups, start=1):
         row.append(InlineKeyboardButton(text=g, callback_data=f"officer:group:{g}"))
         if i % 2 == 0:
             rows.append(row)
@@ -91,3 +106,50 @@ def officer_groups_kb() -> InlineKeyboardMarkup:
 
     rows.append([InlineKeyboardButton(text="Назад", callback_data="nav:back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def analytics_kb() -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+    for kind, label in (("groups", "По группам"), ("worst", "Худшие группы"), ("streaks", "Серии пропусков")):
+        rows.append(
+            [InlineKeyboardButton(text=f"{label}: {d} дн.", callback_data=f"an:{kind}:{d}") for d in ANALYTICS_PERIODS]
+        )
+    rows.append(
+        [InlineKeyboardButton(text=f"Курсанты группы: {d} дн.", callback_data=f"an:pick:{d}") for d in ANALYTICS_PERIODS]
+    )
+    rows.append([InlineKeyboardButton(text="Назад", callback_data="nav:back")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def analytics_groups_kb(days: int, groups: list[str]) -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+    row: list[InlineKeyboardButton] = []
+
+    for i, g in enumerate(groups, start=1):
+        row.append(InlineKeyboardButton(text=g, callback_data=f"an:group:{days}:{g}"))
+        if i % 2 == 0:
+            rows.append(row)
+            row = []
+    if row:
+        rows.append(row)
+
+    rows.append([InlineKeyboardButton(text="Назад", callback_data="an:menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def pager_kb(prev_data: str | None, next_data: str | None) -> InlineKeyboardMarkup | None:
+    row: list[InlineKeyboardButton] = []
+    if prev_data:
+        row.append(InlineKeyboardButton(text="◀ Назад", callback_data=prev_data))
+    if next_data:
+        row.append(InlineKeyboardButton(text="Далее ▶", callback_data=next_data))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
+
+
+def checkin_inline_kb(date_str: str, slot: str) -> InlineKeyboardMarkup:
+    # Окно зашито в кнопку: нажатие после его закрытия не засчитается в следующее
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=BTN_CHECKIN, callback_data=f"{CHECKIN_CALLBACK_PREFIX}{date_str}:{slot}")]
+        ]
+    )
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+log = logging.getLogger(__name__)
+
+LEASE_TTL_S = 15.0
+
+
+class SchedulerLeader:
+    """
+    Выбор единственного процесса, который выполняет рассылки по расписанию.
+
+    Аренда — строка в таблице leases. Владелец продлевает её каждые ttl_s/3;
+    остальные с той же частотой пытаются её захватить и получают её, когда
+    владелец перестал продлевать (упал или завис) дольше ttl_s. Планировщик
+    стартует на паузе и снимается с неё только у владельца аренды.
+    """
+
+    def __init__(self, db, scheduler: AsyncIOScheduler, *, name: str = "scheduler", ttl_s: float = LEASE_TTL_S):
+        self._db = db
+        self._scheduler = scheduler
+        self._name = name
+        self._ttl_s = ttl_s
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                acquired = await self._db.try_acquire_lease(self._name, self.holder, self._ttl_s)
+            except Exception:
+                log.exception("lease %s: heartbeat failed", self._name)
+                acquired = False
+
+            if acquired and not self.is_leader:
+                log.info("lease %s: acquired by %s", self._name, self.holder)
+                self.is_leader = True
+                self._scheduler.resume()
+            elif not acquired and self.is_leader:
+                log.warning("lease %s: lost by %s", self._name, self.holder)
+                self.is_leader = False
+                self._scheduler.pause()
+
+            await asyncio.sleep(self._ttl_s / 3)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            self.is_leader = False
+            self._scheduler.pause()
+            # Отпускаем сразу, чтобы другой процесс не ждал истечения ttl
+            await self._db.release_lease(self._name, self.holder)
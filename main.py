@@ -1,57 +1,235 @@
 import asyncio
+import multiprocessing
+import os
+import signal
 import sys
 import logging
 
+from aiohttp import web
 from dotenv import load_dotenv
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from scheduler_init import setup_scheduler
+from scheduler_init import setup_scheduler, setup_local_scheduler
 from handlers_checkin import router as checkin_router
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from broadcaster import Broadcaster
+from outbox import Outbox
 from config import load_config
 from db import Database
+from fsm_storage import SQLiteStorage
+from leader import SchedulerLeader
+from query_profiler import QueryProfiler
+from metrics import (
+    HandlerMetricsMiddleware,
+    UpdateMetricsMiddleware,
+    instrument_scheduler,
+    start_metrics_server,
+)
+from report_pages import report_scopes
+from report_snapshots import get_slot_snapshot
+from throttling import ThrottlingMiddleware, parse_limits
+from tenants import TenantMiddleware, TenantRouter, archive_path_for, open_tenants
+from time_utils import now_msk, date_str_msk, current_slot, last_closed_slot_and_date, load_schedule, set_schedule
 
 from handlers_start import router as start_router
 from handlers_admin_menu import router as admin_menu_router
+from handlers_analytics import router as analytics_router
+from handlers_export import router as export_router
 
 
-class DependenciesMiddleware(BaseMiddleware):
-    def __init__(self, db: Database, config):
-        self._db = db
-        self._config = config
+def build_dispatcher(db: Database, tenants: TenantRouter, config) -> Dispatcher:
+    storage = SQLiteStorage(
+        db,
+        cache_max=config.fsm_cache_max,
+        ttl_s=config.fsm_ttl_hours * 3600,
+        shared=config.workers > 1,
+    )
+    dp = Dispatcher(storage=storage)
 
-    async def __call__(self, handler, event, data):
-        data["db"] = self._db
-        data["config"] = self._config
-        return await handler(event, data)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(ThrottlingMiddleware(parse_limits(config.throttle_limits)))
+    dp.update.middleware(TenantMiddleware(tenants, config))
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
 
-
-async def main():
-    load_dotenv()
-    config = load_config()
-    db = Database(config.db_path)
+    dp.include_router(start_router)
+    dp.include_router(admin_menu_router)
+    dp.include_router(analytics_router)
+    dp.include_router(export_router)
+    dp.include_router(checkin_router)
+    return dp
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, config) -> web.Application:
+    """
+    aiohttp-приложение для приёма апдейтов вебхуком.
+    handle_in_background=False: апдейт обрабатывается в рамках HTTP-запроса,
+    и если хэндлер вернул метод (например, message.answer(...) без await),
+    он уходит Telegram прямо в ответе на вебхук, без отдельного вызова Bot API.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=config.webhook_secret,
+    ).register(app, path=config.webhook_path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config, *, set_webhook: bool = True) -> None:
+    if set_webhook:
+        await bot.set_webhook(
+            url=config.webhook_base_url.rstrip("/") + config.webhook_path,
+            secret_token=config.webhook_secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    runner = web.AppRunner(build_webhook_app(dp, bot, config))
+    await runner.setup()
+    # Несколько процессов слушают один порт, соединения делит ядро
+    site = web.TCPSite(
+        runner,
+        host=config.webhook_host,
+        port=config.webhook_port,
+        reuse_port=config.workers > 1,
+    )
+    await site.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_worker(config, index: int = 0) -> None:
+    """
+    Один процесс бота. При config.workers > 1 таких процессов несколько:
+    апдейты делятся между ними на общем порту вебхука, а рассылки по
+    расписанию выполняет только держатель аренды (SchedulerLeader).
+    """
+    # Расписание окон — до всего остального: по нему строятся задачи и доска
+    if config.slot_schedule_path:
+        set_schedule(load_schedule(config.slot_schedule_path))
+
+    profiler = QueryProfiler(config.slow_query_ms) if config.slow_query_ms is not None else None
+
+    def open_database(db_path: str, archive_path: str, *, shard: bool = False) -> Database:
+        return Database(
+            db_path,
+            readers=config.db_readers,
+            checkin_batch_ms=config.checkin_batch_ms,
+            roster_cache_max=config.roster_cache_max,
+            shared=config.workers > 1,
+            profiler=profiler,
+            archive_path=archive_path,
+            retention_days=config.retention_days,
+            shard=shard,
+        )
+
+    # Основная база: курс по умолчанию, справочник курсов, FSM и аренды
+    db = open_database(config.db_path, config.archive_db_path)
     await db.init()
+    tenants = await open_tenants(
+        db, lambda path: open_database(path, archive_path_for(path), shard=True), cache_max=config.roster_cache_max
+    )
+
+    metrics_runner = None
+    if config.metrics_port:
+        metrics_runner = await start_metrics_server(config.metrics_host, config.metrics_port + index)
+
+    # Перезапуск посреди окна доклада: восстанавливаем доски из базы
+    dt = now_msk()
+    slot = current_slot(dt)
+    rep_date, rep_slot = last_closed_slot_and_date(dt)
+    for tenant in tenants.all():
+        if slot is not None:
+            await tenant.db.open_board(date_str_msk(dt), slot)
+
+        # Окно могло закрыться, пока бот не работал: достраиваем его снимки
+        if index == 0:
+            for scope in report_scopes(rep_slot):
+                await get_slot_snapshot(tenant.db, rep_date, rep_slot, scope)
 
     bot = Bot(token=config.bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
-
-    dp.update.middleware(DependenciesMiddleware(db=db, config=config))
+    dp = build_dispatcher(db, tenants, config)
+
+    local_scheduler = AsyncIOScheduler()
+    setup_local_scheduler(local_scheduler, tenants=tenants)
+    instrument_scheduler(local_scheduler)
+    local_scheduler.start()
+
+    # Рассылки стоят на паузе, пока процесс не стал лидером. Лидер, сменивший
+    # упавшего, ещё успевает выполнить задачу, пропущенную не дольше минуты.
+    scheduler = AsyncIOScheduler(job_defaults={"misfire_grace_time": 60, "coalesce": True})
+    leader = SchedulerLeader(db, scheduler)
+    # Задачи только ставят сообщения в outbox основной базы;
+    # отправляет их разборщик лидера
+    broadcaster = Broadcaster(bot, rate=config.broadcast_rate)
+    outbox = Outbox(db, broadcaster, concurrency=config.broadcast_concurrency, active=lambda: leader.is_leader)
+    setup_scheduler(scheduler, outbox=outbox, tenants=tenants, config=config)
+    instrument_scheduler(scheduler)
+    scheduler.start(paused=True)
+    leader.start()
+    outbox.start()
+
+    # start_polling сам ловит SIGINT/SIGTERM и корректно завершается;
+    # db.close() дописывает накопленные в очереди отметки до закрытия соединений.
+    try:
+        if config.bot_mode == "webhook":
+            await run_webhook(dp, bot, config, set_webhook=index == 0)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await outbox.stop()
+        await leader.stop()
+        scheduler.shutdown(wait=False)
+        local_scheduler.shutdown(wait=False)
+        await tenants.close()
+        await db.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+def _worker_entry(config, index: int) -> None:
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format=f"[worker-{index}] %(levelname)s:%(name)s:%(message)s")
+    asyncio.run(run_worker(config, index))
+
+
+def main() -> None:
+    load_dotenv()
+    config = load_config()
+    if config.workers <= 1:
+        asyncio.run(run_worker(config))
+        return
 
-    dp.include_router(start_router)
-    dp.include_router(admin_menu_router)
-    dp.include_router(checkin_router)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=_worker_entry, args=(config, i), name=f"worker-{i}")
+        for i in range(config.workers)
+    ]
+    for p in workers:
+        p.start()
 
-    scheduler = AsyncIOScheduler()
-    setup_scheduler(scheduler, bot=bot, db=db, config=config)
-    scheduler.start()
+    def forward(signum, frame):
+        for p in workers:
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
 
-    await dp.start_polling(bot)
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    for p in workers:
+        p.join()
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    main()
@@ -0,0 +1,184 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiohttp import web
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (+Inf последней), сумма]
+        self._values: dict[tuple, list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Counter | Histogram] = []
+
+UPDATE_SECONDS = Histogram("bot_update_seconds", "Full update processing time.", ("event_type",))
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Handler latency.", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised.", ("handler",))
+DB_SECONDS = Histogram("bot_db_seconds", "Database method latency.", ("method",))
+JOB_SECONDS = Histogram("bot_job_seconds", "Scheduler job duration.", ("job",), buckets=JOB_BUCKETS)
+JOB_LAG_SECONDS = Histogram("bot_job_start_lag_seconds", "Delay between scheduled and actual job start.", ("job",))
+JOB_RUNS = Counter("bot_job_runs_total", "Scheduler job outcomes.", ("job", "outcome"))
+TELEGRAM_SENDS = Counter("bot_telegram_sends_total", "Bot API send attempts by outcome.", ("outcome",))
+SHED_REQUESTS = Counter("bot_shed_requests_total", "Updates answered or dropped before handlers.", ("rule", "reason"))
+OUTBOX_MESSAGES = Counter("bot_outbox_messages_total", "Outbox messages by outcome.", ("outcome",))
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def timed_db(method):
+    """Оборачивает корутину-метод Database: время попадает в bot_db_seconds."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейта: полное время обработки по типу события."""
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, event.event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware событий (message, callback_query): к этому моменту
+    хэндлер уже выбран, и время пишется с его именем.
+    """
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def instrument_scheduler(scheduler) -> None:
+    """Задержка старта и длительность задач планировщика через его события."""
+    started: dict[str, float] = {}
+
+    def listener(event) -> None:
+        now = time.time()
+        if event.code == EVENT_JOB_SUBMITTED:
+            started[event.job_id] = time.perf_counter()
+            for run_time in event.scheduled_run_times:
+                JOB_LAG_SECONDS.observe(max(0.0, now - run_time.timestamp()), event.job_id)
+            return
+        if event.code == EVENT_JOB_MISSED:
+            JOB_RUNS.inc(event.job_id, "missed")
+            return
+
+        t0 = started.pop(event.job_id, None)
+        if t0 is not None:
+            JOB_SECONDS.observe(time.perf_counter() - t0, event.job_id)
+        JOB_RUNS.inc(event.job_id, "error" if event.code == EVENT_JOB_ERROR else "ok")
+
+    scheduler.add_listener(listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    log.info("metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+from broadcaster import SEND_OK, SEND_REJECTED, Broadcaster
+from db import OUTBOX_BATCH
+from metrics import OUTBOX_MESSAGES
+
+log = logging.getLogger(__name__)
+
+# Повтор через BACKOFF_BASE_S * 2**попытка, но не реже BACKOFF_MAX_S;
+# после MAX_ATTEMPTS попыток сообщение помечается failed
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 600.0
+MAX_ATTEMPTS = 8
+
+# Насколько сдвигается next_at у взятых в отправку
+CLAIM_S = 120.0
+# Как часто проверять очередь, если новых сообщений не ставили
+POLL_INTERVAL_S = 5.0
+# Пока процесс не лидер — как часто проверять, не стал ли
+IDLE_INTERVAL_S = 1.0
+
+# Отправленные и брошенные сообщения хранятся неделю
+KEEP_S = 7 * 24 * 3600
+
+
+def dump_markup(markup) -> str | None:
+    return markup.model_dump_json(exclude_none=True) if markup is not None else None
+
+
+def load_markup(raw: str | None):
+    if raw is None:
+        return None
+    data = json.loads(raw)
+    if "inline_keyboard" in data:
+        return InlineKeyboardMarkup.model_validate(data)
+    return ReplyKeyboardMarkup.model_validate(data)
+
+
+def backoff(attempts: int) -> float:
+    return min(BACKOFF_BASE_S * 2 ** attempts, BACKOFF_MAX_S)
+
+
+@dataclass
+class DeliveryStats:
+    """Итоги одной пачки по задаче: job — ключ задачи из outbox."""
+    job: str
+    sent: int = 0
+    retry: int = 0
+    failed: int = 0
+    expired: int = 0
+
+
+class Outbox:
+    """
+    Надёжная доставка рассылок по расписанию.
+
+    Задача ставит все свои сообщения в таблицу outbox одной транзакцией
+    (enqueue) и сразу завершается. Фоновый разборщик берёт пачки,
+    срок которых настал, отправляет через Broadcaster (его лимиты скорости)
+    не больше concurrency одновременно и записывает итоги пачкой: временные
+    ошибки — повтор с экспоненциальной задержкой, отказ Telegram или
+    исчерпанные попытки — failed, просроченные напоминания — expired.
+
+    Доставка «хотя бы раз»: если процесс упал между отправкой и записью
+    итога, сообщение уйдёт повторно после CLAIM_S.
+
+    Разборщик работает только при active() — у лидера, чтобы лимит
+    скорости бота не умножался на число процессов.
+    """
+
+    def __init__(
+        self,
+        db,
+        broadcaster: Broadcaster,
+        *,
+        concurrency: int = 10,
+        batch: int = OUTBOX_BATCH,
+        active: Callable[[], bool] = lambda: True,
+    ):
+        self._db = db
+        self._broadcaster = broadcaster
+        self._concurrency = max(1, concurrency)
+        self._batch = batch
+        self.active = active
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def enqueue(
+        self,
+        date_str: str,
+        slot: str,
+        messages: list[tuple[str, int, str, object]],
+        *,
+        expires_at: datetime | None = None,
+    ) -> int:
+        """
+        messages: (job, chat_id, text, reply_markup) — ставятся одной
+        транзакцией. job с date, slot и chat_id образуют ключ идемпотентности:
+        одному чату в рамках задачи — одно сообщение на ключ.
+        Возвращает число новых сообщений.
+        """
+        if not messages:
+            return 0
+        rows = [(job, date_str, slot, chat_id, text, dump_markup(markup)) for job, chat_id, text, markup in messages]
+        n = await self._db.enqueue_outbox(rows, expires_at.timestamp() if expires_at is not None else None)
+        OUTBOX_MESSAGES.inc("enqueued", amount=n)
+        log.info("outbox %s %s: %d queued, %d already queued", date_str, slot, n, len(rows) - n)
+        self._wake.set()
+        return n
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self.active():
+                await asyncio.sleep(IDLE_INTERVAL_S)
+                continue
+            try:
+                n = await self.drain_once()
+            except Exception:
+                log.exception("outbox: drain failed")
+                n = 0
+            if n:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        """
+        Одна пачка: взять, отправить, записать итоги. Итоги пишутся в лог
+        по каждой задаче пачки. Возвращает размер пачки.
+        """
+        rows = await self._db.claim_outbox(self._batch, CLAIM_S)
+        if not rows:
+            return 0
+
+        started = time.monotonic()
+        now = time.time()
+        sem = asyncio.Semaphore(self._concurrency)
+        sent: list[int] = []
+        retry: list[tuple[int, float, str]] = []
+        done: list[tuple[int, str, str]] = []
+        stats: dict[str, DeliveryStats] = {}
+
+        async def one(msg_id, job, chat_id, text, markup, attempts, expires_at) -> None:
+            job_stats = stats.setdefault(job, DeliveryStats(job))
+            if expires_at is not None and expires_at < time.time():
+                done.append((msg_id, "expired", "expired before delivery"))
+                job_stats.expired += 1
+                OUTBOX_MESSAGES.inc("expired")
+                return
+            async with sem:
+                outcome, error = await self._broadcaster.try_send(chat_id, text, load_markup(markup))
+            if outcome == SEND_OK:
+                sent.append(msg_id)
+                job_stats.sent += 1
+                OUTBOX_MESSAGES.inc("sent")
+            elif outcome == SEND_REJECTED or attempts + 1 >= MAX_ATTEMPTS:
+                done.append((msg_id, "failed", error))
+                job_stats.failed += 1
+                OUTBOX_MESSAGES.inc("failed")
+                log.warning("outbox %s: giving up on %s after %d attempts: %s", job, chat_id, attempts + 1, error)
+            else:
+                retry.append((msg_id, now + backoff(attempts), error))
+                job_stats.retry += 1
+                OUTBOX_MESSAGES.inc("retry")
+
+        await asyncio.gather(*(one(*row) for row in rows))
+        await self._db.finish_outbox(sent, retry, done)
+
+        duration_s = time.monotonic() - started
+        for s in stats.values():
+            log.info(
+                "outbox %s: sent=%d failed=%d retry=%d expired=%d in %.2fs",
+                s.job, s.sent, s.failed, s.retry, s.expired, duration_s,
+            )
+        return len(rows)
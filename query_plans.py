@@ -0,0 +1,174 @@
+"""
+Планы выполнения всех запросов Database на данных конкретной базы.
+
+    python -m query_plans bot.sqlite3 [--slow-ms 50]
+
+База копируется во временный файл, на копии вызываются все методы Database
+(включая записи, оба пути записи отметок и чтения из архива) с кэшем
+состава, отключённым до минимума, чтобы отработали SQL-ветки. Для каждой
+формы запроса печатаются число вызовов, время и EXPLAIN QUERY PLAN;
+полные проходы по таблицам помечены «FULL SCAN».
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from db import OUTBOX_BATCH, Database
+from keyboards import DEFAULT_CADET_GROUPS, OFFICERS_GROUP_CODE
+from query_profiler import QueryProfiler
+from report_snapshots import COURSE_SCOPE, build_slot_snapshots
+from time_utils import SLOT_MORNING, date_str_msk, now_msk
+
+PROBE_USER_ID = -1
+# Горизонт хранения копии: всё старше — в архиве
+RETENTION_DAYS = 1
+
+
+def _copy(src: str, dst: str) -> None:
+    with sqlite3.connect(f"file:{src}?mode=ro", uri=True) as source, sqlite3.connect(dst) as target:
+        source.backup(target)
+
+
+def _sample(path: str) -> tuple[int, str, str, str]:
+    """Курсант, его группа и последнее окно с отметками — параметры для запросов."""
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute("SELECT tg_user_id, group_code FROM cadets WHERE group_code <> ? LIMIT 1", (OFFICERS_GROUP_CODE,)).fetchone()
+        user_id, group_code = row if row else (PROBE_USER_ID, DEFAULT_CADET_GROUPS[0])
+        row = conn.execute("SELECT date, slot FROM checkins ORDER BY id DESC LIMIT 1").fetchone()
+        date_str, slot = row if row else (date_str_msk(now_msk()), SLOT_MORNING)
+    finally:
+        conn.close()
+    return user_id, group_code, date_str, slot
+
+
+async def _workload(db: Database, user_id: int, group_code: str, date_str: str, slot: str) -> None:
+    await db.get_cadet(user_id)
+    await db.get_cadets([user_id, PROBE_USER_ID])
+    await db.get_user_tenant(user_id)
+    await db.list_groups()
+    await db.count_registered_in_group(group_code)
+    await db.count_registered_course(exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.count_registered_by_group_course(exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.list_registered_in_group(group_code)
+    await db.registered_page(group_code, after=user_id)
+    await db.registered_page(group_code, before=user_id)
+    await db.count_group_total(group_code)
+    await db.count_course_total(exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.count_group_checked(group_code, date_str, slot)
+    await db.count_course_checked(exclude_group_code=OFFICERS_GROUP_CODE, date_str=date_str, slot=slot)
+    await db.missing_by_group(group_code, date_str, slot)
+    await db.missing_all_groups(date_str, slot, OFFICERS_GROUP_CODE)
+    await db.missing_user_ids(date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    await build_slot_snapshots(db, date_str, slot)
+    await db.get_report_snapshot(date_str, slot, COURSE_SCOPE)
+    async for _ in db.iter_attendance(date_str, date_str, group_code=group_code):
+        pass
+    await _rollup_workload(db, group_code, date_str)
+
+    await db.fsm_save_many([("probe", None, "{}", time.time())], ["probe-deleted"])
+    await db.fsm_get("probe")
+    await db.fsm_delete_expired(0)
+    await db.try_acquire_lease("probe", "probe", 1)
+    await db.release_lease("probe", "probe")
+    await db.enqueue_outbox([("probe", date_str, slot, PROBE_USER_ID, "probe", None)])
+    claimed = await db.claim_outbox(OUTBOX_BATCH, 0)
+    await db.finish_outbox([row[0] for row in claimed], [], [])
+    await db.purge_outbox(0)
+
+    await db.upsert_cadet(PROBE_USER_ID, group_code, "Probe", None)
+    await db.update_username(PROBE_USER_ID, "probe")
+    await db.update_phone(PROBE_USER_ID, None)
+    await db.add_checkin(PROBE_USER_ID, date_str, slot)
+    await db.checkin(PROBE_USER_ID, date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.checkin(PROBE_USER_ID, date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE, group_codes=frozenset([group_code]))
+    await db.open_board(date_str, slot)
+    db.close_board()
+
+
+async def _rollup_workload(db: Database, group_code: str, date_str: str) -> None:
+    """Свёртка дня, поиск несвёрнутых дней и отчёты по итогам за неделю до date_str."""
+    week_ago = (date.fromisoformat(date_str) - timedelta(days=6)).isoformat()
+    await db.rollup_day(date_str, exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.rollup_pending_dates(date_str)
+    await db.rollup_last_date()
+    await db.group_rollups(week_ago, date_str, exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.cadet_rollups(group_code, week_ago, date_str)
+
+
+async def _archive_workload(db: Database, group_code: str, slot: str) -> None:
+    """Перенос в архив и запросы по дням старше горизонта (через checkins_history)."""
+    while await db.archive_checkins_batch():
+        pass
+    date_str = (now_msk().date() - timedelta(days=RETENTION_DAYS + 1)).isoformat()
+    await db.count_group_checked(group_code, date_str, slot)
+    await db.count_course_checked(exclude_group_code=OFFICERS_GROUP_CODE, date_str=date_str, slot=slot)
+    await db.missing_by_group(group_code, date_str, slot)
+    await db.missing_all_groups(date_str, slot, OFFICERS_GROUP_CODE)
+    await db.missing_user_ids(date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    await db.attendance_report(date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    async for _ in db.iter_attendance(date_str, date_str, group_code=group_code):
+        pass
+    await _rollup_workload(db, group_code, date_str)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path")
+    parser.add_argument("--slow-ms", type=float, default=float("inf"), help="also log statements slower than this")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        sys.exit(f"{args.db_path}: no such file")
+
+    user_id, group_code, date_str, slot = _sample(args.db_path)
+    profiler = QueryProfiler(args.slow_ms)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.sqlite3")
+        _copy(args.db_path, path)
+
+        db = Database(path, roster_cache_max=1, profiler=profiler)
+        await db.init()
+        try:
+            await _workload(db, user_id, group_code, date_str, slot)
+        finally:
+            await db.close()
+
+        # Отдельно — путь группового коммита отметок
+        db = Database(path, roster_cache_max=1, checkin_batch_ms=1, profiler=profiler)
+        await db.init()
+        try:
+            await db.add_checkin(PROBE_USER_ID, date_str, slot)
+            await db.checkin(PROBE_USER_ID, date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+        finally:
+            await db.close()
+
+        db = Database(
+            path, roster_cache_max=1, profiler=profiler,
+            archive_path=os.path.join(tmp, "plans-archive.sqlite3"), retention_days=RETENTION_DAYS,
+        )
+        await db.init()
+        try:
+            await _archive_workload(db, group_code, slot)
+        finally:
+            await db.close()
+
+    print(f"# {args.db_path}: group={group_code} window={date_str}/{slot}\n")
+    for shape, stats in profiler.statements.items():
+        if stats.plan is None:
+            continue
+        flag = "  FULL SCAN" if stats.full_scans else ""
+        print(f"{shape}\n  calls={stats.calls} total={stats.total_s * 1000:.2f}ms max={stats.max_s * 1000:.2f}ms{flag}")
+        for line in stats.plan:
+            print(f"    {line}")
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
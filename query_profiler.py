@@ -0,0 +1,119 @@
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+
+import aiosqlite
+
+log = logging.getLogger(__name__)
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+_IN_LIST = re.compile(r"\bIN \(\?(\s*,\s*\?)*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+# «SCAN cadets» / «SCAN c» без USING ... INDEX — полный проход по таблице
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)\S+$")
+
+PARAMS_LOG_MAX = 200
+
+
+def statement_shape(sql: str) -> str:
+    """Текст запроса без лишних пробелов и с IN (?, ?, ...) любой длины как IN (?, ...)."""
+    return _IN_LIST.sub("IN (?, ...)", _SPACES.sub(" ", sql).strip())
+
+
+@dataclass
+class StatementStats:
+    calls: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    slow: int = 0
+    plan: list[str] | None = None
+    full_scans: list[str] = field(default_factory=list)
+
+
+class QueryProfiler:
+    """
+    Профилирование запросов Database (включается SLOW_QUERY_MS).
+
+    Замеряется время execute/executemany — до первой строки результата,
+    для запросов с ORDER BY/агрегатами это почти вся работа. Запросы
+    дольше slow_ms пишутся в лог с параметрами. Для каждой формы запроса
+    один раз снимается EXPLAIN QUERY PLAN; полные проходы по таблицам
+    отмечаются в логе.
+    """
+
+    def __init__(self, slow_ms: float = 100.0):
+        self.slow_s = slow_ms / 1000
+        self.statements: dict[str, StatementStats] = {}
+
+    def wrap(self, conn: aiosqlite.Connection) -> "ProfiledConnection":
+        return ProfiledConnection(conn, self)
+
+    async def run(self, conn: aiosqlite.Connection, method: str, sql: str, params):
+        started = time.perf_counter()
+        result = await getattr(conn, method)(sql, params)
+        elapsed = time.perf_counter() - started
+
+        shape = statement_shape(sql)
+        stats = self.statements.get(shape)
+        if stats is None:
+            stats = self.statements[shape] = StatementStats()
+        stats.calls += 1
+        stats.total_s += elapsed
+        stats.max_s = max(stats.max_s, elapsed)
+
+        if elapsed >= self.slow_s:
+            stats.slow += 1
+            shown = params if method == "execute" else f"<{len(params)} rows>"
+            log.warning("slow query %.1f ms: %s params=%.*s", elapsed * 1000, shape, PARAMS_LOG_MAX, repr(shown))
+
+        if stats.plan is None and shape.upper().startswith(_EXPLAINABLE):
+            sample = params if method == "execute" else (params[0] if params else ())
+            await self._explain(conn, sql, sample, shape, stats)
+        return result
+
+    async def _explain(self, conn, sql: str, params, shape: str, stats: StatementStats) -> None:
+        try:
+            stats.plan, stats.full_scans = await explain(conn, sql, params)
+        except Exception as e:
+            stats.plan = [f"<explain failed: {e}>"]
+            return
+        for detail in stats.full_scans:
+            log.warning("full table scan (%s): %s", detail, shape)
+
+
+class ProfiledConnection:
+    """aiosqlite.Connection, у которого execute/executemany идут через профилировщик."""
+
+    def __init__(self, conn: aiosqlite.Connection, profiler: QueryProfiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, sql: str, parameters=()):
+        return await self._profiler.run(self._conn, "execute", sql, parameters)
+
+    async def executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        return await self._profiler.run(self._conn, "executemany", sql, parameters)
+
+
+async def explain(conn: aiosqlite.Connection, sql: str, params=()) -> tuple[list[str], list[str]]:
+    """
+    EXPLAIN QUERY PLAN в виде дерева строк (вложенность — отступом)
+    и список шагов, которые читают таблицу целиком.
+    """
+    cur = await conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+    rows = await cur.fetchall()
+
+    depth: dict[int, int] = {0: -1}
+    plan: list[str] = []
+    full_scans: list[str] = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+        if _FULL_SCAN.match(detail):
+            full_scans.append(detail)
+    return plan, full_scans
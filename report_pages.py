@@ -0,0 +1,202 @@
+import logging
+from dataclasses import dataclass, replace
+
+from aiogram.types import InlineKeyboardMarkup
+
+from db import PAGE_ROWS
+from keyboards import pager_kb
+from report_snapshots import COURSE_SCOPE, get_slot_snapshot
+from reporting import build_page_text, utf16_len
+from time_utils import schedule, slot_label
+
+log = logging.getLogger(__name__)
+
+# Telegram: не больше 4096 кодовых единиц UTF-16 в тексте сообщения
+TEXT_LIMIT = 4096
+# и не больше 64 байт в callback_data кнопки
+CALLBACK_DATA_LIMIT = 64
+
+PAGE_CALLBACK_PREFIX = "pg:"
+KIND_MISSING = "m"
+KIND_REGISTERED = "r"
+NO_WINDOW = "-"
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    """
+    Какую страницу показать. В callback_data (до 64 байт) помещается только
+    tg_user_id крайней строки соседней страницы и номер строки:
+      direction="n" — страница после cursor, ordinal — номер её первой строки;
+      direction="p" — страница перед cursor, ordinal — номер строки cursor.
+    Окно в кнопке — номер в schedule().slots (порядок окон не меняется,
+    на нём держатся маски итогов), а не имя из конфига.
+    """
+    kind: str
+    scope: str
+    date: str = NO_WINDOW
+    slot: str = NO_WINDOW
+    direction: str = "n"
+    cursor: int | None = None
+    ordinal: int = 1
+
+    def callback(self, direction: str, cursor: int, ordinal: int) -> str | None:
+        """callback_data кнопки или None, если она не влезает в лимит Telegram."""
+        data = (
+            f"{PAGE_CALLBACK_PREFIX}{self.kind}:{self.scope}:{self.date}:{_slot_key(self.slot)}:"
+            f"{direction}:{cursor}:{ordinal}"
+        )
+        if len(data.encode()) > CALLBACK_DATA_LIMIT:
+            log.warning("Pager button dropped: callback_data %r exceeds %d bytes", data, CALLBACK_DATA_LIMIT)
+            return None
+        return data
+
+    @classmethod
+    def parse(cls, data: str) -> "PageRequest | None":
+        parts = data[len(PAGE_CALLBACK_PREFIX):].split(":")
+        if len(parts) != 7:
+            return None
+        kind, scope, date, slot, direction, cursor, ordinal = parts
+        if kind not in (KIND_MISSING, KIND_REGISTERED) or direction not in ("n", "p"):
+            return None
+        try:
+            return cls(kind, scope, date, _slot_name(slot), direction, int(cursor), max(1, int(ordinal)))
+        except ValueError:
+            return None
+
+
+def _slot_key(slot: str) -> str:
+    for i, cfg in enumerate(schedule().slots):
+        if cfg.slot == slot:
+            return str(i)
+    # Окна уже нет в расписании (или NO_WINDOW): имя как есть
+    return slot
+
+
+def _slot_name(key: str) -> str:
+    # Кнопки, отправленные до перехода на номера, несут имя окна
+    slots = schedule().slots
+    if key.isdigit() and int(key) < len(slots):
+        return slots[int(key)].slot
+    return key
+
+
+def report_scopes(slot: str) -> list[str]:
+    """Отчёт по окну всего курса — один, по окну отдельных групп — на каждую группу."""
+    cfg = schedule().get(slot)
+    if cfg is None or cfg.groups is None:
+        return [COURSE_SCOPE]
+    return sorted(cfg.groups)
+
+
+def _fits(text: str) -> bool:
+    return utf16_len(text) <= TEXT_LIMIT
+
+
+async def _paginate(fetch, req: PageRequest, header: list[str], *, grouped: bool, footer, empty: str):
+    """
+    Одна страница по ключу: fetch(after=/before=, limit=) читает не больше
+    PAGE_ROWS + 1 строк, на страницу попадает столько, сколько влезает в
+    TEXT_LIMIT. footer(n) — итоговая строка последней страницы.
+    """
+    if req.direction == "p" and req.cursor is not None:
+        rows = await fetch(before=req.cursor, limit=PAGE_ROWS + 1)
+        more = len(rows) > PAGE_ROWS
+        rows = rows[:PAGE_ROWS]
+        k = 0
+        while k < len(rows):
+            candidate = rows[: k + 1][::-1]
+            if k and not _fits(build_page_text(header, candidate, req.ordinal - k - 1, grouped=grouped)):
+                break
+            k += 1
+        if k == len(rows) and not more:
+            # Дошли до начала списка: первая страница всегда строится вперёд
+            return await _paginate(fetch, replace(req, direction="n", cursor=None, ordinal=1),
+                                   header, grouped=grouped, footer=footer, empty=empty)
+        page, first, has_prev, has_next = rows[:k][::-1], req.ordinal - k, True, True
+    else:
+        rows = await fetch(after=req.cursor, limit=PAGE_ROWS + 1)
+        more = len(rows) > PAGE_ROWS
+        rows = rows[:PAGE_ROWS]
+        if not rows and req.cursor is None:
+            return "\n".join(header + [empty]), None
+        k = 0
+        while k < len(rows):
+            last = k + 1 == len(rows) and not more
+            text = build_page_text(
+                header, rows[: k + 1], req.ordinal, grouped=grouped,
+                footer=footer(req.ordinal + k) if last else None,
+            )
+            if k and not _fits(text):
+                break
+            k += 1
+        page, first = rows[:k], req.ordinal
+        has_prev, has_next = req.cursor is not None, k < len(rows) or more
+
+    text = build_page_text(
+        header, page, first, grouped=grouped,
+        footer=None if has_next else footer(first + len(page) - 1),
+    )
+    markup = pager_kb(
+        req.callback("p", page[0][0], first) if has_prev and page else None,
+        req.callback("n", page[-1][0], first + len(page)) if has_next and page else None,
+    )
+    return text, markup
+
+
+def _snapshot_fetch(missing: list[tuple[str, str, str | None, str | None, int]]):
+    """
+    fetch для _paginate по строкам снимка. Они упорядочены по ключу
+    (group_code, full_name, tg_user_id), а курсор — tg_user_id крайней
+    строки, поэтому страница — срез списка рядом с ней.
+    """
+    rows = [(tg_user_id, g, name, username, phone) for g, name, username, phone, tg_user_id in missing]
+    position = {row[0]: i for i, row in enumerate(rows)}
+
+    async def fetch(*, after: int | None = None, before: int | None = None, limit: int):
+        if before is not None:
+            i = position.get(before, 0)
+            return rows[max(0, i - limit):i][::-1]
+        i = position[after] + 1 if after in position else 0
+        return rows[i:i + limit]
+
+    return fetch
+
+
+async def _missing_page(db, req: PageRequest):
+    # Заголовок и список — из одного снимка закрытого окна: листание не
+    # ходит в checkins и не расходится с итогами, если состав изменился
+    report, _ = await get_slot_snapshot(db, req.date, req.slot, req.scope)
+    header = [
+        f"{slot_label(req.slot)} отчёт ({req.date})",
+        f"Отметились {report.checked}/{report.total} курсантов",
+        "",
+        "Неотметившиеся курсанты",
+        "",
+    ]
+    return await _paginate(
+        _snapshot_fetch(report.missing), req, header, grouped=True,
+        footer=lambda n: f"Всего неотметившихся: {n}",
+        empty="Все курсанты доложили.",
+    )
+
+
+async def _registered_page(db, req: PageRequest):
+    n = await db.count_registered_in_group(req.scope)
+    header = ["Статистика: моя группа", "", f"{req.scope}: {n}", "", "Список зарегистрированных:"]
+
+    async def fetch(**cursor):
+        return await db.registered_page(req.scope, **cursor)
+
+    return await _paginate(fetch, req, header, grouped=False, footer=lambda n: None, empty="—")
+
+
+async def render_page(db, req: PageRequest) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Текст страницы и кнопки «Назад»/«Далее». Неотметившиеся листаются по
+    снимку окна, зарегистрированные — запросом по ключу (group_code,
+    full_name) без чтения всего списка.
+    """
+    if req.kind == KIND_MISSING:
+        return await _missing_page(db, req)
+    return await _registered_page(db, req)
@@ -0,0 +1,42 @@
+from db import AttendanceReport
+from keyboards import OFFICERS_GROUP_CODE
+from reporting import build_missing_report_all, build_missing_report_one_group
+
+COURSE_SCOPE = "*"
+
+
+async def build_slot_snapshots(db, date_str: str, slot: str) -> dict[str, tuple[AttendanceReport, str]]:
+    """
+    Считает итоги закрытого окна одним запросом по курсу, раскладывает их
+    по группам и сохраняет как неизменяемые снимки.
+    """
+    report = await db.attendance_report(date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    snapshots = {COURSE_SCOPE: (report, build_missing_report_all([m[:4] for m in report.missing]))}
+
+    for group_code, total, checked in report.groups:
+        missing = [m for m in report.missing if m[0] == group_code]
+        group_report = AttendanceReport(groups=[(group_code, total, checked)], missing=missing)
+        text = build_missing_report_one_group(group_code, [m[1:4] for m in missing])
+        snapshots[group_code] = (group_report, text)
+
+    await db.save_report_snapshots(date_str, slot, snapshots)
+    return snapshots
+
+
+async def get_slot_snapshot(db, date_str: str, slot: str, scope: str) -> tuple[AttendanceReport, str]:
+    """
+    Снимок окна для курса (COURSE_SCOPE) или группы. Если окно закрылось,
+    пока бот не работал, снимки строятся здесь же.
+    """
+    snapshot = await db.get_report_snapshot(date_str, slot, scope)
+    if snapshot is not None:
+        return snapshot
+
+    if scope != COURSE_SCOPE and await db.get_report_snapshot(date_str, slot, COURSE_SCOPE) is not None:
+        # Снимки окна уже есть, но в группе не было активных курсантов
+        return AttendanceReport(groups=[], missing=[]), build_missing_report_one_group(scope, [])
+
+    snapshots = await build_slot_snapshots(db, date_str, slot)
+    if scope in snapshots:
+        return snapshots[scope]
+    return AttendanceReport(groups=[], missing=[]), build_missing_report_one_group(scope, [])
@@ -1,6 +1,30 @@
 from collections import defaultdict
 
 
+def utf16_len(text: str) -> int:
+    """Длина текста так, как её считает Telegram: в кодовых единицах UTF-16."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_long_text(text: str, max_len: int = 3500) -> list[str]:
+    """Текст по строкам на сообщения не длиннее max_len (в UTF-16)."""
+    lines = text.splitlines()
+    parts: list[str] = []
+    buf: list[str] = []
+    cur = 0
+    for line in lines:
+        add = utf16_len(line) + 1
+        if buf and cur + add > max_len:
+            parts.append("\n".join(buf))
+            buf = []
+            cur = 0
+        buf.append(line)
+        cur += add
+    if buf:
+        parts.append("\n".join(buf))
+    return parts
+
+
 def _contact(username: str | None, phone: str | None) -> str:
     if phone:
         return phone
@@ -39,3 +63,80 @@ def build_missing_report_one_group(group_code: str, rows: list[tuple[str, str |
     lines.append("")
     lines.append(f"Всего неотметившихся: {len(rows)}")
     return "\n".join(lines)
+
+
+def _percent(checked: int, expected: int) -> str:
+    return f"{checked / expected * 100:.1f}%" if expected else "—"
+
+
+def build_group_rates_text(title: str, groups: list[tuple[str, int, int]]) -> str:
+    """Посещаемость по группам за период: (group_code, ожидалось, отметились)."""
+    if not groups:
+        return f"{title}\n\nНет данных за период."
+    lines = [title, ""]
+    for group_code, expected, checked in groups:
+        lines.append(f"{group_code}: {_percent(checked, expected)} ({checked}/{expected})")
+    expected = sum(g[1] for g in groups)
+    checked = sum(g[2] for g in groups)
+    lines.append("")
+    lines.append(f"Весь курс: {_percent(checked, expected)} ({checked}/{expected})")
+    return "\n".join(lines)
+
+
+def build_worst_groups_text(title: str, groups: list[tuple[str, int, int]]) -> str:
+    if not groups:
+        return f"{title}\n\nНет данных за период."
+    lines = [title, ""]
+    for i, (group_code, expected, checked) in enumerate(groups, start=1):
+        lines.append(f"{i}. {group_code}: {_percent(checked, expected)} ({checked}/{expected})")
+    return "\n".join(lines)
+
+
+def build_streaks_text(title: str, streaks: list) -> str:
+    """streaks: (group_code, CadetAttendance) по убыванию серии пропусков."""
+    if not streaks:
+        return f"{title}\n\nПропусков за период нет."
+    lines = [title, ""]
+    for i, (group_code, cadet) in enumerate(streaks, start=1):
+        lines.append(f"{i}. {cadet.full_name} ({group_code}): {cadet.longest_missed} подряд")
+    return "\n".join(lines)
+
+
+def build_cadet_rates_text(title: str, cadets: list) -> str:
+    """cadets: CadetAttendance, худшие сверху."""
+    if not cadets:
+        return f"{title}\n\nНет данных за период."
+    lines = [title, ""]
+    for i, c in enumerate(cadets, start=1):
+        streak = f", серия пропусков {c.longest_missed}" if c.longest_missed > 1 else ""
+        lines.append(f"{i}. {c.full_name}: {_percent(c.checked, c.expected)} ({c.checked}/{c.expected}{streak})")
+    return "\n".join(lines)
+
+
+def build_page_text(
+    header: list[str],
+    rows: list[tuple[int, str, str, str | None, str | None]],
+    first: int,
+    *,
+    grouped: bool,
+    footer: str | None = None,
+) -> str:
+    """
+    Страница списка курсантов: заголовок, строки (tg_user_id, group_code,
+    full_name, username, phone) со сквозной нумерацией с first и, если
+    grouped, подзаголовком группы перед каждой новой группой.
+    """
+    lines = list(header)
+    prev_group = None
+    for i, (_, group_code, name, username, phone) in enumerate(rows, start=first):
+        if grouped and group_code != prev_group:
+            if prev_group is not None:
+                lines.append("")
+            lines.append(f"{group_code} учебная группа:")
+            prev_group = group_code
+        c = _contact(username, phone)
+        lines.append(f"{i}. {name}" + (f" ({c})" if c else ""))
+    if footer:
+        lines.append("")
+        lines.append(footer)
+    return "\n".join(lines)
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+
+class RosterCache:
+    """
+    Кэш таблицы cadets в памяти процесса.
+
+    Пока весь состав помещается в max_entries, кэш «полный»: отвечает и на
+    отсутствие курсанта, и на подсчёты по группам без SQL. Если состав
+    вырос больше лимита, кэш переходит в режим LRU только для get_cadet,
+    а подсчёты снова идут в базу (методы возвращают None).
+    """
+
+    def __init__(self, max_entries: int):
+        self._max = max(1, max_entries)
+        self._by_id: OrderedDict[int, dict] = OrderedDict()
+        self._groups: dict[str, set[int]] = {}
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, rows: list[dict]) -> None:
+        self._by_id.clear()
+        self._groups.clear()
+        if len(rows) > self._max:
+            self.complete = False
+            return
+
+        for row in rows:
+            self._by_id[row["tg_user_id"]] = row
+            if row["is_active"] == 1:
+                self._groups.setdefault(row["group_code"], set()).add(row["tg_user_id"])
+        self.complete = True
+
+    def get(self, tg_user_id: int) -> tuple[bool, dict | None]:
+        """
+        Возвращает (найдено_в_кэше, строка). В полном кэше отсутствие записи —
+        тоже ответ: курсант не зарегистрирован.
+        """
+        row = self._by_id.get(tg_user_id)
+        if row is not None:
+            self._by_id.move_to_end(tg_user_id)
+            self.hits += 1
+            return True, dict(row)
+        if self.complete:
+            self.hits += 1
+            return True, None
+        self.misses += 1
+        return False, None
+
+    def put(self, row: dict) -> None:
+        tg_user_id = row["tg_user_id"]
+        old = self._by_id.get(tg_user_id)
+        self._by_id[tg_user_id] = row
+        self._by_id.move_to_end(tg_user_id)
+
+        if self.complete:
+            # В группах — только активные: выбывшие (перешедшие на другой курс)
+            # остаются в cadets ради истории отметок, но не в составе
+            if old is not None:
+                self._groups.get(old["group_code"], set()).discard(tg_user_id)
+            if row["is_active"] == 1:
+                self._groups.setdefault(row["group_code"], set()).add(tg_user_id)
+
+        if len(self._by_id) > self._max:
+            self.complete = False
+            self._groups.clear()
+            while len(self._by_id) > self._max:
+                self._by_id.popitem(last=False)
+
+    def update(self, tg_user_id: int, **fields) -> None:
+        row = self._by_id.get(tg_user_id)
+        if row is not None:
+            row.update(fields)
+
+    def count_in_group(self, group_code: str) -> int | None:
+        if not self.complete:
+            return None
+        return len(self._groups.get(group_code, ()))
+
+    def count_by_group(self, *, exclude_group_code: str) -> list[tuple[str, int]] | None:
+        if not self.complete:
+            return None
+        return [
+            (g, len(ids))
+            for g, ids in sorted(self._groups.items())
+            if g != exclude_group_code and ids
+        ]
+
+    def list_active_in_group(self, group_code: str) -> list[tuple[str, str | None, str | None]] | None:
+        if not self.complete:
+            return None
+        rows = [self._by_id[i] for i in self._groups.get(group_code, ())]
+        rows.sort(key=lambda r: r["full_name"])
+        return [(r["full_name"], r["username"], r["phone"]) for r in rows]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._by_id),
+            "complete": self.complete,
+        }
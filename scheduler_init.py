@@ -1,59 +1,143 @@
+from datetime import date, datetime, time, timedelta
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from time_utils import TZ, SLOT_MORNING, SLOT_EVENING
-from scheduler_jobs import notify_admin_cadets_start, notify_admin_cadets_close, send_reports
+from tenants import DEFAULT_TENANT
+from time_utils import TZ, SlotConfig, schedule
+from scheduler_jobs import (
+    notify_admin_cadets_start,
+    notify_admin_cadets_close,
+    nudge_missing_cadets,
+    send_reports,
+    open_slot_board,
+    close_slot_board,
+    run_db_maintenance,
+    archive_old_checkins,
+    rollup_attendance,
+)
 
-def setup_scheduler(s: AsyncIOScheduler, *, bot, db, config) -> None:
-    # Начало утреннего доклада
-    s.add_job(
-        notify_admin_cadets_start,
-        CronTrigger(hour=7, minute=0, timezone=TZ),
-        args=[bot, db, config, SLOT_MORNING],
-        id="notify_admins_morning_start",
-        replace_existing=True,
-    )
-    # Сообщение о закрытии утреннего доклада
-    s.add_job(
-        notify_admin_cadets_close,
-        CronTrigger(hour=7, minute=30, timezone=TZ),
-        args=[bot, db, config],
-        id="admins_menu_after_morning_close",
-        replace_existing=True,
-    )
+# Отчёт по окну уходит через минуту после его закрытия
+REPORT_DELAY = timedelta(minutes=1)
 
-    # Отчет по утреннему докладу
-    s.add_job(
-        send_reports,
-        CronTrigger(hour=7, minute=31, timezone=TZ),
-        args=[bot, db, config, SLOT_MORNING],
-        id="reports_morning",
-        replace_existing=True,
-    )
 
-    # Начало вечернего доклада
-    s.add_job(
-        notify_admin_cadets_start,
-        CronTrigger(hour=21, minute=30, timezone=TZ),
-        args=[bot, db, config, SLOT_EVENING],
-        id="notify_admins_evening_start",
-        replace_existing=True,
-    )
+def _slot_trigger(cfg: SlotConfig, at: time) -> CronTrigger:
+    days = "*" if cfg.weekdays is None else ",".join(str(d) for d in sorted(cfg.weekdays))
+    return CronTrigger(day_of_week=days, hour=at.hour, minute=at.minute, second=at.second, timezone=TZ)
+
 
-    # Сообщение о закрытии вечернего доклада
+def _after(t: time, delta: timedelta) -> time:
+    return (datetime.combine(date.min, t) + delta).time()
+
+
+def _nudge_times(cfg: SlotConfig) -> list[time]:
+    """Напоминания: при открытии окна и на середине времени до срока доклада."""
+    start = datetime.combine(date.min, cfg.start)
+    middle = start + (datetime.combine(date.min, cfg.deadline) - start) / 2
+    middle = middle.replace(second=0, microsecond=0)
+    return [cfg.start] if middle <= start else [cfg.start, middle.time()]
+
+
+def _job_prefix(tenant) -> str:
+    # Задачи основного курса сохраняют прежние id, остальных — с кодом курса
+    return "" if tenant.code == DEFAULT_TENANT else f"{tenant.code}:"
+
+
+def setup_local_scheduler(s: AsyncIOScheduler, *, tenants) -> None:
+    """
+    Задачи, которые нужны каждому процессу (доска открытого окна в памяти
+    каждого шарда). Рассылки — в setup_scheduler, их выполняет только лидер.
+    """
+    for tenant in tenants.all():
+        prefix = _job_prefix(tenant)
+        for cfg in schedule().slots:
+            s.add_job(
+                open_slot_board,
+                _slot_trigger(cfg, cfg.start),
+                args=[tenant.db, cfg.slot],
+                id=f"{prefix}open_board_{cfg.slot}",
+                replace_existing=True,
+            )
+            s.add_job(
+                close_slot_board,
+                _slot_trigger(cfg, cfg.close),
+                args=[tenant.db],
+                id=f"{prefix}close_board_{cfg.slot}",
+                replace_existing=True,
+            )
+
+
+def setup_scheduler(s: AsyncIOScheduler, *, outbox, tenants, config) -> None:
+    for tenant in tenants.all():
+        _setup_tenant_jobs(s, outbox=outbox, tenant=tenant, config=config, scoped=tenants.multi)
+
+
+def _setup_tenant_jobs(s: AsyncIOScheduler, *, outbox, tenant, config, scoped: bool) -> None:
+    db = tenant.db
+    prefix = _job_prefix(tenant)
+
+    # По три задачи на каждое окно расписания: начало доклада,
+    # сообщение о закрытии и отчёт через минуту после закрытия.
+    # id задачи — часть ключа идемпотентности её сообщений в outbox.
+    for cfg in schedule().slots:
+        job_id = f"{prefix}notify_admins_{cfg.slot}_start"
+        s.add_job(
+            notify_admin_cadets_start,
+            _slot_trigger(cfg, cfg.start),
+            args=[outbox, db, config, cfg.slot, job_id],
+            id=job_id,
+            replace_existing=True,
+        )
+        job_id = f"{prefix}admins_menu_after_{cfg.slot}_close"
+        s.add_job(
+            notify_admin_cadets_close,
+            _slot_trigger(cfg, cfg.close),
+            args=[outbox, db, config, cfg.slot, job_id],
+            id=job_id,
+            replace_existing=True,
+        )
+        job_id = f"{prefix}reports_{cfg.slot}"
+        s.add_job(
+            send_reports,
+            _slot_trigger(cfg, _after(cfg.close, REPORT_DELAY)),
+            args=[outbox, db, config, cfg.slot, scoped, job_id],
+            id=job_id,
+            replace_existing=True,
+        )
+        if config.nudge_cadets:
+            for i, at in enumerate(_nudge_times(cfg)):
+                job_id = f"{prefix}nudge_{cfg.slot}_{i}"
+                s.add_job(
+                    nudge_missing_cadets,
+                    _slot_trigger(cfg, at),
+                    args=[outbox, db, cfg.slot, job_id],
+                    id=job_id,
+                    replace_existing=True,
+                )
+
+    # Дневные итоги посещаемости за закрытые дни
     s.add_job(
-        notify_admin_cadets_close,
-        CronTrigger(hour=22, minute=00, timezone=TZ),
-        args=[bot, db, config],
-        id="admins_menu_after_evening_close",
+        rollup_attendance,
+        CronTrigger(hour=2, minute=30, timezone=TZ),
+        args=[db],
+        id=f"{prefix}rollup_attendance",
         replace_existing=True,
     )
 
-    # Отчет по вечернему докладу
+    # Обслуживание базы
     s.add_job(
-        send_reports,
-        CronTrigger(hour=22, minute=1, timezone=TZ),
-        args=[bot, db, config, SLOT_EVENING],
-        id="reports_evening",
+        run_db_maintenance,
+        CronTrigger(hour=3, minute=30, timezone=TZ),
+        args=[db],
+        id=f"{prefix}db_maintenance",
         replace_existing=True,
     )
+
+    if config.retention_days > 0:
+        s.add_job(
+            archive_old_checkins,
+            CronTrigger(hour=3, minute=0, timezone=TZ),
+            args=[db],
+            id=f"{prefix}archive_checkins",
+            replace_existing=True,
+        )
@@ -1,103 +1,208 @@
 import asyncio
-from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+import logging
+from datetime import datetime
 
-from keyboards import OFFICERS_GROUP_CODE, role_menu_kb
-from time_utils import now_msk, date_str_msk, slot_config, current_slot, SLOT_MORNING, SLOT_EVENING
-from reporting import build_missing_report_all, build_missing_report_one_group
+from db import ARCHIVE_BATCH
+from outbox import KEEP_S, Outbox
+from keyboards import OFFICERS_GROUP_CODE, checkin_inline_kb, role_menu_kb
+from time_utils import TZ, now_msk, date_str_msk, slot_config, current_slot
+from report_pages import KIND_MISSING, PageRequest, render_page, report_scopes
 
+log = logging.getLogger(__name__)
 
-async def _safe_send(bot: Bot, chat_id: int, text: str, reply_markup=None) -> None:
-    try:
-        await bot.send_message(chat_id, text, reply_markup=reply_markup)
-    except (TelegramForbiddenError, TelegramBadRequest):
-        return
+ARCHIVE_PAUSE_S = 0.05
 
 
 def _is_admin_cadet(user_id: int, admin_ids: set[int], officer_ids: set[int]) -> bool:
     return (user_id in admin_ids) and (user_id not in officer_ids)
 
 
-async def notify_admin_cadets_start(bot: Bot, db, config, slot: str) -> None:
-    dt = now_msk()
-    cfg = slot_config(slot)
-
-    show_btn = (current_slot(dt) == slot)
-
-    for admin_id in config.admin_ids:
-        if not _is_admin_cadet(admin_id, config.admin_ids, config.officer_ids):
-            continue
-
-        cadet = await db.get_cadet(admin_id)
-        if not cadet or cadet["group_code"] == OFFICERS_GROUP_CODE:
-            continue
-
-        menu = role_menu_kb(
-            is_officer=False,
-            is_admin_cadet=True,
-            show_not_reported=show_btn,
-        )
-
-        text = (
-            "Началось время доклада.\n"
-            f"Доклад до {cfg.deadline.strftime('%H:%M')} (МСК). "
-        )
-        await _safe_send(bot, admin_id, text, reply_markup=menu)
-        await asyncio.sleep(0.05)
+async def _admin_cadets(db, config) -> list[tuple[int, dict]]:
+    """
+    Админы-курсанты, зарегистрированные в учебной группе, — одним запросом.
+    """
+    admin_ids = [a for a in config.admin_ids if _is_admin_cadet(a, config.admin_ids, config.officer_ids)]
+    cadets = await db.get_cadets(admin_ids)
+    return [
+        (admin_id, cadets[admin_id])
+        for admin_id in admin_ids
+        if admin_id in cadets
+        and cadets[admin_id]["is_active"] == 1
+        and cadets[admin_id]["group_code"] != OFFICERS_GROUP_CODE
+    ]
+
+
+async def _officer_ids(db, config, scoped: bool) -> list[int]:
+    """
+    Получатели офицерских отчётов. Пока курс один — все OFFICER_IDS;
+    при нескольких курсах (scoped) — только офицеры, зарегистрированные
+    в этом курсе.
+    """
+    if not scoped:
+        return list(config.officer_ids)
+    officers = await db.get_cadets(list(config.officer_ids))
+    return [
+        officer_id
+        for officer_id, cadet in officers.items()
+        if cadet["is_active"] == 1 and cadet["group_code"] == OFFICERS_GROUP_CODE
+    ]
+
+
+async def open_slot_board(db, slot: str) -> None:
+    # Окно открылось: дальше «Не доложили» отвечает из памяти.
+    # Доска своя у каждого процесса, поэтому задача локальная.
+    await db.open_board(date_str_msk(now_msk()), slot)
+
+
+async def close_slot_board(db) -> None:
+    db.close_board()
+
+
+async def run_db_maintenance(db) -> None:
+    # Ночью, вне окон доклада: обновить статистику для планировщика запросов
+    await db.optimize()
+    n = await db.purge_outbox(KEEP_S)
+    if n:
+        log.info("outbox: purged %d processed messages", n)
+
+
+async def archive_old_checkins(db) -> None:
+    """
+    Переносит старые отметки в архив пачками, отпуская писателя между ними.
+    Если за это время открылось окно доклада — останавливается до следующей ночи.
+    """
+    moved = 0
+    while current_slot(now_msk()) is None:
+        n = await db.archive_checkins_batch(ARCHIVE_BATCH)
+        moved += n
+        if n < ARCHIVE_BATCH:
+            break
+        await asyncio.sleep(ARCHIVE_PAUSE_S)
+
+    if not moved:
+        return
+    # Первый перенос в базе без auto_vacuum: файл перестраивается целиком,
+    # дальше место возвращается по частям
+    if await db.enable_incremental_vacuum():
+        log.info("archive: moved %d checkins, rebuilt the file with incremental auto_vacuum", moved)
+    else:
+        pages = await db.reclaim_space()
+        log.info("archive: moved %d checkins, freed %d pages", moved, pages)
 
 
-async def notify_admin_cadets_close(bot: Bot, db, config) -> None:
-    for admin_id in config.admin_ids:
-        if not _is_admin_cadet(admin_id, config.admin_ids, config.officer_ids):
-            continue
+async def rollup_attendance(db) -> None:
+    # Сворачиваются только закрытые дни, которых ещё нет в итогах
+    today = date_str_msk(now_msk())
+    days = 0
+    for date_str in await db.rollup_pending_dates(today):
+        await db.rollup_day(date_str, exclude_group_code=OFFICERS_GROUP_CODE)
+        days += 1
+    if days:
+        log.info("rollup: %d days", days)
 
-        cadet = await db.get_cadet(admin_id)
-        if not cadet or cadet["group_code"] == OFFICERS_GROUP_CODE:
-            continue
 
-        menu = role_menu_kb(
-            is_officer=False,
-            is_admin_cadet=True,
-            show_not_reported=False,
-        )
-        await _safe_send(bot, admin_id, "Время доклада закончено.", reply_markup=menu)
-        await asyncio.sleep(0.05)
+def _slot_close(dt: datetime, slot: str) -> datetime:
+    return datetime.combine(dt.date(), slot_config(slot).close, tzinfo=TZ)
 
 
-async def send_reports(bot: Bot, db, config, slot: str) -> None:
+async def notify_admin_cadets_start(outbox: Outbox, db, config, slot: str, job: str | None = None) -> None:
+    job = job or f"notify_start_{slot}"
     dt = now_msk()
-    date_str = date_str_msk(dt)
-
-    if slot == SLOT_MORNING:
-        officer_header = f"Утренний отчёт ({date_str})"
-    elif slot == SLOT_EVENING:
-        officer_header = f"Вечерний отчёт ({date_str})"
-    else:
-        officer_header = f"Отчёт ({date_str})"
+    cfg = slot_config(slot)
 
-    # 1) Офицерам: общий отчёт по курсу (без OFFICERS)
-    if config.officer_ids:
-        rows = await db.missing_all_groups(date_str, slot, OFFICERS_GROUP_CODE)
-        report = build_missing_report_all(rows)
-        text = f"{officer_header}\n\n{report}"
+    show_btn = (current_slot(dt) == slot)
+    text = (
+        "Началось время доклада.\n"
+        f"Доклад до {cfg.deadline.strftime('%H:%M')} (МСК). "
+    )
+
+    menu = role_menu_kb(
+        is_officer=False,
+        is_admin_cadet=True,
+        show_not_reported=show_btn,
+    )
+    messages = [
+        (job, admin_id, text, menu)
+        for admin_id, cadet in await _admin_cadets(db, config)
+        if cfg.applies_to(cadet["group_code"])
+    ]
+
+    # Кнопка «Не доложили» после закрытия окна ни к чему
+    await outbox.enqueue(date_str_msk(dt), slot, messages, expires_at=_slot_close(dt, slot))
+
+
+async def nudge_missing_cadets(outbox: Outbox, db, slot: str, job: str | None = None) -> None:
+    """
+    Напоминание тем, кто ещё не отметился в открытом окне, с кнопкой
+    отметки прямо в сообщении. Список — один запрос; сообщения ставятся
+    в outbox и не отправляются, если окно успело закрыться.
+    """
+    job = job or f"nudge_{slot}"
+    dt = now_msk()
+    if current_slot(dt) != slot:
+        # Задача опоздала (например, после смены лидера), окно уже закрыто
+        return
 
-        for officer_id in config.officer_ids:
-            await _safe_send(bot, officer_id, text)
-            await asyncio.sleep(0.05)
+    cfg = slot_config(slot)
+    date_str = date_str_msk(dt)
+    text = (
+        "Идёт время доклада, вы ещё не отметились.\n"
+        f"Доклад до {cfg.deadline.strftime('%H:%M')} (МСК)."
+    )
+    markup = checkin_inline_kb(date_str, slot)
+    missing = await db.missing_user_ids(date_str, slot, exclude_group_code=OFFICERS_GROUP_CODE)
+    messages = [(job, user_id, text, markup) for user_id, group_code in missing if cfg.applies_to(group_code)]
 
-    # 2) Админам-курсантам: отчёт только по своей группе
-    for admin_id in config.admin_ids:
-        if not _is_admin_cadet(admin_id, config.admin_ids, config.officer_ids):
-            continue
+    await outbox.enqueue(date_str, slot, messages, expires_at=_slot_close(dt, slot))
 
-        cadet = await db.get_cadet(admin_id)
-        if not cadet or cadet["group_code"] == OFFICERS_GROUP_CODE:
-            continue
 
+async def notify_admin_cadets_close(outbox: Outbox, db, config, slot: str, job: str | None = None) -> None:
+    job = job or f"notify_close_{slot}"
+    cfg = slot_config(slot)
+    menu = role_menu_kb(
+        is_officer=False,
+        is_admin_cadet=True,
+        show_not_reported=False,
+    )
+    messages = [
+        (job, admin_id, "Время доклада закончено.", menu)
+        for admin_id, cadet in await _admin_cadets(db, config)
+        if cfg.applies_to(cadet["group_code"])
+    ]
+
+    await outbox.enqueue(date_str_msk(now_msk()), slot, messages)
+
+
+async def send_reports(outbox: Outbox, db, config, slot: str, scoped: bool = False, job: str | None = None) -> None:
+    job = job or f"reports_{slot}"
+    date_str = date_str_msk(now_msk())
+
+    messages = []
+
+    # Окно закрыто: итоги фиксируются снимками (один запрос на весь курс),
+    # дальше «Статистика последнего доклада» отдаёт их без пересчёта.
+    # Рассылается первая страница списка, остальные — кнопками «Далее».
+
+    # 1) Офицерам: общий отчёт по курсу (без OFFICERS),
+    #    а по окну отдельных групп — по отчёту на группу
+    officer_ids = await _officer_ids(db, config, scoped)
+    if officer_ids:
+        for scope in report_scopes(slot):
+            page = await render_page(db, PageRequest(KIND_MISSING, scope, date_str, slot))
+            for officer_id in officer_ids:
+                messages.append((f"{job}:{scope}", officer_id, *page))
+
+    # 2) Админам-курсантам: отчёт только по своей группе,
+    #    страница собирается один раз на группу
+    cfg = slot_config(slot)
+    group_pages: dict[str, tuple] = {}
+    for admin_id, cadet in await _admin_cadets(db, config):
         group_code = cadet["group_code"]
-        missing_rows = await db.missing_by_group(group_code, date_str, slot)
-        report = build_missing_report_one_group(group_code, missing_rows)
+        if not cfg.applies_to(group_code):
+            continue
+        if group_code not in group_pages:
+            group_pages[group_code] = await render_page(db, PageRequest(KIND_MISSING, group_code, date_str, slot))
+        messages.append((f"{job}:{group_code}", admin_id, *group_pages[group_code]))
 
-        header = f"Отчёт по вашей группе ({date_str})"
-        await _safe_send(bot, admin_id, f"{header}\n\n{report}")
-        await asyncio.sleep(0.05)
+    # Все отчёты — одной транзакцией в outbox, отправит разборщик
+    await outbox.enqueue(date_str, slot, messages)
@@ -2,6 +2,7 @@ from aiogram.fsm.state import StatesGroup, State
 
 
 class Registration(StatesGroup):
+    choose_tenant = State()
     choose_group = State()
     enter_name = State()
     enter_contact = State()
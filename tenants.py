@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import os
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import CallbackQuery
+from dotenv import load_dotenv
+
+from db import Database
+from keyboards import DEFAULT_CADET_GROUPS
+
+# Курс основной базы (DB_PATH): он есть всегда, его шард — сама основная база
+DEFAULT_TENANT = "main"
+DEFAULT_TENANT_TITLE = "Основной курс"
+
+NOT_REGISTERED_TEXT = "Вы не зарегистрированы. Используйте /start."
+
+
+def archive_path_for(db_path: str) -> str:
+    root, ext = os.path.splitext(db_path)
+    return f"{root}-archive{ext or '.sqlite3'}"
+
+
+@dataclass(frozen=True)
+class Tenant:
+    code: str
+    title: str
+    db: Database
+
+
+class TenantRouter:
+    """
+    Курсы и их шарды. У каждого курса свой файл SQLite со своими
+    группами, составом, отметками и итогами: писатель и индексы одного
+    курса не растут от числа пользователей других.
+
+    Основная база — справочник: список курсов (tenants) и курс каждого
+    пользователя (tenant_users). Курс пользователя ищется в LRU-кэше, при
+    промахе — одним запросом по первичному ключу. Кэш сбрасывается, когда
+    основная база видит чужой коммит (external_epoch): пользователя мог
+    перевести на другой курс соседний процесс. Пока курс один, справочник
+    не читается вовсе.
+
+    Новые курсы (python -m tenants add) подхватываются после перезапуска.
+    """
+
+    def __init__(self, directory: Database, tenants: list[Tenant], *, cache_max: int = 10000):
+        self.directory = directory
+        self._tenants = {t.code: t for t in tenants}
+        self._cache: OrderedDict[int, str] = OrderedDict()
+        self._cache_max = max(1, cache_max)
+        self._epoch = directory.external_epoch
+
+    @property
+    def multi(self) -> bool:
+        return len(self._tenants) > 1
+
+    def all(self) -> list[Tenant]:
+        return list(self._tenants.values())
+
+    def get(self, code: str | None) -> Tenant | None:
+        return self._tenants.get(code) if code is not None else None
+
+    async def resolve(self, tg_user_id: int) -> Tenant | None:
+        """Курс пользователя; None — пользователь ещё ни на какой курс не записан."""
+        if not self.multi:
+            return self._tenants[DEFAULT_TENANT]
+
+        await self.directory.sync_shared()
+        if self.directory.external_epoch != self._epoch:
+            self._epoch = self.directory.external_epoch
+            self._cache.clear()
+
+        code = self._cache.get(tg_user_id)
+        if code is not None:
+            self._cache.move_to_end(tg_user_id)
+            return self._tenants.get(code)
+
+        # Отсутствие записи не кэшируется: регистрация могла пройти в другом процессе
+        code = await self.directory.get_user_tenant(tg_user_id)
+        if code is None:
+            return None
+        self._remember(tg_user_id, code)
+        return self._tenants.get(code)
+
+    async def assign(self, tg_user_id: int, tenant: Tenant) -> None:
+        """
+        Записать пользователя на курс. Перешедший с другого курса выбывает
+        из его состава; его прежние отметки остаются в старом шарде.
+        """
+        previous = await self.resolve(tg_user_id) if self.multi else None
+        await self.directory.set_user_tenant(tg_user_id, tenant.code)
+        self._remember(tg_user_id, tenant.code)
+        if previous is not None and previous.code != tenant.code:
+            await previous.db.deactivate_cadet(tg_user_id)
+
+    def _remember(self, tg_user_id: int, code: str) -> None:
+        self._cache[tg_user_id] = code
+        self._cache.move_to_end(tg_user_id)
+        while len(self._cache) > self._cache_max:
+            self._cache.popitem(last=False)
+
+    async def close(self) -> None:
+        # Основную базу закрывает её владелец
+        for t in self._tenants.values():
+            if t.db is not self.directory:
+                await t.db.close()
+
+
+async def open_tenants(directory: Database, open_shard: Callable[[str], Database], *, cache_max: int = 10000) -> TenantRouter:
+    """
+    Открывает шарды всех курсов из справочника. При первом запуске
+    записывает в справочник курс по умолчанию, а в его реестр групп —
+    DEFAULT_CADET_GROUPS.
+    """
+    rows = await directory.list_tenants()
+    if not any(code == DEFAULT_TENANT for code, _, _ in rows):
+        await directory.upsert_tenant(DEFAULT_TENANT, DEFAULT_TENANT_TITLE, "")
+        rows = await directory.list_tenants()
+    if not await directory.list_groups():
+        await directory.set_groups(DEFAULT_CADET_GROUPS)
+
+    tenants = []
+    for code, title, db_path in rows:
+        if code == DEFAULT_TENANT:
+            db = directory
+        else:
+            db = open_shard(db_path)
+            await db.init()
+        tenants.append(Tenant(code, title, db))
+    return TenantRouter(directory, tenants, cache_max=cache_max)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Подставляет в хэндлеры db шарда курса пользователя, tenant и tenants.
+    Пользователь без курса получает db=None: ему доступна только регистрация.
+    """
+
+    def __init__(self, tenants: TenantRouter, config):
+        self._tenants = tenants
+        self._config = config
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        tenant = await self._tenants.resolve(user.id) if user is not None else None
+        data["tenants"] = self._tenants
+        data["tenant"] = tenant
+        data["db"] = tenant.db if tenant is not None else None
+        data["config"] = self._config
+        return await handler(event, data)
+
+
+class TenantRequiredMiddleware(BaseMiddleware):
+    """Для роутеров, которым нужен шард: без курса — отказ вместо хэндлера."""
+
+    async def __call__(self, handler, event, data):
+        if data.get("db") is not None:
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            return await event.answer(NOT_REGISTERED_TEXT, show_alert=True)
+        return await event.answer(NOT_REGISTERED_TEXT)
+
+
+async def _cli(args) -> None:
+    from config import load_config
+
+    config = load_config()
+    directory = Database(config.db_path, readers=1)
+    await directory.init()
+    try:
+        if args.command == "list":
+            for code, title, db_path in await directory.list_tenants():
+                print(f"{code}\t{title}\t{db_path or config.db_path}")
+            return
+
+        if args.code == DEFAULT_TENANT:
+            shard = directory
+        else:
+            if args.command == "add":
+                await directory.upsert_tenant(args.code, args.title, args.db_path)
+            tenants = {code: db_path for code, _, db_path in await directory.list_tenants()}
+            if args.code not in tenants:
+                raise SystemExit(f"Unknown tenant: {args.code}")
+            shard = Database(tenants[args.code], readers=1, shard=True)
+            await shard.init()
+        try:
+            await shard.set_groups(args.groups)
+        finally:
+            if shard is not directory:
+                await shard.close()
+    finally:
+        await directory.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m tenants", description="Курсы и их реестры групп")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="список курсов")
+    add = sub.add_parser("add", help="добавить курс со своим файлом базы")
+    add.add_argument("code")
+    add.add_argument("title")
+    add.add_argument("db_path")
+    add.add_argument("groups", nargs="+")
+    groups = sub.add_parser("groups", help="заменить реестр групп курса")
+    groups.add_argument("code")
+    groups.add_argument("groups", nargs="+")
+
+    load_dotenv()
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import asyncio
+import sqlite3
+from datetime import time
+
+import pytest
+
+import db as db_module
+import time_utils
+from bench.bench_db import generate
+from db import Database
+from keyboards import OFFICERS_GROUP_CODE
+from query_profiler import QueryProfiler
+from time_utils import Schedule, SlotConfig
+
+
+@pytest.fixture
+def course_db(tmp_path):
+    """База на 300 курсантов и 20 дней отметок (с 2024-01-01)."""
+    path = str(tmp_path / "bot.sqlite3")
+
+    async def init():
+        db = Database(path)
+        await db.init()
+        await db.close()
+
+    asyncio.run(init())
+    generate(path, 300, 20, 0.8, 1)
+    return path
+
+
+def _export_plans(path: str, **db_kwargs) -> tuple[int, dict[str, list[str]]]:
+    profiler = QueryProfiler(float("inf"))
+
+    async def run():
+        db = Database(path, profiler=profiler, **db_kwargs)
+        await db.init()
+        try:
+            n = 0
+            async for _ in db.iter_attendance("2024-01-01", "2024-01-20", exclude_group_code=OFFICERS_GROUP_CODE):
+                n += 1
+            async for _ in db.iter_attendance("2024-01-01", "2024-01-20", group_code="841/11"):
+                n += 1
+            return n
+        finally:
+            await db.close()
+
+    n = asyncio.run(run())
+    plans = {shape: stats.plan for shape, stats in profiler.statements.items() if "FROM cadets c" in shape}
+    return n, plans
+
+
+@pytest.mark.parametrize("archived", [False, True], ids=["checkins", "checkins_history"])
+def test_iter_attendance_streams_without_sorting_the_result(course_db, tmp_path, archived):
+    kwargs = {"archive_path": str(tmp_path / "archive.sqlite3"), "retention_days": 1} if archived else {}
+    n, plans = _export_plans(course_db, **kwargs)
+
+    assert n > 0
+    assert plans
+    for shape, plan in plans.items():
+        assert not any("TEMP B-TREE" in line for line in plan), (shape, plan)
+        assert not any(line.startswith("MATERIALIZE") for line in plan), (shape, plan)
+
+
+def _auto_vacuum(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_init_never_vacuums(course_db, tmp_path):
+    async def run():
+        for kwargs in ({}, {"archive_path": str(tmp_path / "archive.sqlite3"), "retention_days": 1}):
+            db = Database(course_db, **kwargs)
+            await db.init()
+            await db.close()
+
+    asyncio.run(run())
+    assert _auto_vacuum(course_db) == 0
+
+
+def test_enable_incremental_vacuum_once_with_archive(course_db, tmp_path):
+    async def run():
+        plain = Database(course_db)
+        await plain.init()
+        try:
+            assert await plain.enable_incremental_vacuum() is False
+        finally:
+            await plain.close()
+        assert _auto_vacuum(course_db) == 0
+
+        db = Database(course_db, archive_path=str(tmp_path / "archive.sqlite3"), retention_days=1)
+        await db.init()
+        try:
+            assert await db.archive_checkins_batch() > 0
+            assert await db.enable_incremental_vacuum() is True
+            assert await db.enable_incremental_vacuum() is False
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+    assert _auto_vacuum(course_db) == 2
+
+
+def test_enable_incremental_vacuum_skips_busy_file(course_db, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(db_module, "BUSY_TIMEOUT_S", 0.1)
+
+    async def run():
+        db = Database(course_db, archive_path=str(tmp_path / "archive.sqlite3"), retention_days=1)
+        await db.init()
+        # Другой процесс держит запись: VACUUM не дождётся блокировки
+        other = sqlite3.connect(course_db)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            return await db.enable_incremental_vacuum()
+        finally:
+            other.rollback()
+            other.close()
+            await db.close()
+
+    assert asyncio.run(run()) is False
+    assert "VACUUM skipped" in caplog.text
+    assert _auto_vacuum(course_db) == 0
+
+
+def test_sync_shared_ignores_uncommitted_writes(course_db):
+    date_str, slot = "2030-01-01", "morning"
+    conn = sqlite3.connect(course_db)
+    (group_code,) = conn.execute("SELECT group_code FROM cadets WHERE group_code <> ? LIMIT 1", (OFFICERS_GROUP_CODE,)).fetchone()
+    ours, theirs = (r[0] for r in conn.execute(
+        "SELECT tg_user_id FROM cadets WHERE group_code = ? AND is_active = 1 ORDER BY tg_user_id LIMIT 2",
+        (group_code,),
+    ))
+    conn.close()
+
+    async def run():
+        db = Database(course_db, shared=True)
+        await db.init()
+        try:
+            await db.open_board(date_str, slot)
+            # Чужой процесс отметил курсанта: data_version писателя изменится
+            other = sqlite3.connect(course_db)
+            other.execute(
+                "INSERT INTO checkins(tg_user_id, date, slot, created_at) VALUES (?, ?, ?, 'x')",
+                (theirs, date_str, slot),
+            )
+            other.commit()
+            other.close()
+
+            sync = None
+            with pytest.raises(RuntimeError):
+                async with db._write() as w:
+                    await w.execute(
+                        "INSERT INTO checkins(tg_user_id, date, slot, created_at) VALUES (?, ?, ?, 'x')",
+                        (ours, date_str, slot),
+                    )
+                    sync = asyncio.create_task(db.sync_shared())
+                    await asyncio.sleep(0.05)
+                    raise RuntimeError("rollback")
+            await sync
+            return await db.count_group_checked(group_code, date_str, slot)
+        finally:
+            await db.close()
+
+    # Отмечен только курсант из закоммиченной чужой транзакции
+    assert asyncio.run(run()) == 1
+
+
+def test_rollup_day_binds_slot_names(course_db, monkeypatch):
+    slots = [
+        SlotConfig(slot="o'clock", start=time(7, 0), deadline=time(7, 30), close=time(7, 30)),
+        SlotConfig(slot="x' THEN 0 WHEN 'y", start=time(21, 30), deadline=time(22, 0), close=time(22, 0)),
+    ]
+    monkeypatch.setattr(time_utils, "_schedule", Schedule(slots))
+    date_str = "2030-01-01"
+    conn = sqlite3.connect(course_db)
+    (user_id,) = conn.execute("SELECT tg_user_id FROM cadets WHERE group_code <> ? LIMIT 1", (OFFICERS_GROUP_CODE,)).fetchone()
+    conn.executemany(
+        "INSERT INTO checkins(tg_user_id, date, slot, created_at) VALUES (?, ?, ?, 'x')",
+        [(user_id, date_str, s.slot) for s in slots],
+    )
+    conn.commit()
+    conn.close()
+
+    async def run():
+        db = Database(course_db)
+        await db.init()
+        try:
+            return await db.rollup_day(date_str, exclude_group_code=OFFICERS_GROUP_CODE)
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) > 0
+    conn = sqlite3.connect(course_db)
+    try:
+        checked, expected = conn.execute(
+            "SELECT checked, expected FROM rollup_cadet_daily WHERE tg_user_id = ? AND date = ?", (user_id, date_str)
+        ).fetchone()
+    finally:
+        conn.close()
+    assert checked == expected == 0b11
+
+
+def _tables(path: str) -> set[str]:
+    conn = sqlite3.connect(path)
+    try:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+
+def test_tenant_directory_only_in_main_db(tmp_path):
+    main_path, shard_path = str(tmp_path / "main.sqlite3"), str(tmp_path / "shard.sqlite3")
+    # Основная база до v5: уже зарегистрированные попадают в курс по умолчанию
+    conn = sqlite3.connect(main_path)
+    for sql in db_module.MIGRATIONS[:4]:
+        conn.executescript(sql)
+    conn.execute(
+        "INSERT INTO cadets(tg_user_id, group_code, full_name, created_at) VALUES (1, '841/11', 'Курсант', 'x')"
+    )
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    conn.close()
+
+    async def run():
+        for path, shard in ((main_path, False), (shard_path, True)):
+            db = Database(path, shard=shard)
+            await db.init()
+            await db.close()
+        db = Database(main_path)
+        await db.init()
+        try:
+            return await db.get_user_tenant(1)
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) == "main"
+    assert {"cadet_groups", "tenants", "tenant_users"} <= _tables(main_path)
+    assert "cadet_groups" in _tables(shard_path)
+    assert not {"tenants", "tenant_users"} & _tables(shard_path)
@@ -0,0 +1,28 @@
+from datetime import time
+
+import time_utils
+from report_pages import CALLBACK_DATA_LIMIT, KIND_MISSING, KIND_REGISTERED, PageRequest
+from time_utils import Schedule, SlotConfig
+
+TG_USER_ID = 7_000_000_000
+
+
+def test_callback_carries_slot_index_not_name(monkeypatch):
+    slot = "вечерняя_поверка_" * 4
+    monkeypatch.setattr(time_utils, "_schedule", Schedule([
+        SlotConfig(slot="morning", start=time(7, 0), deadline=time(7, 30), close=time(7, 30)),
+        SlotConfig(slot=slot, start=time(21, 30), deadline=time(22, 0), close=time(22, 0)),
+    ]))
+    req = PageRequest(KIND_MISSING, "*", "2030-01-01", slot)
+
+    data = req.callback("n", TG_USER_ID, 12345)
+    assert data is not None
+    assert len(data.encode()) <= CALLBACK_DATA_LIMIT
+    assert PageRequest.parse(data) == PageRequest(KIND_MISSING, "*", "2030-01-01", slot, "n", TG_USER_ID, 12345)
+    # Кнопки со старым форматом (имя окна) по-прежнему открываются
+    assert PageRequest.parse("pg:m:*:2030-01-01:morning:p:1:2").slot == "morning"
+
+
+def test_callback_over_limit_drops_button():
+    req = PageRequest(KIND_REGISTERED, "Г" * 40)
+    assert req.callback("n", TG_USER_ID, 1) is None
@@ -0,0 +1,161 @@
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from keyboards import BTN_CHECKIN, CHECKIN_CALLBACK_PREFIX
+from metrics import SHED_REQUESTS
+from report_pages import PAGE_CALLBACK_PREFIX
+from time_utils import TZ, slot_config
+
+RULE_CHECKIN = "checkin"
+RULE_PAGES = "pages"
+RULE_DEFAULT = "default"
+
+# rate — токенов в секунду, burst — ёмкость ведра. Отметка: три нажатия
+# подряд, дальше одно в 5 секунд; листание отчётов и прочее — щедрее.
+DEFAULT_LIMITS: dict[str, tuple[float, float]] = {
+    RULE_CHECKIN: (0.2, 3),
+    RULE_PAGES: (1.0, 5),
+    RULE_DEFAULT: (1.0, 10),
+}
+
+# Сколько пользователей помнят ведра и памятка об отметках
+STATE_MAX = 50000
+
+ALREADY_CHECKED_TEXT = "Доклад уже был принят."
+TOO_FAST_TEXT = "Слишком часто, попробуйте через несколько секунд."
+
+
+def parse_limits(raw: str) -> dict[str, tuple[float, float]]:
+    """
+    THROTTLE_LIMITS: «checkin=0.2/3,pages=1/5» — поверх DEFAULT_LIMITS.
+    Правила: checkin (кнопка отметки), pages (листание отчётов), default.
+    """
+    limits = dict(DEFAULT_LIMITS)
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, spec = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_LIMITS:
+            raise ValueError(f"Unknown throttle rule: {name}")
+        rate, _, burst = spec.partition("/")
+        limits[name] = (float(rate), float(burst or rate))
+        if limits[name][0] <= 0 or limits[name][1] < 1:
+            raise ValueError(f"Throttle rule {name}: expected rate > 0 and burst >= 1")
+    return limits
+
+
+def rule_for(event) -> str:
+    if isinstance(event, Message):
+        return RULE_CHECKIN if event.text == BTN_CHECKIN else RULE_DEFAULT
+    if isinstance(event, CallbackQuery):
+        data = event.data or ""
+        if data.startswith(CHECKIN_CALLBACK_PREFIX):
+            return RULE_CHECKIN
+        if data.startswith(PAGE_CALLBACK_PREFIX):
+            return RULE_PAGES
+    return RULE_DEFAULT
+
+
+class UserBuckets:
+    """Token bucket на пару (правило, пользователь); не больше STATE_MAX вёдер (LRU)."""
+
+    def __init__(self, limits: dict[str, tuple[float, float]], max_entries: int = STATE_MAX):
+        self._limits = limits
+        self._max = max_entries
+        self._buckets: OrderedDict[tuple[str, int], tuple[float, float]] = OrderedDict()
+
+    def take(self, rule: str, user_id: int) -> bool:
+        rate, burst = self._limits[rule]
+        now = time.monotonic()
+        key = (rule, user_id)
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class CheckinMemo:
+    """
+    Кто уже отметился в открытом окне — до закрытия этого окна.
+    Окна не пересекаются, поэтому непросроченная запись означает
+    «отметка в текущем окне уже есть», и повторное нажатие можно
+    отклонить, не обращаясь к базе. Своя у каждого процесса.
+    """
+
+    def __init__(self, max_entries: int = STATE_MAX):
+        self._max = max_entries
+        self._entries: OrderedDict[int, tuple[str, str, float]] = OrderedDict()
+
+    def remember(self, user_id: int, date_str: str, slot: str) -> None:
+        close = datetime.combine(date.fromisoformat(date_str), slot_config(slot).close, tzinfo=TZ)
+        self._entries[user_id] = (date_str, slot, close.timestamp())
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self._max:
+            self._entries.popitem(last=False)
+
+    def checked(self, user_id: int) -> tuple[str, str] | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        date_str, slot, expires_at = entry
+        if time.time() > expires_at:
+            del self._entries[user_id]
+            return None
+        return date_str, slot
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейта, до выбора курса и хэндлеров: частые
+    повторы одного пользователя отсекаются без обращения к базе.
+
+    - Нет токена в ведре правила — сообщение отбрасывается молча,
+      нажатие кнопки получает короткий ответ (иначе кнопка «крутится»).
+    - Кнопка отметки при записи в CheckinMemo отвечает «уже принят» сразу.
+
+    Хэндлеры отметки получают memo как checkin_memo и пополняют его.
+    Отсечённые апдейты считаются в bot_shed_requests_total.
+    """
+
+    def __init__(self, limits: dict[str, tuple[float, float]]):
+        self.buckets = UserBuckets(limits)
+        self.memo = CheckinMemo()
+
+    async def __call__(self, handler, event, data):
+        data["checkin_memo"] = self.memo
+        user = data.get("event_from_user")
+        inner = event.event
+        if user is None or not isinstance(inner, (Message, CallbackQuery)):
+            return await handler(event, data)
+
+        rule = rule_for(inner)
+        if not self.buckets.take(rule, user.id):
+            SHED_REQUESTS.inc(rule, "throttled")
+            if isinstance(inner, CallbackQuery):
+                return inner.answer(TOO_FAST_TEXT)
+            return None
+
+        if rule == RULE_CHECKIN:
+            checked = self.memo.checked(user.id)
+            if checked is not None:
+                date_str, slot = checked
+                if isinstance(inner, Message):
+                    SHED_REQUESTS.inc(rule, "already_checked")
+                    return inner.answer(ALREADY_CHECKED_TEXT)
+                # Старая кнопка другого окна разбирается хэндлером
+                if inner.data == f"{CHECKIN_CALLBACK_PREFIX}{date_str}:{slot}":
+                    SHED_REQUESTS.inc(rule, "already_checked")
+                    return inner.answer(ALREADY_CHECKED_TEXT)
+
+        return await handler(event, data)
@@ -1,6 +1,8 @@
 from __future__ import annotations
+import json
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from datetime import datetime, time
+from datetime import date, datetime, time, timedelta
 from zoneinfo import ZoneInfo
 
 TZ = ZoneInfo("Europe/Moscow")
@@ -8,18 +10,32 @@ TZ = ZoneInfo("Europe/Moscow")
 SLOT_MORNING = "morning"
 SLOT_EVENING = "evening"
 
+# Окно не может закрыться позже: отчёт по нему уходит через минуту после закрытия
+LAST_CLOSE = time(23, 58)
+
 @dataclass(frozen=True)
 class SlotConfig:
     slot: str
     start: time
     deadline: time
     close: time
+    label: str = ""
+    # None — каждый день / для всех групп
+    weekdays: frozenset[int] | None = None   # 0 — понедельник
+    groups: frozenset[str] | None = None
+
+    def runs_on(self, weekday: int) -> bool:
+        return self.weekdays is None or weekday in self.weekdays
+
+    def applies_to(self, group_code: str | None) -> bool:
+        return self.groups is None or group_code is None or group_code in self.groups
 
 MORNING = SlotConfig(
     slot=SLOT_MORNING,
     start=time(7, 00),
     deadline=time(7, 30),
     close=time(7, 30),
+    label="Утренний",
 )
 
 EVENING = SlotConfig(
@@ -27,25 +43,147 @@ EVENING = SlotConfig(
     start=time(21, 30),
     deadline=time(22, 00),
     close=time(22, 00),
+    label="Вечерний",
 )
 
+DEFAULT_SLOTS = (MORNING, EVENING)
+
+
+class Schedule:
+    """
+    Окна доклада как данные. Для каждого дня недели (и, если есть окна
+    отдельных групп, для каждой группы) один раз строится отсортированная
+    лента окон, и current_slot/last_closed_slot_and_date — это bisect по ней.
+
+    Окна одного дня не пересекаются даже для разных групп: в каждый момент
+    открыто не больше одного окна (и одна доска в памяти).
+    Порядок окон в списке задаёт биты в масках дневных итогов, поэтому
+    новые окна добавляются в конец.
+    """
+
+    def __init__(self, slots):
+        self.slots: tuple[SlotConfig, ...] = tuple(slots)
+        if not self.slots:
+            raise ValueError("Schedule has no slots")
+        self._by_name = {s.slot: s for s in self.slots}
+        if len(self._by_name) != len(self.slots):
+            raise ValueError("Duplicate slot names in schedule")
+        for s in self.slots:
+            if not (s.start <= s.deadline <= s.close <= LAST_CLOSE):
+                raise ValueError(f"Slot {s.slot}: expected start <= deadline <= close <= {LAST_CLOSE:%H:%M}")
+
+        self._timelines: dict[tuple[int, str | None], tuple[list[time], list[time], list[SlotConfig]]] = {}
+        for weekday in range(7):
+            starts, closes, windows = self._timeline(weekday, None)
+            for i in range(1, len(windows)):
+                if starts[i] <= closes[i - 1]:
+                    raise ValueError(f"Slots {windows[i - 1].slot} and {windows[i].slot} overlap")
+
+    def _timeline(self, weekday: int, group_code: str | None):
+        key = (weekday, group_code)
+        timeline = self._timelines.get(key)
+        if timeline is None:
+            windows = sorted(
+                (s for s in self.slots if s.runs_on(weekday) and s.applies_to(group_code)),
+                key=lambda s: s.start,
+            )
+            timeline = self._timelines[key] = ([s.start for s in windows], [s.close for s in windows], windows)
+        return timeline
+
+    def get(self, slot: str) -> SlotConfig | None:
+        return self._by_name.get(slot)
+
+    def current_slot(self, dt: datetime, group_code: str | None = None) -> str | None:
+        t = dt.timetz().replace(tzinfo=None)
+        starts, closes, windows = self._timeline(dt.weekday(), group_code)
+        i = bisect_right(starts, t) - 1
+        if i >= 0 and t <= closes[i]:
+            return windows[i].slot
+        return None
+
+    def last_closed(self, dt: datetime, group_code: str | None = None) -> tuple[str, str]:
+        t = dt.timetz().replace(tzinfo=None)
+        for days_back in range(8):
+            day = dt - timedelta(days=days_back)
+            _, closes, windows = self._timeline(day.weekday(), group_code)
+            # Окно закрыто, когда время строго позже close
+            i = bisect_left(closes, t) if days_back == 0 else len(closes)
+            if i > 0:
+                return date_str_msk(day), windows[i - 1].slot
+        raise ValueError(f"No slots for group {group_code}")
+
+    def slots_on(self, day: date, group_code: str | None = None) -> list[SlotConfig]:
+        return self._timeline(day.weekday(), group_code)[2]
+
+
+def _parse_slot(raw: dict) -> SlotConfig:
+    weekdays = raw.get("weekdays")
+    groups = raw.get("groups")
+    return SlotConfig(
+        slot=raw["slot"],
+        start=time.fromisoformat(raw["start"]),
+        deadline=time.fromisoformat(raw.get("deadline", raw["close"])),
+        close=time.fromisoformat(raw["close"]),
+        label=raw.get("label", raw["slot"]),
+        weekdays=frozenset(int(d) for d in weekdays) if weekdays is not None else None,
+        groups=frozenset(groups) if groups is not None else None,
+    )
+
+
+def load_schedule(path: str) -> Schedule:
+    """
+    Расписание из JSON: список окон вида
+      {"slot": "morning", "label": "Утренний", "start": "07:00", "deadline": "07:30",
+       "close": "07:30", "weekdays": [0, 1, 2, 3, 4], "groups": ["841/11"]}
+    weekdays и groups необязательны.
+    """
+    with open(path, encoding="utf-8") as f:
+        return Schedule(_parse_slot(raw) for raw in json.load(f))
+
+
+_schedule = Schedule(DEFAULT_SLOTS)
+
+
+def set_schedule(schedule: Schedule) -> None:
+    global _schedule
+    _schedule = schedule
+
+
+def schedule() -> Schedule:
+    return _schedule
+
 def now_msk() -> datetime:
     return datetime.now(tz=TZ)
 
 def date_str_msk(dt: datetime) -> str:
     return dt.date().isoformat()  # YYYY-MM-DD
 
-def current_slot(dt: datetime) -> str | None:
-    t = dt.timetz().replace(tzinfo=None)
-    if MORNING.start <= t <= MORNING.close:
-        return SLOT_MORNING
-    if EVENING.start <= t <= EVENING.close:
-        return SLOT_EVENING
-    return None
+def current_slot(dt: datetime, group_code: str | None = None) -> str | None:
+    """Открытое сейчас окно; с group_code — только если оно касается этой группы."""
+    return _schedule.current_slot(dt, group_code)
 
 def slot_config(slot: str) -> SlotConfig:
-    if slot == SLOT_MORNING:
-        return MORNING
-    if slot == SLOT_EVENING:
-        return EVENING
-    raise ValueError(f"Unknown slot: {slot}")
+    cfg = _schedule.get(slot)
+    if cfg is None:
+        raise ValueError(f"Unknown slot: {slot}")
+    return cfg
+
+def slot_label(slot: str) -> str:
+    # Окно могло пропасть из расписания, а отметки по нему остаться
+    cfg = _schedule.get(slot)
+    return cfg.label if cfg is not None and cfg.label else slot
+
+def slot_applies(slot: str, group_code: str | None, date_str: str | None = None) -> bool:
+    cfg = _schedule.get(slot)
+    if cfg is None or not cfg.applies_to(group_code):
+        return False
+    return date_str is None or cfg.runs_on(date.fromisoformat(date_str).weekday())
+
+def last_closed_slot_and_date(dt, group_code: str | None = None) -> tuple[str, str]:
+    """
+    Возвращает (date_str, slot) для последнего ЗАКРЫТОГО окна доклада
+    (с group_code — из окон этой группы). Окно закрыто, когда время
+    позже его close; если сегодня закрытых окон ещё нет, берётся
+    последнее окно ближайшего предыдущего дня, в который окна были.
+    """
+    return _schedule.last_closed(dt, group_code)